@@ -0,0 +1,85 @@
+import time
+import queue
+import threading
+import torch
+from crop_preprocessing import CropPreprocessor
+
+
+class _Request:
+    def __init__(self, model, batch):
+        self.model = model
+        self.batch = batch
+        self.probas = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class BatchScheduler:
+    """
+    Gather the crop batches of several pipelines (threads) and run them through the model as one bigger batch.
+    An inference thread takes the first waiting request, then the requests arriving during 'max_wait' seconds, up to
+    'max_batch_size' crops (a request bigger than that is computed alone). The requests using the same model are concatenated in one batch, and each caller gets back
+    the probas of its own crops.
+
+    probas = scheduler.compute_probas(model, batch)  # batch : (N, 3, H, W) tensor from a CropPreprocessor
+    """
+    def __init__(self, max_batch_size=64, max_wait=0.002, metrics=None):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.metrics = metrics  # LatencyRecorder object or None
+        self.nb_batches = self.nb_crops = 0
+        self._requests = queue.Queue()
+        self._held = None  # Request which did not fit in the previous batch, first one of the next batch
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def compute_probas(self, model, batch):
+        """ Return the list of success probas of the batch (blocks until the batched inference is done) """
+        request = _Request(model, batch)
+        self._requests.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.probas
+
+    def stats(self):
+        return f'{self.nb_batches} batches, mean batch size = {self.nb_crops / max(self.nb_batches, 1):.1f} crops'
+
+    def _run(self):
+        while True:
+            requests = [self._held or self._requests.get()]
+            self._held = None
+            nb_crops = len(requests[0].batch)
+            deadline = time.perf_counter() + self.max_wait
+            while nb_crops < self.max_batch_size:
+                try:
+                    request = self._requests.get(timeout=max(deadline - time.perf_counter(), 0))
+                except queue.Empty:
+                    break
+                if nb_crops + len(request.batch) > self.max_batch_size:
+                    self._held = request  # Next batch
+                    break
+                requests.append(request)
+                nb_crops += len(request.batch)
+            models = {}
+            for request in requests:  # Requests sent with the same model are computed together
+                models.setdefault(id(request.model), []).append(request)
+            for group in models.values():
+                self._compute(group)
+
+    def _compute(self, requests):
+        try:
+            start = time.perf_counter()
+            probas = CropPreprocessor.probas_of_success(CropPreprocessor.predict(requests[0].model, torch.cat([r.batch for r in requests])))
+            if self.metrics:
+                self.metrics.record('batched_inference', time.perf_counter() - start)
+            self.nb_batches += 1
+            self.nb_crops += len(probas)
+            index = 0
+            for request in requests:
+                request.probas = probas[index:index + len(request.batch)]
+                index += len(request.batch)
+        except Exception as e:
+            for request in requests:
+                request.error = e
+        for request in requests:
+            request.done.set()
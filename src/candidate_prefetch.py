@@ -0,0 +1,75 @@
+import queue
+import threading
+import rospy
+from raiv_libraries.get_coord_node import InBoxCoord
+from raiv_libraries.image_tools import ImageTools
+
+
+class CandidatePrefetcher:
+    """
+    Draw the random candidate points of the current frame in background : 'nb_threads' threads call the
+    In_box_coordService (each one with its own connection, from 'coord_service_factory') and fill a bounded queue, so the
+    draws of the next batch overlap the inference of the current one instead of being done one by one before it.
+
+    prefetcher.set_frame(frame_id)  # For each new frame
+    resps = prefetcher.get(frame_id, nb_points)  # In_box_coordService responses drawn for this frame
+    """
+    def __init__(self, coord_service_factory, nb_threads=2, max_size=256, max_retry_delay=2.0):
+        self.coord_service_factory = coord_service_factory
+        self.queue = queue.Queue(max_size)
+        self.max_retry_delay = max_retry_delay  # After an error, wait 0.1 s before the next call, doubled up to this delay
+        self.frame_id = None  # No draw before the first frame
+        self.new_frame = threading.Condition()
+        self._stop = False
+        self.threads = [threading.Thread(target=self._run, daemon=True) for _ in range(nb_threads)]
+        for thread in self.threads:
+            thread.start()
+
+    def set_frame(self, frame_id):
+        """ Draw the next points for this frame, the points already drawn for the previous one are dropped by get() """
+        with self.new_frame:
+            self.frame_id = frame_id
+            self.new_frame.notify_all()
+
+    def get(self, frame_id, nb_points):
+        """ Return up to nb_points responses drawn for this frame (less if the frame is replaced while waiting) """
+        resps = []
+        while len(resps) < nb_points and self.frame_id == frame_id and not self._stop:
+            try:
+                resp_frame_id, resp = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if resp_frame_id == frame_id:
+                resps.append(resp)
+        return resps
+
+    def close(self):
+        with self.new_frame:
+            self._stop = True
+            self.new_frame.notify_all()
+
+    def _run(self):
+        coord_service = self.coord_service_factory()
+        retry_delay = 0.1
+        while True:
+            with self.new_frame:
+                self.new_frame.wait_for(lambda: self.frame_id is not None or self._stop)
+                frame_id = self.frame_id
+            if self._stop:
+                return
+            try:
+                resp = coord_service('random_no_refresh', InBoxCoord.PICK, InBoxCoord.ON_OBJECT, ImageTools.CROP_WIDTH, ImageTools.CROP_HEIGHT, None, None)
+            except Exception as e:
+                rospy.logwarn_throttle(10, f'CandidatePrefetcher : In_box_coordService error : {e}, retry in {retry_delay:.1f} s')
+                with self.new_frame:  # Woken up by close()
+                    self.new_frame.wait_for(lambda: self._stop, timeout=retry_delay)
+                retry_delay = min(retry_delay * 2, self.max_retry_delay)
+                continue
+            retry_delay = 0.1
+            while not self._stop:  # Blocks when the queue is full (frame settled or inference slower than the draws)
+                try:
+                    self.queue.put((frame_id, resp), timeout=0.1)
+                    break
+                except queue.Full:
+                    if self.frame_id != frame_id:  # Drop it, get() would
+                        break
@@ -1,11 +1,10 @@
 from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
-from PIL import Image
-from cv_bridge import CvBridge
 from PyQt5.QtWidgets import QMessageBox
 from PyQt5.QtCore import *
 
 from raiv_libraries.image_tools import ImageTools
+from qimage_tools import ros_msg_to_qimage
 
 
 class canvas_create_fake_dataset(QWidget):
@@ -17,10 +16,7 @@ class canvas_create_fake_dataset(QWidget):
 
     def set_image(self, img):
         """ called by parent widget to specify a new image to display """
-        bridge = CvBridge()
-        img = bridge.imgmsg_to_cv2(img, desired_encoding= 'passthrough')
-        img = Image.fromarray(img)
-        self.image = QImage(img.tobytes("raw", "RGB"), img.width, img.height, QImage.Format_RGB888)  # Convert PILImage to QImage
+        self.image = ros_msg_to_qimage(img)
         self.setMinimumSize(self.image.width(), self.image.height())
         self.update()
 
@@ -1,7 +1,8 @@
 from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
-from raiv_libraries.get_coord_node import InBoxCoord
 from raiv_libraries.image_tools import ImageTools
+from ros_image import ros_msg_to_numpy
+from qimage_tools import ros_msg_to_qimage
 
 
 class canvas_create_image_dataset(QWidget):
@@ -10,10 +11,14 @@ class canvas_create_image_dataset(QWidget):
         super().__init__(parent)
         self.parent = parent
         self.setMouseTracking(True)
+        self.frame = None  # Current image as a (H, W, 3) numpy array (view of the message data), used for the preview crops
+        self.bgr = False  # True if the channels of self.frame are in BGR order
 
     def set_image(self, msg_img):
         """ called by parent widget to specify a new image to display """
-        self.image = ImageTools.ros_msg_to_QImage(msg_img)
+        self.image = ros_msg_to_qimage(msg_img)
+        self.frame = ros_msg_to_numpy(msg_img)
+        self.bgr = msg_img.encoding == 'bgr8'
         self.setMinimumSize(self.image.width(), self.image.height())
         self.update()
 
@@ -25,8 +30,16 @@ class canvas_create_image_dataset(QWidget):
 
 
     def mouseMoveEvent(self, event):
-        response_from_coord_service = self.parent.coord_service('fixed', InBoxCoord.PICK, InBoxCoord.IN_THE_BOX, ImageTools.CROP_WIDTH, ImageTools.CROP_HEIGHT, event.x(), event.y())
-        self.parent.canvas_preview.update_image(response_from_coord_service.rgb_crop)
+        """ Preview of the crop under the cursor, sliced from the local frame (the coord service is only called on click) """
+        if self.frame is not None:
+            self.parent.canvas_preview.update_image_from_array(self._crop(event.x(), event.y()), self.bgr)
+
+    def _crop(self, x, y):
+        """ Return the (CROP_HEIGHT, CROP_WIDTH, 3) crop centered on (x,y), moved inside the frame near the borders """
+        height, width = self.frame.shape[:2]
+        left = min(max(x - ImageTools.CROP_WIDTH // 2, 0), max(width - ImageTools.CROP_WIDTH, 0))
+        top = min(max(y - ImageTools.CROP_HEIGHT // 2, 0), max(height - ImageTools.CROP_HEIGHT, 0))
+        return self.frame[top:top + ImageTools.CROP_HEIGHT, left:left + ImageTools.CROP_WIDTH]
 
 
     def paintEvent(self, event):
@@ -1,9 +1,57 @@
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
 from PyQt5.QtGui import *
-import torch
+import threading
+import numpy as np
 from raiv_libraries.image_tools import ImageTools
 from raiv_libraries.cnn import Cnn
+from qimage_tools import numpy_to_qimage
+
+# Colors of the heatmap for a success proba of 0, 0.5 and 1 (red, yellow, green)
+HEATMAP_COLORS = np.array([[215, 48, 39], [255, 255, 191], [26, 152, 80]])
+HEATMAP_LUT = np.stack([np.interp(np.linspace(0, 1, 256), [0, 0.5, 1], HEATMAP_COLORS[:, c]) for c in range(3)], axis=1).astype(np.uint8)
+ALPHA_ABOVE_THRESHOLD = 255
+ALPHA_UNDER_THRESHOLD = 110
+HOVER_DEBOUNCE_MS = 40  # The prediction under the cursor is computed when the mouse has not moved for this time
+
+
+class HoverPredictionWorker(QThread):
+    """
+    Compute in background the prediction of the point under the cursor, so the paintEvent never runs the CNN.
+    Only the last requested point is computed (the points requested during an inference are skipped).
+    The prediction is memoized in the prediction cache of the ExploreWindow, then prediction_ready is emitted with (x, y).
+    """
+    prediction_ready = pyqtSignal(int, int)
+
+    def __init__(self, explore_window):
+        super().__init__()
+        self.explore_window = explore_window
+        self._condition = threading.Condition()
+        self._point = None
+        self._stopped = False
+
+    def request(self, x, y):
+        with self._condition:
+            self._point = (x, y)
+            self._condition.notify()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self.wait()
+
+    def run(self):
+        while True:
+            with self._condition:
+                while self._point is None and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                (x, y), self._point = self._point, None
+            if self.explore_window.model:
+                self.explore_window.predict_from_point(x, y)
+                self.prediction_ready.emit(x, y)
 
 
 class CanvasExplore(QWidget):
@@ -13,30 +61,58 @@ class CanvasExplore(QWidget):
         self.parent = parent
         self.pressed = self.moving = False
         self.previous_image = None
-        self.all_preds = None
+        self.clear_predictions()
         self.select_start = self.select_end = None
-        self.from_selected_point = False # True when 'Compute' button pressed in GUI (we specify the (x,y) coord for the pred
+        self.center = None
         self.image = None
         self.depth_image = None
+        self.hover_point = None  # (x, y) waiting for its prediction
+        self.hover_worker = None
+        self.hover_timer = QTimer(self)  # Debounce : restarted at each mouse move
+        self.hover_timer.setSingleShot(True)
+        self.hover_timer.setInterval(HOVER_DEBOUNCE_MS)
+        self.hover_timer.timeout.connect(self._request_hover_prediction)
 
     def setup_after_creation(self):
         """ These variables can't be initialized in the __init__ constructor (=> BUG) """
         self.rgb_and_depth = self.parent.rgb_and_depth
         self.depth_canvas = self.parent.canvas_depth
+        self.hover_worker = HoverPredictionWorker(self.parent)
+        self.hover_worker.prediction_ready.connect(self._hover_prediction_ready)
+        self.hover_worker.start()
+        QApplication.instance().aboutToQuit.connect(self.hover_worker.stop)
 
     def compute_pred_at_x_y(self):
-        self.from_selected_point = True
+        """ 'Compute' button pressed in GUI : (x,y) coordinates of the prediction are read from GUI """
+        self.center = QPoint(int(self.parent.edt_x.text()), int(self.parent.edt_y.text()))
         self.pressed = True
         self.update()
 
-    def set_image(self,img, depth_img=None):
-        self.image = QImage(img.tobytes("raw", "RGB"), img.width, img.height, QImage.Format_RGB888)  # Convert PILImage to QImage
-        self.depth_image = QImage(depth_img.tobytes("raw", "RGB"), depth_img.width, depth_img.height, QImage.Format_RGB888)  # Convert PILImage to QImage
+    def set_image(self, image_array, depth_array=None):
+        """ Display a (H, W, 3) RGB numpy array (and the depth one for a RGB + DEPTH model). The arrays are not copied """
+        self.image = numpy_to_qimage(image_array)
+        self.depth_image = numpy_to_qimage(depth_array) if depth_array is not None else None
+        if self.depth_image is not None and self.parent.rgb_and_depth:  # Model with RGB and DEPTH images
+            self.parent.canvas_depth.setPixmap(QPixmap.fromImage(self.depth_image))
         self.setMinimumSize(self.image.width(), self.image.height())
         self.previous_image = None
-        self.all_preds = None
+        self.clear_predictions()
         self.update()
 
+    def clear_predictions(self, cell_size=3):
+        """ Remove all the predictions. cell_size : size (in pixels) of the heatmap square drawn for each prediction """
+        self.pred_xy = np.empty((0, 2), dtype=np.int32)  # (x, y) of each prediction
+        self.pred_probas = np.empty(0, dtype=np.float32)  # Success proba of each prediction
+        self.cell_size = cell_size
+        self._overlay = None  # QImage with the heatmap of the predictions
+        self._overlay_key = None  # (nb of predictions, threshold, print values) used to build the overlay
+
+    def add_predictions(self, preds):
+        """ Add a list of [x, y, tensor([[prob_fail, proba_success]])] predictions """
+        if preds:
+            self.pred_xy = np.concatenate([self.pred_xy, np.array([[x, y] for x, y, _ in preds], dtype=np.int32)])
+            self.pred_probas = np.concatenate([self.pred_probas, np.array([pred[0][1].item() for _, _, pred in preds], dtype=np.float32)])
+
     def mousePressEvent(self, event):
         modifiers = QApplication.keyboardModifiers()
         pos = event.pos()
@@ -52,6 +128,7 @@ class CanvasExplore(QWidget):
                 self.pressed = True
                 self.update()
         elif event.button() == Qt.RightButton:
+            self.parent.cancel_map()  # A new selection stops the computation of the previous map
             self.select_start = pos
 
     def mouseMoveEvent(self, event):
@@ -65,9 +142,10 @@ class CanvasExplore(QWidget):
 
     def mouseReleaseEvent(self, event):
         if event.button() == Qt.LeftButton:
-            self.previous_image = self.image.copy()
+            self.previous_image = self.image
+            self.image = self.image.copy()  # Don't draw on the image array shared with the parent
             qp = QPainter(self.image)
-            self._draw_rectangle(qp)
+            self._draw_rectangle(qp, wait_prediction=True)
             self.pressed = self.moving = False
             self.update()
         elif event.button() == Qt.RightButton:
@@ -80,11 +158,9 @@ class CanvasExplore(QWidget):
         qp = QPainter(self)
         rect = event.rect()
         qp.drawImage(rect, self.image, rect)
-        if self.rgb_and_depth:  # Model with RGN adn DEPTH images
-            self.depth_canvas.setPixmap(QPixmap.fromImage(self.depth_image))
         if self.moving or self.pressed:
             self._draw_rectangle(qp)
-        if self.all_preds:
+        if len(self.pred_probas):
             self._draw_pred(qp)
         if self.select_end:
             self._draw_selected_region(qp)
@@ -97,21 +173,29 @@ class CanvasExplore(QWidget):
         h = self.select_end.y() - self.select_start.y()
         qp.drawRect(self.select_start.x(), self.select_start.y(), w, h)
 
-    def _draw_rectangle(self, qp):
+    def _draw_rectangle(self, qp, wait_prediction=False):
+        """ Draw the prediction for the point under the cursor. If this prediction is not yet computed, the rectangle is
+        drawn in gray and the prediction is asked to the hover worker, unless wait_prediction is True """
         if self.parent.model:  # A model exists, we can do inference
-            if self.from_selected_point: # (x,y) = coordinates read from GUI
-                x = int(self.parent.edt_x.text())
-                y = int(self.parent.edt_y.text())
-                self.from_selected_point = False
-            else:  # Used when we move the mouse over the image, (x,y) = cursor position
-                x = self.center.x()
-                y = self.center.y()
-                self.parent.edt_x.setText(str(x))
-                self.parent.edt_y.setText(str(y))
+            x = self.center.x()
+            y = self.center.y()
+            self.parent.edt_x.setText(str(x))
+            self.parent.edt_y.setText(str(y))
             qp.setRenderHint(QPainter.Antialiasing)
             qp.setPen(QPen(Qt.blue, 5))
             qp.drawPoint(x, y)
-            pred = self.parent.predict_from_point(x, y)  # calculate the prediction wih CNN
+            if wait_prediction:
+                pred = self.parent.predict_from_point(x, y)  # calculate the prediction wih CNN
+            else:
+                pred = self.parent.cached_prediction(x, y)
+            left = int(x - ImageTools.CROP_WIDTH/2)
+            top = int(y - ImageTools.CROP_HEIGHT/2)
+            if pred is None:  # Computed in background when the mouse stops moving, then the canvas is updated
+                self.hover_point = (x, y)
+                self.hover_timer.start()
+                qp.setPen(QPen(Qt.gray, 1, Qt.DashLine))
+                qp.drawRect(left, top, ImageTools.CROP_WIDTH, ImageTools.CROP_HEIGHT)
+                return
             prob, cl = Cnn.compute_prob_and_class(pred)
             is_fail = cl.item()==0
             fail_or_success = 'Fail' if is_fail else 'Success'
@@ -125,30 +209,49 @@ class CanvasExplore(QWidget):
                 qp.setPen(QPen(Qt.green, 1, Qt.DashLine))
             else:  # Fail
                 qp.setPen(QPen(Qt.red, 1, Qt.DashLine))
-            left = int(x - ImageTools.CROP_WIDTH/2)
-            top = int(y - ImageTools.CROP_HEIGHT/2)
             qp.drawRect(left, top, ImageTools.CROP_WIDTH, ImageTools.CROP_HEIGHT)
 
-    def _draw_pred(self, qp):
-        """ Display all predictions (green/red point + percentage of success) from self.all_preds list """
-        threshold = self.parent.sb_threshold.value()
-        self.all_preds.sort(key=lambda pred: pred[2][0][1].item(), reverse=True)
-        point_size_in_pixel = 3
-        for idx, (x, y , pred) in enumerate(self.all_preds):
-            tensor_prob,tensor_cl = torch.max(pred, 1)
-            if tensor_cl.item()==0 or (tensor_cl.item()==1 and tensor_prob.item()*100 < threshold):  # Fail
-                qp.setPen(QPen(Qt.red, point_size_in_pixel)) # Prediction under the threshold
-            else:
-                qp.setPen(QPen(Qt.green, point_size_in_pixel))# Prediction above the threshold
-            if idx == 0:
-                qp.setPen(QPen(Qt.blue, point_size_in_pixel))  # The best prediction
-            qp.drawPoint(x, y)
-            qp.setPen(Qt.black)
-            prob, cl = Cnn.compute_prob_and_class(pred)
-            if self.parent.cb_print_values.isChecked():
-                qp.setFont(QFont('Decorative', 8))
-                text = f'{prob:.1f}%'
-                qp.drawText(x, y, text)
+    def _request_hover_prediction(self):
+        if self.hover_point:
+            self.hover_worker.request(*self.hover_point)
 
+    def _hover_prediction_ready(self, x, y):
+        if (self.moving or self.pressed) and self.hover_point == (x, y):
+            self.hover_point = None
+            self.update()
 
+    def _draw_pred(self, qp):
+        """ Display the heatmap of all the predictions (red to green depending on the proba of success, transparent under the threshold) and the best one in blue """
+        threshold = self.parent.sb_threshold.value()
+        print_values = self.parent.cb_print_values.isChecked()
+        key = (len(self.pred_probas), threshold, print_values)
+        if key != self._overlay_key:  # Predictions or threshold have changed since the last overlay
+            self._overlay = self._build_overlay(threshold, print_values)
+            self._overlay_key = key
+        qp.drawImage(0, 0, self._overlay)
+        best = np.argmax(self.pred_probas)
+        qp.setPen(QPen(Qt.blue, 3))  # The best prediction
+        qp.drawPoint(int(self.pred_xy[best, 0]), int(self.pred_xy[best, 1]))
 
+    def _build_overlay(self, threshold, print_values):
+        """ Return a QImage (same size than the image) with a colored square for each prediction """
+        width, height = self.image.width(), self.image.height()
+        rgba = np.zeros((height, width, 4), dtype=np.uint8)
+        colors = np.empty((len(self.pred_probas), 4), dtype=np.uint8)
+        colors[:, :3] = HEATMAP_LUT[(self.pred_probas * 255).astype(np.int32)]
+        success = (self.pred_probas > 0.5) & (self.pred_probas * 100 >= threshold)
+        colors[:, 3] = np.where(success, ALPHA_ABOVE_THRESHOLD, ALPHA_UNDER_THRESHOLD)
+        # Fill a cell_size x cell_size square centered on each prediction (all the predictions at once)
+        offsets = np.arange(self.cell_size) - self.cell_size // 2
+        xs = np.clip(self.pred_xy[:, 0:1] + offsets, 0, width - 1)  # (N, cell_size)
+        ys = np.clip(self.pred_xy[:, 1:2] + offsets, 0, height - 1)
+        rgba[ys[:, :, None], xs[:, None, :]] = colors[:, None, None, :]
+        overlay = QImage(rgba.data, width, height, width * 4, QImage.Format_RGBA8888).copy()  # copy() : rgba is a local array
+        if print_values:
+            qp = QPainter(overlay)
+            qp.setPen(Qt.black)
+            qp.setFont(QFont('Decorative', 8))
+            for (x, y), proba in zip(self.pred_xy, self.pred_probas):
+                qp.drawText(int(x), int(y), f'{proba*100:.1f}%')
+            qp.end()
+        return overlay
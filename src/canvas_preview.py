@@ -2,6 +2,7 @@ from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
 from PyQt5.QtCore import *
 from raiv_libraries.image_tools import ImageTools
+from qimage_tools import numpy_to_qimage, ros_msg_to_qimage
 
 
 class canvas_preview(QWidget):
@@ -12,7 +13,12 @@ class canvas_preview(QWidget):
         self.qt_img = None
 
     def update_image(self, img_msg):
-        self.qt_img = ImageTools.ros_msg_to_QImage(img_msg)
+        self.qt_img = ros_msg_to_qimage(img_msg)
+        self.update()
+
+    def update_image_from_array(self, crop, bgr=False):
+        """ Display a (h, w, 3) uint8 numpy array (RGB, or BGR if bgr is True) """
+        self.qt_img = numpy_to_qimage(crop, bgr)
         self.update()
 
     def paintEvent(self, event):
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+"""
+Check that the batched preprocessing (CropPreprocessor, used by node_best_prediction.py, explore.py and
+predict_on_rgb_files.py) gives the same predictions than the PIL path (ImageTools.crop_xy + RgbCnn.predict_from_pil_rgb_image)
+on random points of a real image. Print the max difference of the input tensors and of the success probas.
+
+python check_preprocessing.py <CKPT_FILE> <RGB_IMAGE> --nb_points 64
+"""
+import random
+import numpy as np
+import PIL.Image
+import torch
+from raiv_libraries.image_tools import ImageTools
+from raiv_libraries.rgb_cnn import RgbCnn
+from raiv_libraries.cnn import Cnn
+from crop_preprocessing import CropPreprocessor
+from inference_backend import load_inference_model
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compare the batched crop preprocessing with the PIL one (input tensors and success probas).')
+    parser.add_argument('ckpt_model_file', type=str, help='CKPT model file')
+    parser.add_argument('image_file', type=str, help='RGB image (a frame of the camera)')
+    parser.add_argument('--nb_points', type=int, default=64, help='Number of random points compared')
+    parser.add_argument('--tolerance', type=float, default=1e-3, help='Max difference allowed between the probas of both paths')
+    args = parser.parse_args()
+
+    model = load_inference_model(args.ckpt_model_file)
+    image_pil = PIL.Image.open(args.image_file).convert('RGB')
+    frame = np.asarray(image_pil)
+    preprocessor = CropPreprocessor()
+    margin_x, margin_y = ImageTools.CROP_WIDTH // 2, ImageTools.CROP_HEIGHT // 2  # Points far from the borders
+    points = [(random.randint(margin_x, frame.shape[1] - margin_x - 1), random.randint(margin_y, frame.shape[0] - margin_y - 1))
+              for _ in range(args.nb_points)]
+    # Batched path
+    batch = preprocessor(frame, points)
+    batched_probas = CropPreprocessor.probas_of_success(CropPreprocessor.predict(model, batch))
+    # PIL path
+    crops_pil = [ImageTools.crop_xy(image_pil, x, y, ImageTools.CROP_WIDTH, ImageTools.CROP_HEIGHT) for x, y in points]
+    pil_batch = torch.stack([ImageTools.transform_image(crop) for crop in crops_pil])
+    pil_probas = [Cnn.compute_prob_and_class(RgbCnn.predict_from_pil_rgb_image(model, crop))[0] for crop in crops_pil]
+
+    tensor_diff = (batch - pil_batch).abs().max().item()
+    proba_diff = np.abs(np.array(batched_probas) - np.array(pil_probas)).max()
+    print(f'Max difference between the input tensors : {tensor_diff:.2e}')
+    print(f'Max difference between the success probas : {proba_diff:.2e}')
+    if proba_diff > args.tolerance:
+        print(f'WARNING : difference greater than the tolerance ({args.tolerance}), the batched preprocessing does not match the PIL one')
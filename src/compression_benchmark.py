@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+"""
+Compare the raw /new_images messages with the compressed ones (see image_compression.py) on the frames recorded by
+record_frames.py : bytes per frame, compression and decoding times, and the latency per frame for a given network
+bandwidth (serialization or compression + transfer + decoding). No ROS master is needed.
+
+python compression_benchmark.py <RECORD_FOLDER> --bandwidth 100 --jpeg_quality 90
+"""
+import io
+import time
+import numpy as np
+from sensor_msgs.msg import Image
+from raiv_research.msg import RgbAndDepthImages
+from image_compression import ImageCompressor, RGB_FORMATS, DEPTH_FORMATS, decode_rgb, decode_depth
+from record_frames import load_frame, list_frames
+
+
+def numpy_to_ros_image(array):
+    """ Build an Image message from a recorded (H, W, 3) RGB or (H, W) depth array """
+    if array.ndim == 3:
+        encoding = 'rgb8'
+    else:
+        encoding = '16UC1' if array.dtype == np.uint16 else 'mono8'
+    return Image(height=array.shape[0], width=array.shape[1], encoding=encoding, step=array.strides[0], data=array.tobytes())
+
+
+def measure(function, *args):
+    """ Return (result, duration in s) """
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def serialized_size(msg):
+    buffer = io.BytesIO()
+    msg.serialize(buffer)
+    return buffer.tell()
+
+
+def benchmark(frames, compressors, bandwidth):
+    """ Return one dict of mean values per compressor (None : raw messages) """
+    rows = []
+    for name, compressor in compressors:
+        sizes, encode_times, rgb_decode_times, depth_decode_times = [], [], [], []
+        for rgb_msg, depth_msg in frames:
+            if compressor is None:
+                msg = RgbAndDepthImages(rgb_image=rgb_msg, depth_image=depth_msg)
+                size, encode_time = measure(serialized_size, msg)
+                rgb_decode_time = depth_decode_time = 0.0
+            else:
+                msg, encode_time = measure(compressor.compress, rgb_msg, depth_msg)
+                size = serialized_size(msg)
+                rgb_decode_time = measure(decode_rgb, msg)[1]
+                depth_decode_time = measure(decode_depth, msg)[1]
+            sizes.append(size)
+            encode_times.append(encode_time)
+            rgb_decode_times.append(rgb_decode_time)
+            depth_decode_times.append(depth_decode_time)
+        size = np.mean(sizes)
+        transfer_time = size * 8 / (bandwidth * 1e6)
+        rows.append({'name': name, 'kB': size / 1024, 'encode': np.mean(encode_times), 'transfer': transfer_time,
+                     'decode_rgb': np.mean(rgb_decode_times), 'decode_depth': np.mean(depth_decode_times),
+                     'latency': np.mean(encode_times) + transfer_time + np.mean(rgb_decode_times) + np.mean(depth_decode_times)})
+    return rows
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Bytes and latency per frame of the raw and compressed /new_images messages.')
+    parser.add_argument('record_folder', type=str, help='folder with the frames recorded by record_frames.py')
+    parser.add_argument('--bandwidth', type=float, default=100, help='Network bandwidth (in Mbit/s) used to compute the transfer time')
+    parser.add_argument('--jpeg_quality', type=int, default=90, help='Quality of the JPEG RGB image [0,100]')
+    parser.add_argument('--max_frames', type=int, default=20, help='Max number of recorded frames used')
+    args = parser.parse_args()
+
+    frames = []
+    for file in list_frames(args.record_folder)[:args.max_frames]:
+        recorded_frame = load_frame(file)
+        frames.append((numpy_to_ros_image(recorded_frame['rgb']), numpy_to_ros_image(recorded_frame['depth'])))
+    compressors = [('raw', None)]
+    for rgb_format in RGB_FORMATS:
+        for depth_format in DEPTH_FORMATS:
+            try:
+                compressors.append((f'{rgb_format} + {depth_format}', ImageCompressor(rgb_format, depth_format, args.jpeg_quality)))
+            except ImportError as e:
+                print(f'{rgb_format} + {depth_format} skipped : {e}')
+    rows = benchmark(frames, compressors, args.bandwidth)
+    raw_size = rows[0]['kB']
+    print(f'{len(frames)} frames, bandwidth = {args.bandwidth:.0f} Mbit/s, times in ms per frame\n')
+    print(f'{"":<14}{"kB":>9}{"ratio":>8}{"encode":>9}{"transfer":>10}{"dec. rgb":>10}{"dec. depth":>12}{"latency":>9}')
+    for row in rows:
+        print(f'{row["name"]:<14}{row["kB"]:9.0f}{raw_size / row["kB"]:8.1f}{row["encode"]*1000:9.2f}{row["transfer"]*1000:10.2f}'
+              f'{row["decode_rgb"]*1000:10.2f}{row["decode_depth"]*1000:12.2f}{row["latency"]*1000:9.2f}')
@@ -0,0 +1,78 @@
+import functools
+import numpy as np
+import PIL.Image
+import torch
+import torch.nn.functional as F
+from raiv_libraries.image_tools import ImageTools
+
+
+@functools.lru_cache(maxsize=None)
+def transform_parameters(crop_width=ImageTools.CROP_WIDTH, crop_height=ImageTools.CROP_HEIGHT):
+    """
+    Return (image_size, mean, std) of ImageTools.transform_image, the preprocessing of the PIL path
+    (RgbCnn.predict_from_pil_rgb_image), measured on a black and a white image :
+    output = (pixel / 255 - mean) / std, so black = -mean / std and white = (1 - mean) / std
+    """
+    black = ImageTools.transform_image(PIL.Image.new('RGB', (crop_width, crop_height), (0, 0, 0)))
+    white = ImageTools.transform_image(PIL.Image.new('RGB', (crop_width, crop_height), (255, 255, 255)))
+    std = 1 / (white - black).mean(dim=(1, 2))
+    mean = -black.mean(dim=(1, 2)) * std
+    return black.shape[-1], tuple(mean.tolist()), tuple(std.tolist())
+
+
+class CropPreprocessor:
+    """
+    Batched preprocessing of crops, without any PIL object.
+
+    From a uint8 frame (H, W, 3) and a list of (x, y) centers, extract all the crops with one numpy indexing operation,
+    then resize and normalize them as a single (N, 3, image_size, image_size) float tensor, ready for the CNN.
+    The output size and the normalization are the ones of ImageTools.transform_image (see transform_parameters()),
+    check_preprocessing.py compares the predictions of both paths on a real image.
+    """
+    def __init__(self, crop_width=ImageTools.CROP_WIDTH, crop_height=ImageTools.CROP_HEIGHT, image_size=None, mean=None, std=None):
+        self.crop_width = crop_width
+        self.crop_height = crop_height
+        transform_size, transform_mean, transform_std = transform_parameters(crop_width, crop_height)
+        self.image_size = image_size or transform_size  # Size of the square image given to the CNN
+        self.mean = torch.tensor(mean or transform_mean).view(1, 3, 1, 1)
+        self.std = torch.tensor(std or transform_std).view(1, 3, 1, 1)
+        # Offsets of the crop pixels relative to the crop center
+        self._dx = np.arange(crop_width) - crop_width // 2
+        self._dy = np.arange(crop_height) - crop_height // 2
+
+    def __call__(self, frame, centers):
+        """ Return the (N, 3, image_size, image_size) normalized tensor for the crops centered on 'centers' """
+        return self.crops_to_tensor(self.extract_crops(frame, centers))
+
+    def extract_crops(self, frame, centers):
+        """ Return a (N, crop_height, crop_width, 3) uint8 array. Pixels outside the frame are replaced by the nearest border pixel """
+        centers = np.asarray(centers, dtype=np.int64).reshape(-1, 2)
+        xs = np.clip(centers[:, 0:1] + self._dx, 0, frame.shape[1] - 1)  # (N, crop_width)
+        ys = np.clip(centers[:, 1:2] + self._dy, 0, frame.shape[0] - 1)  # (N, crop_height)
+        return frame[ys[:, :, None], xs[:, None, :]]
+
+    def crops_to_tensor(self, crops):
+        """ Resize and normalize a (N, h, w, 3) uint8 array (or a list of (h, w, 3) arrays with any size) """
+        if isinstance(crops, np.ndarray):
+            batch = self._to_float(crops)
+            batch = F.interpolate(batch, size=(self.image_size, self.image_size), mode='bilinear', align_corners=False)
+        else:  # List of images which can have different sizes
+            batch = torch.cat([F.interpolate(self._to_float(crop[None]), size=(self.image_size, self.image_size),
+                                             mode='bilinear', align_corners=False) for crop in crops])
+        return (batch - self.mean) / self.std
+
+    @staticmethod
+    def predict(model, batch):
+        """ Return a (N, 2) tensor with [proba_fail, proba_success] for each image of the batch """
+        with torch.no_grad():
+            return F.softmax(model(batch), dim=1)
+
+    @staticmethod
+    def probas_of_success(preds):
+        """ Return the list of success probas from the (N, 2) tensor returned by predict() """
+        return preds[:, 1].tolist()
+
+    @staticmethod
+    def _to_float(crops):
+        """ (N, h, w, 3) uint8 array => (N, 3, h, w) float tensor in [0,1] """
+        return torch.from_numpy(np.ascontiguousarray(crops)).permute(0, 3, 1, 2).float().div_(255)
@@ -0,0 +1,57 @@
+import os
+import csv
+import time
+from contextlib import contextmanager
+
+# All the phases of a pick cycle, in the order of the columns of the log file
+PHASES = ['coord_service', 'move_to_centroid', 'best_prediction_wait', 'pick', 'retreat', 'new_image', 'grip_check',
+          'place', 'wait_predictions', 'release', 'user_check', 'dataset_write']
+
+
+class CycleTimeRecorder:
+    """
+    Record the duration of each phase of a robot pick cycle and append one line per cycle to a CSV log file :
+    start time, script name, gripped (1/0), total duration, then the duration (in s) of each phase of PHASES
+    (empty if the phase did not occur in this cycle). Use cycle_time_report.py to analyse the log.
+
+    recorder.start_cycle()
+    with recorder.phase('pick'):
+        robot.pick(pose)
+    recorder.end_cycle(object_gripped)
+
+    With log_file=None, nothing is measured nor written (the calls can stay in the script).
+    """
+    def __init__(self, log_file, script_name):
+        self.log_file = log_file
+        self.script_name = script_name
+        self.cycle_start = None
+        self.durations = {}
+        if log_file is not None and (not os.path.exists(log_file) or os.path.getsize(log_file) == 0):
+            with open(log_file, 'w', newline='') as f:
+                csv.writer(f).writerow(['start', 'script', 'gripped', 'total'] + PHASES)
+
+    def start_cycle(self):
+        self.cycle_start = time.time()
+        self.durations = {}
+
+    @contextmanager
+    def phase(self, name):
+        if self.log_file is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] = self.durations.get(name, 0.0) + time.perf_counter() - start
+
+    def end_cycle(self, gripped):
+        """ Append the current cycle to the log file and start a new one """
+        if self.log_file is None:
+            return
+        total = time.time() - self.cycle_start
+        row = [f'{self.cycle_start:.3f}', self.script_name, int(bool(gripped)), f'{total:.3f}']
+        row += [f'{self.durations[name]:.3f}' if name in self.durations else '' for name in PHASES]
+        with open(self.log_file, 'a', newline='') as f:
+            csv.writer(f).writerow(row)
+        self.start_cycle()
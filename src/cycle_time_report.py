@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+"""
+Analyse the pick cycle log files written by node_move_robot_to_prediction.py and random_picks_birdview.py
+(see cycle_time_recorder.py) : time spent in each phase, bottleneck distribution and picks per hour.
+
+python cycle_time_report.py pick_cycles.csv [other_log.csv ...] [--session_gap 600]
+"""
+import pandas as pd
+from cycle_time_recorder import PHASES
+
+
+def load_cycles(log_files):
+    cycles = pd.concat([pd.read_csv(log_file) for log_file in log_files], ignore_index=True)
+    cycles['start'] = pd.to_datetime(cycles['start'], unit='s')
+    return cycles.sort_values('start').reset_index(drop=True)
+
+
+def phase_report(cycles):
+    """ Mean, median and p95 duration of each phase, its share of the total cycle time and how often it is the longest phase """
+    phases = [phase for phase in PHASES if cycles[phase].notna().any()]
+    durations = cycles[phases]
+    report = pd.DataFrame({
+        'mean (s)': durations.mean(),
+        'median (s)': durations.median(),
+        'p95 (s)': durations.quantile(0.95),
+        'share of cycle (%)': 100 * durations.sum() / cycles['total'].sum(),
+        'bottleneck (%)': 100 * durations.idxmax(axis=1).value_counts(normalize=True),
+    }).fillna(0)
+    return report.sort_values('share of cycle (%)', ascending=False)
+
+
+def session_report(cycles, session_gap):
+    """ Split the cycles in sessions (a new session starts after 'session_gap' seconds without cycle) and compute picks per hour """
+    new_session = cycles['start'].diff().dt.total_seconds().fillna(session_gap + 1) > session_gap
+    cycles = cycles.assign(session=new_session.cumsum())
+    sessions = []
+    for session, session_cycles in cycles.groupby('session'):
+        start = session_cycles['start'].iloc[0]
+        duration = (session_cycles['start'].iloc[-1] - start).total_seconds() + session_cycles['total'].iloc[-1]
+        sessions.append({'start': start, 'duration (min)': duration / 60, 'cycles': len(session_cycles),
+                         'gripped': int(session_cycles['gripped'].sum()),
+                         'picks per hour': 3600 * len(session_cycles) / duration,
+                         'gripped per hour': 3600 * session_cycles['gripped'].sum() / duration,
+                         'mean cycle (s)': session_cycles['total'].mean()})
+    return pd.DataFrame(sessions)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Report on the pick cycle time logs : phase durations, bottlenecks and picks per hour.')
+    parser.add_argument('log_files', type=str, nargs='+', help='CSV log files written by CycleTimeRecorder')
+    parser.add_argument('--session_gap', type=float, default=600, help='A new session starts after this number of seconds without cycle')
+    args = parser.parse_args()
+
+    cycles = load_cycles(args.log_files)
+    pd.set_option('display.width', 200)
+    print(f'{len(cycles)} cycles, {cycles["gripped"].mean()*100:.1f}% gripped, mean cycle = {cycles["total"].mean():.2f} s\n')
+    print(phase_report(cycles).round(2).to_string())
+    print()
+    print(session_report(cycles, args.session_gap).round(2).to_string(index=False))
@@ -1,31 +1,69 @@
+from node_startup import StartupProfile, lazy_import
 import sys
 from PyQt5.QtWidgets import *
 from PyQt5 import uic
+from PyQt5.QtCore import QThread, pyqtSignal
 import time
-import matplotlib
+import numpy as np
 import rospy
-from raiv_libraries.robotUR import RobotUR
-from raiv_libraries.robot_with_vaccum_gripper import Robot_with_vaccum_gripper
-from raiv_camera_calibration.perspective_calibration import PerspectiveCalibration
 import geometry_msgs.msg as geometry_msgs
-from raiv_libraries.image_tools import ImageTools
 import PIL.Image
 from pathlib import Path
-from raiv_libraries.rgb_and_depth_cnn import RgbAndDepthCnn
 from sensor_msgs.msg import Image
 from PyQt5.QtWidgets import QMessageBox
-from raiv_libraries.rgb_cnn import RgbCnn
-from raiv_libraries.cnn import Cnn
+from prediction_cache import PredictionCache
+from prediction_map_cache import PredictionMapCache, DEFAULT_CACHE_FOLDER
+from sampling_profiler import advertise_profile_service
 import os
+# Heavy imports (torch, robot, CNNs), done at their first use
+torch = lazy_import('torch')
+RobotUR = lazy_import('raiv_libraries.robotUR', 'RobotUR')
+Robot_with_vaccum_gripper = lazy_import('raiv_libraries.robot_with_vaccum_gripper', 'Robot_with_vaccum_gripper')
+PerspectiveCalibration = lazy_import('raiv_camera_calibration.perspective_calibration', 'PerspectiveCalibration')
+ImageTools = lazy_import('raiv_libraries.image_tools', 'ImageTools')
+RgbAndDepthCnn = lazy_import('raiv_libraries.rgb_and_depth_cnn', 'RgbAndDepthCnn')
+RgbCnn = lazy_import('raiv_libraries.rgb_cnn', 'RgbCnn')
+Cnn = lazy_import('raiv_libraries.cnn', 'Cnn')
+CropPreprocessor = lazy_import('crop_preprocessing', 'CropPreprocessor')
 
 # global variables
 Z_PICK_ROBOT = 0.15  # Z coord before going down to pick
 X_OUT = 0.0  # XYZ coord where the robot is out of camera scope
 Y_OUT = -0.3
 Z_OUT = 0.12
+MAP_BATCH_SIZE = 32  # Number of points scored by each inference when computing a prediction map
 
-### Used for DEBUG purpose
-matplotlib.use('Qt5Agg')
+
+class MapWorker(QThread):
+    """
+    Compute the predictions for a list of points in background, batch by batch, so the GUI stays responsive.
+    Each batch of [x, y, pred] is sent with the batch_ready signal, the progress with the progress signal
+    (number of points done, total number of points, inferences per second).
+    """
+    batch_ready = pyqtSignal(list)
+    progress = pyqtSignal(int, int, float)
+
+    def __init__(self, explore_window, points, batch_size=MAP_BATCH_SIZE):
+        super().__init__()
+        self.explore_window = explore_window
+        self.points = points
+        self.batch_size = batch_size
+        self._cancelled = False
+
+    def cancel(self):
+        """ Stop after the current batch """
+        self._cancelled = True
+
+    def run(self):
+        start = time.time()
+        for i in range(0, len(self.points), self.batch_size):
+            if self._cancelled:
+                return
+            points = self.points[i:i + self.batch_size]
+            preds = self.explore_window.predict_from_points(points)
+            self.batch_ready.emit([[x, y, pred] for (x, y), pred in zip(points, preds)])
+            nb_done = i + len(points)
+            self.progress.emit(nb_done, len(self.points), nb_done / max(time.time() - start, 1e-6))
 
 
 class ExploreWindow(QWidget):
@@ -33,7 +71,7 @@ class ExploreWindow(QWidget):
     Load an image and a CNN model from a CKPT file and display the prediction for some sub-images at some specific points
     """
 
-    def __init__(self, calibration_folder, rgb_and_depth):
+    def __init__(self, calibration_folder, rgb_and_depth, map_cache_folder=DEFAULT_CACHE_FOLDER):
         super().__init__()
         self.rgb_and_depth = rgb_and_depth  # True : RGB + DEPTH model, False : only RGB model
         uic.loadUi("explore_ihm.ui", self)  # needs the canvas_explore.py file in the current directory
@@ -48,6 +86,7 @@ class ExploreWindow(QWidget):
         self.btn_activate_robot.clicked.connect(self._activate_robot)
         self.sb_threshold.valueChanged.connect(self._change_threshold)
         self.btn_compute.clicked.connect(self._compute_pred_at_x_y)
+        self.cb_print_values.stateChanged.connect(self._change_threshold)
         # attributs
         self.dPoint = PerspectiveCalibration(calibration_folder)
         self.default_images_folder = '.'
@@ -56,6 +95,17 @@ class ExploreWindow(QWidget):
         self.depth_topic = '/depth_256_image'
         self.model = None
         self.robot = None
+        self.image_id = 0  # Incremented each time a new image is displayed, used in the prediction cache key
+        self.prediction_cache = PredictionCache(max_size=50000, quantum=1)
+        self.preprocessor = CropPreprocessor()  # To compute the predictions of a map by batches
+        self.image_array = None  # RGB image as a (H, W, 3) uint8 numpy array, used by the preprocessor and displayed by the canvas
+        self.depth_array = None  # Depth image as a (H, W, 3) uint8 numpy array, displayed by the canvas
+        self.map_worker = None  # MapWorker object computing the current prediction map
+        self.map_cache = PredictionMapCache(map_cache_folder)  # Prediction maps saved on disk
+        self.image_hash = self.model_hash = None  # Content hashes used in the map cache key
+        self.map_key = None  # (image hash, model hash, stride) of self.map_predictions
+        self.map_predictions = {}  # {(x, y): pred} of the map of the current image, model and stride
+        self.map_modified = False  # True if map_predictions has new predictions not yet saved in the map cache
         self._set_image()
         self._load_model()
         self.canvas.setup_after_creation()
@@ -71,7 +121,10 @@ class ExploreWindow(QWidget):
                 depth_pil = PIL.Image.open(filename_without_ext+'_depth.png')
             else:
                 depth_pil = None
-            self.canvas.set_image(img_pil, depth_pil)
+            self.depth_image = depth_pil
+            self._new_image_loaded()
+            self.canvas.set_image(self.image_array, self.depth_array)
+            self._show_cached_map()
 
     def _save_image(self):
         filename = QFileDialog.getSaveFileName(self, 'Save image to file', '.', "Image files (*.png)",
@@ -84,15 +137,40 @@ class ExploreWindow(QWidget):
         self.canvas.compute_pred_at_x_y()
 
     def predict_from_point(self, x, y):
-        """ Predict probability and class for a cropped image at (x,y) """
+        """ Predict probability and class for a cropped image at (x,y). Also called by the hover worker of the canvas """
         self.predict_center_x = x
         self.predict_center_y = y
-        rgb_crop_pil = ImageTools.crop_xy(self.image, x, y, ImageTools.CROP_WIDTH, ImageTools.CROP_HEIGHT)
+        if not self.rgb_and_depth:  # Same batched preprocessing than the maps, a cache key only holds one kind of prediction
+            return self.predict_from_points([(x, y)])[0]
+        image_id, image, depth_image, model = self.image_id, self.image, self.depth_image, self.model  # Can be changed by the GUI thread
+        cache_key = self.prediction_cache.key(image_id, x, y)
+        pred = self.prediction_cache.get(cache_key)
+        if pred is None:
+            rgb_crop_pil = ImageTools.crop_xy(image, x, y, ImageTools.CROP_WIDTH, ImageTools.CROP_HEIGHT)
+            depth_crop_pil = ImageTools.crop_xy(depth_image, x, y, ImageTools.CROP_WIDTH, ImageTools.CROP_HEIGHT)
+            pred = RgbAndDepthCnn.predict_from_pil_rgb_and_depth_images(model, rgb_crop_pil, depth_crop_pil)
+            self.prediction_cache.put(cache_key, pred)
+        return pred
+
+    def cached_prediction(self, x, y):
+        """ Return the prediction at (x,y) if it has already been computed for the current image, None otherwise """
+        return self.prediction_cache.peek(self.prediction_cache.key(self.image_id, x, y))
+
+    def predict_from_points(self, points):
+        """ Return the list of predictions for a list of (x,y) points. For RGB models, the crops are processed as one batch """
         if self.rgb_and_depth:
-            depth_crop_pil = ImageTools.crop_xy(self.depth_image, x, y, ImageTools.CROP_WIDTH, ImageTools.CROP_HEIGHT)
-            return RgbAndDepthCnn.predict_from_pil_rgb_and_depth_images(self.model, rgb_crop_pil, depth_crop_pil)
-        else:
-            return RgbCnn.predict_from_pil_rgb_image(self.model, rgb_crop_pil)
+            return [self.predict_from_point(x, y) for x, y in points]  # PIL path, one by one
+        image_id, image_array, model = self.image_id, self.image_array, self.model  # Can be changed by the GUI thread
+        keys = [self.prediction_cache.key(image_id, x, y) for x, y in points]
+        preds = [self.prediction_cache.get(key) for key in keys]
+        missing = [i for i, pred in enumerate(preds) if pred is None]
+        if missing:
+            batch = self.preprocessor(image_array, [points[i] for i in missing])
+            batch_preds = CropPreprocessor.predict(model, batch)
+            for j, i in enumerate(missing):
+                preds[i] = batch_preds[j:j + 1]  # Same shape than predict_from_point result : (1, 2)
+                self.prediction_cache.put(keys[i], preds[i])
+        return preds
 
     def predict_from_image(self):
         """ Load the images data """
@@ -106,11 +184,71 @@ class ExploreWindow(QWidget):
             self.lbl_result_map.setText(f"The prediction for this image is : {prob*100:.2f}%" )
 
     def compute_map(self, start_coord, end_coord):
-        """ Compute a list of predictions and ask the canvas to draw them
+        """ Start the computation of a list of predictions in background, the canvas draws them as they arrive.
+            The predictions already in the map cache are drawn immediately.
             Called from CanvasExplore """
-        all_preds = self._compute_all_preds(start_coord, end_coord)
-        self.canvas.all_preds = all_preds
-        self.canvas.repaint()
+        self.cancel_map()
+        if not self.model:
+            return
+        steps = int(self.edt_nb_pixels_per_step.text())
+        points = [(x, y) for x in range(start_coord.x(), end_coord.x(), steps) for y in range(start_coord.y(), end_coord.y(), steps)]
+        self.canvas.clear_predictions(cell_size=steps)
+        map_predictions = self._current_map(steps)
+        self.canvas.add_predictions([[x, y, map_predictions[(x, y)]] for x, y in points if (x, y) in map_predictions])
+        self.canvas.update()
+        points = [point for point in points if point not in map_predictions]
+        if not points:
+            self.lbl_result_map.setText('Prediction map loaded from the map cache')
+            return
+        self.map_worker = MapWorker(self, points)
+        self.map_worker.batch_ready.connect(self._add_map_batch)
+        self.map_worker.progress.connect(self._show_map_progress)
+        self.map_worker.start()
+
+    def cancel_map(self):
+        """ Stop the computation of the current prediction map (called when a new selection is drawn or a new image is loaded) """
+        if self.map_worker:
+            self.map_worker.cancel()
+            self.map_worker.wait()  # At most the time of one batch
+            self.map_worker = None
+            self._save_map()  # The predictions already computed can be reused
+
+    def _current_map(self, steps):
+        """ Return the {(x, y): pred} predictions of the map for the current image, model and stride.
+            When one of them changes, the map is loaded from the map cache (empty if not cached) """
+        key = (self.image_hash, self.model_hash, steps)
+        if key != self.map_key:
+            self._save_map()
+            self.map_key = key
+            self.map_predictions = {}
+            self.map_modified = False
+            cached_map = self.map_cache.load(self.image_hash, self.model_hash, (ImageTools.CROP_WIDTH, ImageTools.CROP_HEIGHT), steps)
+            if cached_map is not None:
+                for (x, y), pred in zip(*cached_map):
+                    pred = torch.from_numpy(pred[None])  # Same shape than predict_from_point result : (1, 2)
+                    self.map_predictions[(int(x), int(y))] = pred
+                    self.prediction_cache.put(self.prediction_cache.key(self.image_id, x, y), pred)
+        return self.map_predictions
+
+    def _save_map(self):
+        if self.map_key and self.map_modified:
+            image_hash, model_hash, steps = self.map_key
+            preds = np.concatenate([torch.as_tensor(pred).detach().cpu().numpy().reshape(1, 2) for pred in self.map_predictions.values()])
+            self.map_cache.save(image_hash, model_hash, (ImageTools.CROP_WIDTH, ImageTools.CROP_HEIGHT), steps,
+                                list(self.map_predictions.keys()), preds)
+            self.map_modified = False
+
+    def _show_cached_map(self):
+        """ Draw the prediction map of the current image if it is in the map cache (for the current model and stride) """
+        if not self.model:
+            return
+        steps = int(self.edt_nb_pixels_per_step.text())
+        map_predictions = self._current_map(steps)
+        if map_predictions:
+            self.canvas.clear_predictions(cell_size=steps)
+            self.canvas.add_predictions([[x, y, pred] for (x, y), pred in map_predictions.items()])
+            self.canvas.update()
+            self.lbl_result_map.setText(f'{len(map_predictions)} predictions loaded from the map cache')
 
     def ask_robot_to_pick(self, px, py):
         if self.robot:
@@ -135,10 +273,13 @@ class ExploreWindow(QWidget):
         fname = QFileDialog.getOpenFileName(self, 'Open CKPT model file', '.', "Model files (*.ckpt)",
                                             options=QFileDialog.DontUseNativeDialog)
         if fname[0]:
+            self.cancel_map()  # The current map is computed with the previous model
             if self.rgb_and_depth: # model for RGB and DEPTH images
-                self.model = RgbAndDepthCnn.load_ckpt_model_file(fname[0])
+                self.model = RgbAndDepthCnn.load_ckpt_model_file(fname[0]).eval()
             else:  # model for only RGB images
-                self.model = RgbCnn.load_ckpt_model_file(fname[0])  # Load the selected models
+                self.model = RgbCnn.load_ckpt_model_file(fname[0]).eval()  # Load the selected models, in inference mode
+            self.prediction_cache.clear()  # Cached predictions come from the previous model
+            self.model_hash = PredictionMapCache.hash_file(fname[0])
             ckpt_model_name = os.path.basename(fname[0])  # Only the name, without path
             self.lbl_model_name.setText(ckpt_model_name)
 
@@ -161,26 +302,40 @@ class ExploreWindow(QWidget):
         msg_depth = rospy.wait_for_message(self.depth_topic, Image)
         pil_rgb = ImageTools.ros_msg_to_pil(msg_rgb)
         pil_depth = ImageTools.ros_msg_to_pil(msg_depth)
-        self.canvas.set_image(pil_rgb, pil_depth)
         self.image = pil_rgb
         self.depth_image = pil_depth
+        self._new_image_loaded()
+        self.canvas.set_image(self.image_array, self.depth_array)
+
+    def _new_image_loaded(self):
+        """ Called when self.image and self.depth_image have been replaced """
+        self.cancel_map()  # The current map is computed on the previous image
+        self.image_id += 1
+        self.image_array = np.asarray(self.image.convert('RGB'))
+        self.depth_array = np.asarray(self.depth_image.convert('RGB')) if self.depth_image else None
+        self.image_hash = PredictionMapCache.hash_images(self.image_array, self.depth_image if self.rgb_and_depth else None)
 
-    def _compute_all_preds(self, start_coord, end_coord):
-        """ Compute a list of predictions like :
+    def _add_map_batch(self, preds):
+        """ Add a batch of predictions like :
         [ [x, y, tensor([[prob_fail, proba_success]])], ...] with x,y the center of cropped image size (WIDTH,HEIGHT)
+        to the ones drawn by the canvas
         """
-        start = time.time()
-        all_preds = []
-        steps = int(self.edt_nb_pixels_per_step.text())
-        count = 0
-        for x in range(start_coord.x(), end_coord.x(), steps):
-            for y in range(start_coord.y(), end_coord.y(), steps):
-                preds = self.predict_from_point(x, y)
-                all_preds.append([x, y, preds])
-                count += 1
-        end = time.time()
-        self.lbl_result_map.setText(f'{count} inferences in {end - start:.1f} s')
-        return all_preds
+        if self.sender() is not self.map_worker:  # Batch sent by a cancelled worker before it stopped
+            return
+        for x, y, pred in preds:
+            self.map_predictions[(x, y)] = pred
+        self.map_modified = True
+        self.canvas.add_predictions(preds)
+        self.canvas.update()
+
+    def _show_map_progress(self, nb_done, nb_total, inferences_per_second):
+        if self.sender() is not self.map_worker:
+            return
+        text = f'{nb_done} / {nb_total} inferences, {inferences_per_second:.0f} inferences/s'
+        if nb_done == nb_total:
+            text += f'\n{self.prediction_cache.stats()}'
+            self._save_map()
+        self.lbl_result_map.setText(text)
 
 
 # First, run the communication between the robot and ROS :
@@ -195,11 +350,17 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Test a CKPT file model and perform robot pick action.')
     parser.add_argument('calibration_folder', type=str, help='calibration files folder')
     parser.add_argument('--rgb_and_depth', default=False, action='store_true', help='For RGB + DEPTH model')
+    parser.add_argument('--map_cache_folder', type=str, default=DEFAULT_CACHE_FOLDER, help='Folder of the prediction maps saved on disk')
     args = parser.parse_args()
 
-    rospy.init_node('explore')
+    startup = StartupProfile('explore')
+    with startup.step('init_node'):
+        rospy.init_node('explore')
+        advertise_profile_service()  # /explore/profile
     rate = rospy.Rate(0.5)
     app = QApplication(sys.argv)
-    gui = ExploreWindow(args.calibration_folder, args.rgb_and_depth)
-    gui.show()
+    with startup.step('window'):
+        gui = ExploreWindow(args.calibration_folder, args.rgb_and_depth, args.map_cache_folder)
+        gui.show()
+    startup.report()
     sys.exit(app.exec_())
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+"""
+Export a RgbCnn CKPT model file to a traced TorchScript (.pt) or ONNX (.onnx) file, used by the 'torchscript' and
+'onnx' inference backends (see inference_backend.py).
+After the export, the outputs of the exported model are compared with the eager PyTorch model and the speedup is printed.
+
+python export_model.py <CKPT_FILE> --format torchscript
+python export_model.py <CKPT_FILE> --format onnx --output model.onnx
+"""
+import os
+import time
+import torch
+from raiv_libraries.rgb_cnn import RgbCnn
+from crop_preprocessing import CropPreprocessor
+from inference_backend import load_inference_model
+
+
+def export(model, example_batch, output_file, format):
+    """ Trace the model with an example batch and save it """
+    with torch.no_grad():
+        if format == 'torchscript':
+            traced_model = torch.jit.trace(model, example_batch)
+            torch.jit.save(traced_model, output_file)
+        else:  # onnx
+            torch.onnx.export(model, example_batch, output_file, input_names=['images'], output_names=['logits'],
+                              dynamic_axes={'images': {0: 'batch'}, 'logits': {0: 'batch'}}, opset_version=13)
+
+
+def mean_inference_time(model, batch, nb_runs):
+    """ Return the mean time (in s) of an inference for this batch, after a warm-up """
+    with torch.no_grad():
+        model(batch)
+        start = time.perf_counter()
+        for _ in range(nb_runs):
+            model(batch)
+    return (time.perf_counter() - start) / nb_runs
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Export a CKPT model file to TorchScript or ONNX, check the outputs and report the speedup.')
+    parser.add_argument('ckpt_model_file', type=str, help='CKPT model file')
+    parser.add_argument('--format', type=str, default='torchscript', choices=['torchscript', 'onnx'], help='Format of the exported model')
+    parser.add_argument('--output', type=str, default=None, help='Exported file (default : CKPT file name with .pt or .onnx extension)')
+    parser.add_argument('--batch_size', type=int, default=32, help='Batch size used to check the outputs and measure the speedup')
+    parser.add_argument('--nb_runs', type=int, default=20, help='Number of inferences used to measure the speedup')
+    parser.add_argument('--tolerance', type=float, default=1e-4, help='Max difference allowed between eager and exported outputs')
+    args = parser.parse_args()
+
+    output_file = args.output or os.path.splitext(args.ckpt_model_file)[0] + ('.pt' if args.format == 'torchscript' else '.onnx')
+    eager_model = RgbCnn.load_ckpt_model_file(args.ckpt_model_file)
+    eager_model.eval()
+    image_size = CropPreprocessor().image_size
+    batch = torch.randn(args.batch_size, 3, image_size, image_size)
+    export(eager_model, batch[:1], output_file, args.format)
+    print(f'Model exported to {output_file}')
+    # Check the exported model gives the same outputs than the eager one
+    exported_model = load_inference_model(output_file)
+    with torch.no_grad():
+        max_diff = (eager_model(batch) - exported_model(batch)).abs().max().item()
+    print(f'Max difference between eager and {args.format} outputs : {max_diff:.2e}')
+    if max_diff > args.tolerance:
+        print(f'WARNING : difference greater than the tolerance ({args.tolerance})')
+    # Speedup
+    eager_time = mean_inference_time(eager_model, batch, args.nb_runs)
+    exported_time = mean_inference_time(exported_model, batch, args.nb_runs)
+    print(f'Eager : {eager_time*1000:.1f} ms, {args.format} : {exported_time*1000:.1f} ms per batch of {args.batch_size} images')
+    print(f'Speedup : x{eager_time / exported_time:.2f}')
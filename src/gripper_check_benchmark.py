@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Benchmark of the grip check (object_gripped topic), to find how short the vacuum dwell and the wait before reading
+object_gripped can be. Same setup as repetead_tests_gripped_object.py : an object under the GRIPPED positions,
+nothing under the NOT_GRIPPED positions.
+
+For each dwell time (vacuum ON before lifting) and each lift height, 'nb_trials' trials are done on the object and
+on the empty place :
+* go down to Z_LOW, switch on the vacuum gripper, wait 'dwell' seconds, go up to the lift height
+* sample object_gripped continuously (subscription, no wait_for_message) during 'timeout' seconds after the lift
+* time to a stable reading : delay after the lift from which the reading stays unchanged during 'stable_time' seconds
+* switch off the vacuum gripper and go back to Z_HIGH
+
+Report, for each (case, dwell, height) : reliability (stable reading == expected), mean and max time to a stable
+reading, and the reliability curve (ratio of trials where the reading at lift + delay is the expected one, for
+increasing delays). The trials are written to a CSV file.
+
+rosrun rosserial_arduino serial_node.py _port:=/dev/ttyACM0
+roslaunch raiv_libraries ur3_bringup_cartesian.launch robot_ip:=10.31.56.102 kinematics_config:=/common/calibration/robot/ur3_calibration.yaml
+python gripper_check_benchmark.py --dwells 0.1 0.25 0.5 1 --heights 0.053 0.064 --nb_trials 20
+"""
+import csv
+import time
+import threading
+from collections import deque
+import rospy
+from std_msgs.msg import Bool
+from raiv_libraries.robot_with_vaccum_gripper import Robot_with_vaccum_gripper
+from repetead_tests_gripped_object import (X_HIGH_GRIPPED, Y_HIGH_GRIPPED, Z_HIGH_GRIPPED, Z_LOW_GRIPPED, Z_INT_GRIPPED,
+                                           X_HIGH_NOT_GRIPPED, Y_HIGH_NOT_GRIPPED, Z_HIGH_NOT_GRIPPED, Z_LOW_NOT_GRIPPED)
+
+# case => (x, y, z high, z low, expected reading)
+CASES = {'gripped': (X_HIGH_GRIPPED, Y_HIGH_GRIPPED, Z_HIGH_GRIPPED, Z_LOW_GRIPPED, True),
+         'not_gripped': (X_HIGH_NOT_GRIPPED, Y_HIGH_NOT_GRIPPED, Z_HIGH_NOT_GRIPPED, Z_LOW_NOT_GRIPPED, False)}
+CURVE_STEP = 0.05  # Delay step (in s) of the reliability curve
+
+
+class GrippedSampler:
+    """ Keep the (time, value) samples of the object_gripped topic received during the last 'history' seconds """
+    def __init__(self, topic='object_gripped', history=60.0):
+        self.history = history
+        self.samples = deque()
+        self.lock = threading.Lock()
+        rospy.Subscriber(topic, Bool, self._callback, queue_size=100)
+
+    def _callback(self, msg):
+        now = time.time()
+        with self.lock:
+            self.samples.append((now, msg.data))
+            while self.samples and self.samples[0][0] < now - self.history:
+                self.samples.popleft()
+
+    def since(self, start):
+        """ Samples received after 'start', with the last one received before (value at 'start') """
+        with self.lock:
+            samples = list(self.samples)
+        before = [sample for sample in samples if sample[0] < start][-1:]
+        return before + [sample for sample in samples if sample[0] >= start]
+
+    def wait_stable(self, start, stable_time, timeout):
+        """ Return (time to stable reading, stable value) after 'start', (None, None) if not stable before 'timeout' """
+        while time.time() < start + timeout and not rospy.is_shutdown():
+            result = stable_reading(self.since(start), start, stable_time)
+            if result[0] is not None:
+                return result
+            rospy.sleep(0.005)
+        return stable_reading(self.since(start), start, stable_time)
+
+
+def stable_reading(samples, start, stable_time):
+    """
+    First reading of the samples which does not change during 'stable_time' seconds after 'start' : (delay after start,
+    value). A reading received before 'start' only counts from 'start', and at least one sample after 'start' is needed.
+    """
+    run_start = None
+    for index, (t, value) in enumerate(samples):
+        if index == 0 or value != samples[index - 1][1]:
+            run_start = max(t, start)
+        if t >= start and t - run_start >= stable_time:
+            return run_start - start, value
+    if samples and samples[-1][0] >= start and time.time() - run_start >= stable_time:  # No new sample, the reading has not changed
+        return run_start - start, samples[-1][1]
+    return None, None
+
+
+def reading_at(samples, t):
+    """ Value of the last sample received before t (None if no sample) """
+    value = None
+    for sample_time, sample_value in samples:
+        if sample_time > t:
+            break
+        value = sample_value
+    return value
+
+
+def run_trial(robot, sampler, case, dwell, height, stable_time, timeout, release_time):
+    x, y, z_high, z_low, expected = CASES[case]
+    robot.go_to_xyz_position(x, y, z_low)
+    robot._send_gripper_message(True, timer=dwell)  # Vaccum gripper ON during dwell seconds
+    robot.go_to_xyz_position(x, y, height)
+    lift = time.time()
+    time_to_stable, value = sampler.wait_stable(lift, stable_time, timeout)
+    rospy.sleep(max(lift + timeout - time.time(), 0))  # Samples for the reliability curve
+    samples = sampler.since(lift)
+    robot._send_gripper_message(False, timer=release_time)  # Vaccum gripper OFF
+    robot.go_to_xyz_position(x, y, z_high)
+    curve = [reading_at(samples, lift + i * CURVE_STEP) == expected for i in range(int(timeout / CURVE_STEP) + 1)]
+    return {'case': case, 'dwell': dwell, 'height': height, 'expected': int(expected),
+            'stable_value': '' if value is None else int(value), 'time_to_stable': '' if time_to_stable is None else f'{time_to_stable:.3f}',
+            'first_reading': '' if reading_at(samples, lift) is None else int(reading_at(samples, lift)),
+            'nb_samples': len(samples), 'curve': curve, 'ok': value == expected}
+
+
+def print_summary(trials, timeout):
+    delays = [i * CURVE_STEP for i in range(int(timeout / CURVE_STEP) + 1)]
+    print(f"\n{'case':<12} {'dwell':>6} {'height':>7} {'trials':>6} {'reliability':>11} {'mean stable':>11} {'max stable':>10}")
+    groups = {}
+    for trial in trials:
+        groups.setdefault((trial['case'], trial['dwell'], trial['height']), []).append(trial)
+    for (case, dwell, height), group in groups.items():
+        times = [float(trial['time_to_stable']) for trial in group if trial['ok']]
+        mean_time = f'{sum(times) / len(times):.3f}' if times else '-'
+        max_time = f'{max(times):.3f}' if times else '-'
+        reliability = sum(trial['ok'] for trial in group) / len(group)
+        print(f'{case:<12} {dwell:>6.2f} {height:>7.3f} {len(group):>6} {reliability * 100:>10.0f}% {mean_time:>11} {max_time:>10}')
+    print('\nReliability curve (% of trials with the expected reading at lift + delay)')
+    print(f"{'case':<12} {'dwell':>6} {'height':>7} " + ' '.join(f'{delay:>5.2f}' for delay in delays))
+    for (case, dwell, height), group in groups.items():
+        ratios = [sum(trial['curve'][i] for trial in group) / len(group) for i in range(len(delays))]
+        print(f'{case:<12} {dwell:>6.2f} {height:>7.3f} ' + ' '.join(f'{ratio * 100:>5.0f}' for ratio in ratios))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Sweep vacuum dwell times and lift heights, measure the time to a stable object_gripped reading and its reliability.')
+    parser.add_argument('--dwells', type=float, nargs='+', default=[0.1, 0.25, 0.5, 1.0], help='Vacuum ON durations (in s) before lifting')
+    parser.add_argument('--heights', type=float, nargs='+', default=[Z_INT_GRIPPED], help='Z (in m) of the lift before reading object_gripped')
+    parser.add_argument('--nb_trials', type=int, default=10, help='Number of trials for each case, dwell time and height')
+    parser.add_argument('--cases', type=str, nargs='+', default=list(CASES), choices=list(CASES), help='With an object (gripped) and / or without (not_gripped)')
+    parser.add_argument('--stable_time', type=float, default=0.2, help='A reading is stable when it does not change during this time (in s)')
+    parser.add_argument('--timeout', type=float, default=2.0, help='Time (in s) object_gripped is sampled after the lift')
+    parser.add_argument('--release_time', type=float, default=1.0, help='Vacuum OFF duration (in s) after each trial')
+    parser.add_argument('--output', type=str, default='gripper_check_benchmark.csv', help='CSV file with one line per trial')
+    args = parser.parse_args()
+
+    rospy.init_node('gripper_check_benchmark')
+    sampler = GrippedSampler()
+    robot = Robot_with_vaccum_gripper()
+    robot.go_to_xyz_position(X_HIGH_GRIPPED, Y_HIGH_GRIPPED, Z_HIGH_GRIPPED)
+    print("Press ENTER when the vacuum gripper is 1cm above an object")
+    input()
+    trials = []
+    with open(args.output, 'w', newline='') as f:
+        fields = ['case', 'dwell', 'height', 'expected', 'stable_value', 'time_to_stable', 'first_reading', 'nb_samples']
+        writer = csv.DictWriter(f, fields, extrasaction='ignore')
+        writer.writeheader()
+        for case in args.cases:
+            for dwell in args.dwells:
+                for height in args.heights:
+                    for num_trial in range(args.nb_trials):
+                        if rospy.is_shutdown():
+                            break
+                        trial = run_trial(robot, sampler, case, dwell, height, args.stable_time, args.timeout, args.release_time)
+                        writer.writerow(trial)
+                        f.flush()
+                        trials.append(trial)
+                        print(f"{case} dwell={dwell} height={height} trial {num_trial + 1}/{args.nb_trials} : "
+                              f"{'OK' if trial['ok'] else 'WRONG'} (stable after {trial['time_to_stable'] or '-'} s)")
+    if trials:
+        print_summary(trials, args.timeout)
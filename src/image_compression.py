@@ -0,0 +1,120 @@
+import cv2
+import numpy as np
+import rospy
+from sensor_msgs.msg import Image, CompressedImage
+from raiv_research.msg import RgbAndDepthImages, CompressedRgbAndDepthImages
+from ros_image import ros_msg_to_numpy
+from shared_frames import SharedFrameSubscriber
+
+NEW_IMAGES_TOPIC = 'new_images'  # Relative names : resolved in the namespace of the subscriber node
+COMPRESSED_NEW_IMAGES_TOPIC = 'new_images_compressed'
+RGB_FORMATS = ['jpeg', 'png']
+DEPTH_FORMATS = ['png', 'zstd']  # Both lossless
+
+
+def _zstandard():
+    """ zstandard is only needed for the 'zstd' depth format """
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("The 'zstd' depth format needs the zstandard package (pip install zstandard)")
+    return zstandard
+
+
+class ImageCompressor:
+    """
+    Build CompressedRgbAndDepthImages messages from the RGB and depth Image messages : RGB in JPEG (lossy, smallest)
+    or PNG, depth in PNG or zstd (lossless, zstd is faster).
+    """
+    def __init__(self, rgb_format='jpeg', depth_format='png', jpeg_quality=90, png_level=1, zstd_level=3):
+        self.rgb_format = rgb_format
+        self.depth_format = depth_format
+        if rgb_format == 'jpeg':
+            self.rgb_params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        else:
+            self.rgb_params = [cv2.IMWRITE_PNG_COMPRESSION, png_level]
+        self.png_params = [cv2.IMWRITE_PNG_COMPRESSION, png_level]
+        self.zstd_compressor = _zstandard().ZstdCompressor(level=zstd_level) if depth_format == 'zstd' else None
+
+    def compress(self, rgb_msg, depth_msg):
+        msg = CompressedRgbAndDepthImages()
+        msg.rgb_image = self.compress_rgb(rgb_msg)
+        msg.depth_image = self.compress_depth(depth_msg)
+        msg.rgb_encoding = rgb_msg.encoding
+        msg.depth_encoding = depth_msg.encoding
+        msg.depth_width = depth_msg.width
+        msg.depth_height = depth_msg.height
+        return msg
+
+    def compress_rgb(self, rgb_msg):
+        image = ros_msg_to_numpy(rgb_msg)
+        if rgb_msg.encoding == 'rgb8':
+            image = cv2.cvtColor(np.ascontiguousarray(image), cv2.COLOR_RGB2BGR)  # OpenCV encodes BGR images
+        _, data = cv2.imencode('.jpg' if self.rgb_format == 'jpeg' else '.png', image, self.rgb_params)
+        return CompressedImage(header=rgb_msg.header, format=self.rgb_format, data=data.tobytes())
+
+    def compress_depth(self, depth_msg):
+        depth = np.ascontiguousarray(ros_msg_to_numpy(depth_msg))
+        if self.depth_format == 'zstd':
+            data = self.zstd_compressor.compress(depth.tobytes())
+        else:
+            data = cv2.imencode('.png', depth, self.png_params)[1].tobytes()  # 16-bit PNG for 16UC1 images
+        return CompressedImage(header=depth_msg.header, format=self.depth_format, data=data)
+
+
+def decode_rgb(msg):
+    """ Return the RGB Image message of a CompressedRgbAndDepthImages message """
+    image = cv2.imdecode(np.frombuffer(msg.rgb_image.data, dtype=np.uint8), cv2.IMREAD_COLOR)  # BGR
+    if msg.rgb_encoding == 'rgb8':
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    height, width = image.shape[:2]
+    return Image(header=msg.rgb_image.header, height=height, width=width, encoding=msg.rgb_encoding or 'bgr8',
+                 step=width * 3, data=image.tobytes())
+
+
+def decode_depth(msg):
+    """ Return the depth Image message of a CompressedRgbAndDepthImages message """
+    if msg.depth_image.format == 'zstd':
+        data = _zstandard().ZstdDecompressor().decompress(msg.depth_image.data)
+    else:
+        data = cv2.imdecode(np.frombuffer(msg.depth_image.data, dtype=np.uint8), cv2.IMREAD_UNCHANGED).tobytes()
+    return Image(header=msg.depth_image.header, height=msg.depth_height, width=msg.depth_width, encoding=msg.depth_encoding,
+                 step=len(data) // msg.depth_height, data=data)
+
+
+class LazyRgbAndDepthImages:
+    """
+    Wrap a CompressedRgbAndDepthImages message with the rgb_image and depth_image attributes of a RgbAndDepthImages message.
+    Each image is decoded at its first access, so a subscriber only pays for the images it uses.
+    """
+    def __init__(self, msg):
+        self.msg = msg
+        self._rgb_image = self._depth_image = None
+
+    @property
+    def rgb_image(self):
+        if self._rgb_image is None:
+            self._rgb_image = decode_rgb(self.msg)
+        return self._rgb_image
+
+    @property
+    def depth_image(self):
+        if self._depth_image is None:
+            self._depth_image = decode_depth(self.msg)
+        return self._depth_image
+
+
+def subscribe_new_images(callback, compressed=False, queue_size=None, shared_memory=False):
+    """
+    Subscribe to the new images published by node_best_prediction.py : raw RgbAndDepthImages messages on /new_images,
+    or (compressed=True) CompressedRgbAndDepthImages messages on /new_images_compressed, given to the callback as
+    LazyRgbAndDepthImages objects. In both cases, the callback uses msg.rgb_image and msg.depth_image.
+    With shared_memory=True, the frames are read from the shared memory ring buffer (see shared_frames.py) and the
+    subscription switches to the messages if the publisher is on another host.
+    """
+    if shared_memory:
+        return SharedFrameSubscriber(callback, lambda: subscribe_new_images(callback, compressed, queue_size), queue_size)
+    if compressed:
+        return rospy.Subscriber(COMPRESSED_NEW_IMAGES_TOPIC, CompressedRgbAndDepthImages,
+                                lambda msg: callback(LazyRgbAndDepthImages(msg)), queue_size=queue_size)
+    return rospy.Subscriber(NEW_IMAGES_TOPIC, RgbAndDepthImages, callback, queue_size=queue_size)
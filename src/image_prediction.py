@@ -1,9 +1,11 @@
+from node_startup import lazy_import
 import os
-import torch
 import shutil
-from raiv_libraries.image_tools import ImageTools
 from PIL import Image
-from raiv_libraries.rgb_cnn import RgbCnn
+# Heavy imports, done at their first use (after the arguments are parsed)
+torch = lazy_import('torch')
+ImageTools = lazy_import('raiv_libraries.image_tools', 'ImageTools')
+RgbCnn = lazy_import('raiv_libraries.rgb_cnn', 'RgbCnn')
 
 
 FAIL=0
@@ -6,10 +6,12 @@ from raiv_libraries.srv import rgb_service, rgb_serviceResponse, rgb_serviceRequ
 from raiv_libraries.srv import depth_service, depth_serviceResponse, depth_serviceRequest
 from sensor_msgs.msg import Image
 import numpy as np
+from latency_metrics import LatencyRecorder
+from sampling_profiler import advertise_profile_service
 
 class ImageService:
 
-    def __init__(self):
+    def __init__(self, metrics_period=5.0):
         #Declaration of all the node names
         rospy.init_node('image_distribution', anonymous = True)
         self.rgb_node_name = '/camera/color/image_raw'
@@ -18,6 +20,10 @@ class ImageService:
         #Declaration of our 2 services, one for rgb image and the other for the depth image
         self.rgb_service = rospy.Service('/rgb_service', rgb_service, self.rgb_distribution)
         self.depth_service = rospy.Service('/depth_service', depth_service, self.depth_distribution)
+        #On-demand profiling with the /image_distribution_<id>/profile service
+        advertise_profile_service()
+        #Latency of each processing stage, published on /raiv_metrics
+        self.metrics = LatencyRecorder('image_service', metrics_period)
 
     #Function to normalize the images
     def normalization(self, image, bins=255):
@@ -41,7 +47,8 @@ class ImageService:
 
     #Function to get a new rgb image and send it as a response
     def rgb_distribution(self, req):
-        image_rgb = rospy.wait_for_message(self.rgb_node_name, Image)
+        with self.metrics.measure('wait_rgb_image'):
+            image_rgb = rospy.wait_for_message(self.rgb_node_name, Image)
         return rgb_serviceResponse(
             image = image_rgb
         )
@@ -49,7 +56,18 @@ class ImageService:
     #Function to get a new depth image, process it and send it as a response
     def depth_distribution(self, req):
         #Get new image and transfer it from imgmsg to cv2
-        image_depth = rospy.wait_for_message(self.depth_node_name, Image)
+        with self.metrics.measure('wait_depth_image'):
+            image_depth = rospy.wait_for_message(self.depth_node_name, Image)
+        with self.metrics.measure('depth_processing'):
+            image_depth = self._process_depth(image_depth, req)
+
+        #Send the depth image as a response
+        return depth_serviceResponse(
+            image = image_depth
+        )
+
+    #Function to apply the median blur and normalization asked in the request to a depth imgmsg
+    def _process_depth(self, image_depth, req):
         image_depth = self.cv2_msg_transf(image_depth, op = 0)
 
         #Check if ksize param. passed, if so we apply a MedianBlur on the depth image with the Kernel size equal to the param ksize
@@ -64,12 +82,7 @@ class ImageService:
         if req.normalization == 1:
             image_depth = self.normalization(image_depth)[0]
         #Transfer the image back to imgmsg from cv2
-        image_depth = self.cv2_msg_transf(image_depth, op = 1)
-
-        #Send the depth image as a response
-        return depth_serviceResponse(
-            image = image_depth
-        )
+        return self.cv2_msg_transf(image_depth, op = 1)
 
 if __name__ == '__main__':
     images = ImageService()
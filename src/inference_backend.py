@@ -0,0 +1,69 @@
+import os
+from lazy_imports import lazy_import
+torch = lazy_import('torch')  # Imported at the first model loading, not by the nodes only using BACKENDS
+RgbCnn = lazy_import('raiv_libraries.rgb_cnn', 'RgbCnn')
+
+
+BACKENDS = ['eager', 'torchscript', 'onnx', 'int8']
+
+
+class TorchScriptModel:
+    """ A traced model (.pt file created by export_model.py), frozen and optimized for CPU inference """
+    def __init__(self, model_file):
+        model = torch.jit.load(model_file, map_location='cpu').eval()
+        self.model = torch.jit.optimize_for_inference(model)  # Freeze the model then fuse conv/batchnorm, ...
+
+    def __call__(self, batch):
+        with torch.no_grad():
+            return self.model(batch)
+
+
+class QuantizedModel:
+    """ An INT8 model (.int8.pt file created by quantize_model.py), traced after post-training quantization """
+    def __init__(self, model_file, engine='fbgemm'):
+        torch.backends.quantized.engine = engine  # 'fbgemm' for x86 CPUs, 'qnnpack' for ARM CPUs
+        self.model = torch.jit.load(model_file, map_location='cpu').eval()
+
+    def __call__(self, *batches):
+        with torch.no_grad():
+            return self.model(*batches)
+
+
+class OnnxModel:
+    """ An ONNX model (.onnx file created by export_model.py) run by onnxruntime with all graph optimizations """
+    def __init__(self, model_file, nb_threads=0):
+        import onnxruntime  # Only needed for this backend
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = nb_threads  # 0 : let onnxruntime choose
+        self.session = onnxruntime.InferenceSession(model_file, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch):
+        outputs = self.session.run(None, {self.input_name: batch.detach().cpu().numpy()})
+        return torch.from_numpy(outputs[0])
+
+
+def backend_from_file(model_file):
+    """ Guess the backend from the model file extension """
+    if model_file.endswith('.int8.pt'):
+        return 'int8'
+    ext = os.path.splitext(model_file)[1]
+    return {'.pt': 'torchscript', '.onnx': 'onnx'}.get(ext, 'eager')
+
+
+def load_inference_model(model_file, backend=None):
+    """
+    Return a model which can be called with a (N, 3, H, W) normalized tensor and returns the (N, 2) logits.
+    backend : 'eager' (CKPT file loaded with PyTorch), 'torchscript', 'onnx' or 'int8'. If None, guessed from the file extension.
+    """
+    backend = backend or backend_from_file(model_file)
+    if backend == 'torchscript':
+        return TorchScriptModel(model_file)
+    elif backend == 'int8':
+        return QuantizedModel(model_file)
+    elif backend == 'onnx':
+        return OnnxModel(model_file)
+    elif backend == 'eager':
+        return RgbCnn.load_ckpt_model_file(model_file).eval()  # Dropout and batch norm in inference mode
+    raise ValueError(f'Unknown inference backend : {backend}, must be one of {BACKENDS}')
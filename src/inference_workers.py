@@ -0,0 +1,143 @@
+import os
+import time
+import queue
+import itertools
+import multiprocessing
+import numpy as np
+import torch
+from model_registry import ModelRegistry
+from sensor_msgs.msg import Image
+from crop_preprocessing import CropPreprocessor
+from ros_image import ros_msg_to_numpy
+from shared_frames import SharedFrameWriter, SharedFrameReader
+
+
+def _worker_loop(model_file, backend, nb_threads, max_models, warmup_batch_size, tasks, results, acks):
+    """
+    Main loop of a worker process. Tasks :
+    * ('predict', task_id, frame descriptor, points) : put (task_id, probas) in the results queue (probas = None if
+    the frame has been replaced during the inference, an error message if the inference failed)
+    * ('load', task_id, model_file, backend) : load and warm up the model (not used yet), put (task_id, None) in the
+    acks queue, or (task_id, error message) if the loading fails
+    * ('use', model_file, backend) : use this model, loaded by a previous 'load' task
+    * None : stop the worker
+    """
+    torch.set_num_threads(nb_threads)
+    registry = ModelRegistry(max_models, warmup_batch_size)  # Switching back to a recently used model costs nothing
+    model = registry.load(model_file, backend)
+    preprocessor = CropPreprocessor()
+    reader = SharedFrameReader()
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        if task[0] == 'load':
+            _, task_id, model_file, backend = task
+            try:
+                if registry.get(model_file, backend) is None:
+                    registry.load(model_file, backend)
+                acks.put((task_id, None))
+            except Exception as e:
+                acks.put((task_id, f'{type(e).__name__} : {e}'))
+            continue
+        if task[0] == 'use':
+            model = registry.get(task[1], task[2])
+            continue
+        _, task_id, descriptor, points = task
+        try:
+            shared_frame = reader.read(descriptor)
+            frame = ros_msg_to_numpy(shared_frame.rgb_image, rgb=True)  # No copy, the crops are cut in the shared memory
+            probas = CropPreprocessor.probas_of_success(CropPreprocessor.predict(model, preprocessor(frame, points)))
+            results.put((task_id, probas if shared_frame.is_valid() else None))
+        except Exception as e:
+            results.put((task_id, f'{type(e).__name__} : {e}'))
+
+
+class InferenceWorkerPool:
+    """
+    'nb_workers' processes, each with its own copy of the model, computing the success probas of candidate points.
+    The current RGB frame is written once in a shared memory ring buffer (see shared_frames.py), read without copy by
+    the workers. compute_probas() splits the points in disjoint sets, one per worker, and merges the results.
+    Each worker uses 'nb_threads' torch threads (default : the cores shared between the workers).
+    Each worker keeps its last 'max_models' models (LRU) and warms them up on a batch of 'warmup_batch_size' crops.
+    compute_probas() and load_model() raise a RuntimeError if a worker fails, dies or does not answer within 'timeout' seconds.
+    """
+    def __init__(self, model_file, backend='eager', nb_workers=2, nb_threads=None, timeout=30.0, max_models=3, warmup_batch_size=1):
+        self.nb_workers = nb_workers
+        self.timeout = timeout
+        nb_threads = nb_threads or max(1, (os.cpu_count() or 1) // nb_workers)
+        context = multiprocessing.get_context('spawn')  # torch is not fork safe
+        self.tasks = [context.Queue() for _ in range(nb_workers)]
+        self.results = context.Queue()
+        self.acks = context.Queue()  # Answers of the 'load' tasks, apart from the results : load_model() and compute_probas() may run in two threads
+        self.processes = [context.Process(target=_worker_loop, daemon=True,
+                                          args=(model_file, backend, nb_threads, max_models, warmup_batch_size, tasks, self.results, self.acks))
+                          for tasks in self.tasks]
+        for process in self.processes:
+            process.start()
+        self.frame_writer = SharedFrameWriter(nb_slots=2, name_prefix='raiv_inference')
+        self.frame_descriptor = None
+        self._task_ids = itertools.count()
+
+    def set_frame(self, rgb_msg):
+        """ Share a new RGB Image message with the workers, return its descriptor """
+        self.frame_descriptor = self.frame_writer.write(rgb_msg, Image())
+        return self.frame_descriptor
+
+    def load_model(self, model_file, backend):
+        """
+        Each worker loads and warms up the model, then all of them use it for their next tasks. If a worker fails to
+        load it, raise a RuntimeError : all the workers keep the current model.
+        """
+        task_ids = []
+        for tasks in self.tasks:
+            task_ids.append(next(self._task_ids))
+            tasks.put(('load', task_ids[-1], model_file, backend))
+        errors = [error for error in self._wait(self.acks, task_ids).values() if error is not None]
+        if errors:
+            raise RuntimeError(f'Inference worker unable to load {model_file} ({backend}) : {errors[0]}')
+        for tasks in self.tasks:
+            tasks.put(('use', model_file, backend))
+
+    def compute_probas(self, points, frame_descriptor=None):
+        """ Return the list of success probas for the (x, y) points of the frame (descriptor returned by set_frame(),
+        default : the current frame), or None if the frame has been overwritten during the computation """
+        if frame_descriptor is None:
+            frame_descriptor = self.frame_descriptor
+        chunks = [chunk for chunk in np.array_split(np.asarray(points, dtype=np.int64).reshape(-1, 2), self.nb_workers) if len(chunk)]
+        task_ids = []
+        for tasks, chunk in zip(self.tasks, chunks):
+            task_ids.append(next(self._task_ids))
+            tasks.put(('predict', task_ids[-1], frame_descriptor, chunk))
+        results = self._wait(self.results, task_ids)
+        errors = [probas for probas in results.values() if isinstance(probas, str)]
+        if errors:
+            raise RuntimeError(f'Inference worker error : {errors[0]}')
+        if any(results[task_id] is None for task_id in task_ids):
+            return None
+        return [proba for task_id in task_ids for proba in results[task_id]]
+
+    def _wait(self, answers, task_ids):
+        """ Return a dict : task id => answer of the worker, for all these tasks """
+        results = {}
+        deadline = time.monotonic() + self.timeout
+        while len(results) < len(task_ids):
+            try:
+                task_id, answer = answers.get(timeout=1.0)
+            except queue.Empty:
+                dead = [process.pid for process in self.processes if not process.is_alive()]
+                if dead:
+                    raise RuntimeError(f'Inference worker(s) {dead} died')
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f'No answer of the inference workers after {self.timeout} s')
+                continue
+            if task_id in task_ids:  # Else, answer of a previous call which has failed
+                results[task_id] = answer
+        return results
+
+    def close(self):
+        for tasks in self.tasks:
+            tasks.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+        self.frame_writer.close()
@@ -0,0 +1,101 @@
+import math
+import time
+import threading
+from contextlib import contextmanager
+import rospy
+from raiv_research.msg import StageLatency, MetricsSummary
+
+
+class LatencyHistogram:
+    """
+    Fixed-size histogram of durations, with logarithmic bins from 'min_value' to 'max_value' seconds.
+    Recording a value is O(1) and the memory does not depend on the number of values.
+    """
+    def __init__(self, min_value=1e-6, max_value=100.0, bins_per_decade=20):
+        self.min_value = min_value
+        self.bins_per_decade = bins_per_decade
+        self.nb_bins = int(math.ceil(math.log10(max_value / min_value) * bins_per_decade)) + 1
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * self.nb_bins
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        index = 0 if value <= self.min_value else int(math.log10(value / self.min_value) * self.bins_per_decade)
+        self.counts[min(index, self.nb_bins - 1)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, p):
+        """ Return the upper bound of the bin which contains the p-th percentile (p in [0,100]) """
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        cumul = 0
+        for index, count in enumerate(self.counts):
+            cumul += count
+            if cumul >= rank:
+                return min(self.min_value * 10 ** ((index + 1) / self.bins_per_decade), self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class LatencyRecorder:
+    """
+    Record the duration of the processing stages of a node in LatencyHistogram objects and periodically
+    publish a summary (count, mean, p50, p95, p99, max in s for each stage) on the /raiv_metrics topic.
+    The histograms are reset after each publication, so each summary describes the last period.
+
+    with self.metrics.measure('inference'):
+        ...
+    """
+    def __init__(self, node_name, period=5.0, topic='/raiv_metrics'):
+        self.node_name = node_name
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self.publisher = None
+        if period > 0:
+            self.publisher = rospy.Publisher(topic, MetricsSummary, queue_size=10)
+            rospy.Timer(rospy.Duration(period), self._publish_summary)
+
+    @contextmanager
+    def measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def record(self, stage, duration):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = LatencyHistogram()
+            histogram.record(duration)
+
+    def histogram(self, stage):
+        """ Return the LatencyHistogram of this stage or None """
+        with self._lock:
+            return self._histograms.get(stage)
+
+    def summary(self, reset=True):
+        """ Return a MetricsSummary message for all the stages """
+        msg = MetricsSummary()
+        msg.stamp = rospy.Time.now()
+        with self._lock:
+            for stage, histogram in self._histograms.items():
+                msg.stages.append(StageLatency(self.node_name, stage, histogram.count, histogram.mean(),
+                                               histogram.percentile(50), histogram.percentile(95),
+                                               histogram.percentile(99), histogram.max))
+                if reset:
+                    histogram.reset()
+        return msg
+
+    def _publish_summary(self, event):
+        self.publisher.publish(self.summary())
@@ -0,0 +1,35 @@
+import time
+import importlib
+
+lazy_import_times = {}  # Module name => duration (in s) of its import, for the modules imported by lazy_import()
+
+
+class _LazyObject:
+    """ Import the module (and get the attribute) at the first access to one of its attributes """
+    def __init__(self, module_name, attribute):
+        self._module_name = module_name
+        self._attribute = attribute
+        self._object = None
+
+    def _resolve(self):
+        if self._object is None:
+            start = time.perf_counter()
+            module = importlib.import_module(self._module_name)
+            lazy_import_times.setdefault(self._module_name, time.perf_counter() - start)
+            self._object = getattr(module, self._attribute) if self._attribute else module
+        return self._object
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+
+def lazy_import(module_name, attribute=None):
+    """
+    Return a proxy of the module (or of one of its attributes, a class for example) which imports it at its first use.
+    torch = lazy_import('torch')
+    RgbCnn = lazy_import('raiv_libraries.rgb_cnn', 'RgbCnn')
+    """
+    return _LazyObject(module_name, attribute)
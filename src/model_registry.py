@@ -0,0 +1,73 @@
+import threading
+from collections import OrderedDict
+import torch
+from inference_backend import load_inference_model, backend_from_file
+from crop_preprocessing import CropPreprocessor
+
+
+class ModelRegistry:
+    """
+    LRU of loaded models, so switching back to a recently used model costs nothing.
+
+    Models are loaded (and warmed up on a dummy batch) in a background thread. When a model is ready, the
+    'on_ready' callback is called with (model, model_file, backend) : the caller swaps it in between two batches.
+    """
+    def __init__(self, max_models=3, warmup_batch_size=1):
+        self.max_models = max_models
+        self.warmup_batch_size = warmup_batch_size
+        self._models = OrderedDict()  # (model_file, backend) => model
+        self._lock = threading.Lock()
+        self._loading = set()  # (model_file, backend) currently loaded by a background thread
+
+    def add(self, model, model_file, backend):
+        """ Add an already loaded model """
+        with self._lock:
+            self._models[(model_file, backend)] = model
+            self._models.move_to_end((model_file, backend))
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)  # Forget the least recently used model
+
+    def get(self, model_file, backend):
+        """ Return the loaded model or None """
+        with self._lock:
+            model = self._models.get((model_file, backend))
+            if model is not None:
+                self._models.move_to_end((model_file, backend))
+            return model
+
+    def load(self, model_file, backend):
+        """ Load, warm up and register a model in this thread, return it """
+        model = load_inference_model(model_file, backend)
+        self._warm_up(model)
+        self.add(model, model_file, backend)
+        return model
+
+    def load_in_background(self, model_file, backend, on_ready, on_error=None):
+        """ Load, warm up and register a model in a background thread. Return False if this model is already loading """
+        backend = backend or backend_from_file(model_file)
+        with self._lock:
+            if (model_file, backend) in self._loading:
+                return False
+            self._loading.add((model_file, backend))
+        threading.Thread(target=self._load, args=(model_file, backend, on_ready, on_error), daemon=True).start()
+        return True
+
+    def loaded_models(self):
+        with self._lock:
+            return list(self._models.keys())
+
+    def _load(self, model_file, backend, on_ready, on_error):
+        try:
+            on_ready(self.load(model_file, backend), model_file, backend)
+        except Exception as e:
+            if on_error:
+                on_error(model_file, backend, e)
+        finally:
+            with self._lock:
+                self._loading.discard((model_file, backend))
+
+    def _warm_up(self, model):
+        """ First inferences are slow (memory allocation, JIT optimizations, ...), so do them before using the model """
+        image_size = CropPreprocessor().image_size
+        with torch.no_grad():
+            model(torch.zeros(self.warmup_batch_size, 3, image_size, image_size))
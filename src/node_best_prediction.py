@@ -1,61 +1,177 @@
 #!/usr/bin/env python3
 
+from node_startup import StartupProfile, wait_for_services, lazy_import, PersistentServiceProxy
 import rospy
 import math
-from raiv_libraries.cnn import Cnn
-from raiv_libraries.rgb_cnn import RgbCnn
 from raiv_research.srv import GetBestPrediction, GetBestPredictionResponse
 from raiv_research.msg import Prediction, ListOfPredictions
-from raiv_research.msg import RgbAndDepthImages
+from raiv_research.msg import RgbAndDepthImages, CompressedRgbAndDepthImages, SharedFrame
 from raiv_libraries.srv import get_coordservice
 from raiv_libraries.srv import PickingBoxIsEmpty
 from raiv_libraries.srv import ClearPrediction, ClearPredictionResponse
 from raiv_research.srv import ProcessNewImage, ProcessNewImageResponse
-from raiv_libraries.get_coord_node import InBoxCoord
-from raiv_libraries.image_tools import ImageTools
+from raiv_research.srv import LoadModel, LoadModelResponse
 from sensor_msgs.msg import Image
+from std_msgs.msg import Bool
+from prediction_convergence import PredictionConvergence
+from prediction_cache import PredictionCache
+from ros_image import ros_msg_to_numpy
+from inference_backend import load_inference_model, backend_from_file, BACKENDS
+from latency_metrics import LatencyRecorder
+from sampling_profiler import advertise_profile_service
+from image_compression import ImageCompressor, RGB_FORMATS, DEPTH_FORMATS, NEW_IMAGES_TOPIC, COMPRESSED_NEW_IMAGES_TOPIC
+from shared_frames import SharedFrameWriter, SHARED_FRAMES_TOPIC
+from prediction_retention import RETENTION_POLICIES
+from prediction_log import PredictionLog
+import threading
 import PIL
+# Heavy imports (torch, raiv_libraries CNNs), done at their first use : not for --help
+InBoxCoord = lazy_import('raiv_libraries.get_coord_node', 'InBoxCoord')
+ImageTools = lazy_import('raiv_libraries.image_tools', 'ImageTools')
+CropPreprocessor = lazy_import('crop_preprocessing', 'CropPreprocessor')
+ModelRegistry = lazy_import('model_registry', 'ModelRegistry')
+InferenceWorkerPool = lazy_import('inference_workers', 'InferenceWorkerPool')
+CandidatePrefetcher = lazy_import('candidate_prefetch', 'CandidatePrefetcher')
+Cnn = lazy_import('raiv_libraries.cnn', 'Cnn')  # Only used without CropPreprocessor
+RgbCnn = lazy_import('raiv_libraries.rgb_cnn', 'RgbCnn')
 
 
 RGB_IMAGE_TOPIC = "/camera/color/image_raw"
 DEPTH_IMAGE_TOPIC = "/camera/aligned_depth_to_color/image_raw"
 DEBUG = False
 
+
+class RosInterface:
+    """
+    Node initialization, services and topics used or provided by NodeBestPrediction, with rospy.
+    replay_benchmark.py gives local stand-ins instead, to run the same node without ROS master.
+    """
+    def init_node(self, name):
+        if not rospy.core.is_initialized():  # Else, several pipelines run in the same node (see node_multi_best_prediction.py)
+            rospy.init_node(name)
+            advertise_profile_service()  # /node_best_prediction/profile
+
+    def service(self, name, service_class, handler):
+        return rospy.Service(name, service_class, handler)
+
+    def publisher(self, name, msg_class, **kwargs):
+        return rospy.Publisher(name, msg_class, **kwargs)
+
+    def wait_for_services(self, services, persistent=(), profile=None):
+        return wait_for_services(services, persistent, profile=profile)
+
+    def persistent_proxy(self, name, service_class):
+        return PersistentServiceProxy(name, service_class)
+
+    def on_shutdown(self, hook):
+        rospy.on_shutdown(hook)
+
+
 class NodeBestPrediction:
     """
     This node is both a service and a publisher.
     * Service best_prediction_service : use a GetBestPrediction message (no input message and a ListOfPredictions output message)
     When this service is called, return the current best prediction and invalidate all the predictions in its neighborhood.
     * Publisher : publish on the 'predictions' topic a ListOfPredictions message
+    * Publisher : publish on the 'raiv_metrics' topic a MetricsSummary message with the latency of each processing stage
+    * Publisher : publish on the 'new_images' topic a RgbAndDepthImages message for each new image, and on the
+    'new_images_compressed' topic the same images compressed (CompressedRgbAndDepthImages) if an ImageCompressor is given
+    * Publisher : publish on the 'new_images_shm' topic a SharedFrame message if a SharedFrameWriter is given : the
+    images are written in a shared memory ring buffer, read without copy by the nodes of the same host
+    * Publisher : publish on the 'frame_settled' topic a Bool message, True when the predictions for the current frame
+    have converged (inference is paused), False when inference resumes (new image)
 
     How to run?
     * roslaunch realsense2_camera rs_camera.launch align_depth:=true (to provide a /camera/color/image_raw topic)
     * rosrun raiv_research node_visu_prediction.py   (to view the success/fail prediction points on the image)
     * rosrun raiv_research node_best_prediction.py CKPT_FILE --invalidation_radius INT --image_topic STR (to provide a /predictions topic)
     * rosservice call /best_prediction_service  (to get the current best prediction. It loads a new image and invalidates the points in the picking zone)
+    * rosservice call /load_model MODEL_FILE BACKEND  (to replace the model without restarting the node, BACKEND can be '' to guess it from the file extension)
+
+    With a namespace, all the services and topics (used or provided) are prefixed by it, so several pipelines (one per
+    camera and picking box) can run in the same node with a shared model, see node_multi_best_prediction.py.
+
+    With an InferenceWorkerPool ('--workers N'), each batch has batch_size points per worker and the probas are computed
+    by the N worker processes (disjoint sets of points), this node merges them and serves /best_prediction_service.
+
+    All the ROS calls of the constructor go through 'ros' (a RosInterface object by default), replaced by local
+    stand-ins in replay_benchmark.py.
 
     """
-    def __init__(self, ckpt_model_file, invalidation_radius, image_topic):
-        rospy.init_node('node_best_prediction')
+    def __init__(self, ckpt_model_file, invalidation_radius, image_topic, *, convergence=None, cache=None, preprocessor=None, batch_size=1, backend='eager', max_models=3, metrics_period=5.0, compressor=None, shared_frames=None, workers=None,
+                 namespace='', registry=None, scheduler=None, retention=None, prediction_log=None, prefetch_threads=0, ros=None):
+        self.namespace = namespace.rstrip('/')  # Prefix of all the services and topics ('' or '/bin1' for example)
+        ns = self.namespace
+        self.ros = ros = ros or RosInterface()
+        startup = StartupProfile(f'node_best_prediction{ns}')
+        with startup.step('init_node'):
+            ros.init_node('node_best_prediction')
         # Provide these services
-        rospy.Service('/best_prediction_service', GetBestPrediction, self._best_prediction_service)
-        rospy.Service('/Process_new_images', ProcessNewImage, self._process_new_images)
+        ros.service(f'{ns}/best_prediction_service', GetBestPrediction, self._best_prediction_service)
+        ros.service(f'{ns}/Process_new_images', ProcessNewImage, self._process_new_images)
+        ros.service(f'{ns}/load_model', LoadModel, self._load_model)
         # Publish these topics
-        self.pub_images = rospy.Publisher('/new_images', RgbAndDepthImages, queue_size=10)
-        self.pub_predictions = rospy.Publisher('/predictions', ListOfPredictions, queue_size=10)
+        self.pub_images = ros.publisher(f'{ns}/{NEW_IMAGES_TOPIC}', RgbAndDepthImages, queue_size=10)
+        self.compressor = compressor  # ImageCompressor object or None (no compressed images)
+        if compressor:
+            self.pub_compressed_images = ros.publisher(f'{ns}/{COMPRESSED_NEW_IMAGES_TOPIC}', CompressedRgbAndDepthImages, queue_size=10)
+        self.shared_frames = shared_frames  # SharedFrameWriter object or None (no shared memory)
+        if shared_frames:
+            self.pub_shared_frames = ros.publisher(f'{ns}/{SHARED_FRAMES_TOPIC}', SharedFrame, queue_size=10)
+            ros.on_shutdown(shared_frames.close)
+        self.pub_predictions = ros.publisher(f'{ns}/predictions', ListOfPredictions, queue_size=10)
+        self.pub_frame_settled = ros.publisher(f'{ns}/frame_settled', Bool, queue_size=10, latch=True)
+        self.metrics = LatencyRecorder(f'node_best_prediction{ns}', metrics_period)  # Latency of each processing stage
         ### Use these services
-        rospy.wait_for_service('/Is_Picking_Box_Empty')
-        self.is_picking_box_empty_service = rospy.ServiceProxy('/Is_Picking_Box_Empty', PickingBoxIsEmpty)
-        rospy.wait_for_service('/In_box_coordService')
-        self.coord_serv = rospy.ServiceProxy('/In_box_coordService', get_coordservice)
+        # Persistent connections : called for each point and each loop of generate_predictions()
+        services = ros.wait_for_services({f'{ns}/Is_Picking_Box_Empty': PickingBoxIsEmpty, f'{ns}/In_box_coordService': get_coordservice},
+                                     persistent=[f'{ns}/Is_Picking_Box_Empty', f'{ns}/In_box_coordService'], profile=startup)
+        self.is_picking_box_empty_service = services[f'{ns}/Is_Picking_Box_Empty']
+        self.coord_serv = services[f'{ns}/In_box_coordService']
         # Attributs
         self.invalidation_radius = invalidation_radius  # When a prediction is selected, we invalidate all the previous predictions in this radius
         self.image_topic = image_topic
         self.model_path = ckpt_model_file
-        self.model = RgbCnn.load_ckpt_model_file(self.model_path)   # Load the selected model
+        self.backend = backend
+        if registry is None:
+            registry = ModelRegistry(max_models, batch_size)
+        self.registry = registry  # Models already loaded (shared by the pipelines of a node), to switch between them instantly
+        self.model = None  # With worker processes, only the workers load the model
+        if not workers:
+            self.model = self.registry.get(self.model_path, backend)  # Already loaded by another pipeline of this node
+            if self.model is None:
+                with startup.step('load_model'):
+                    self.model = load_inference_model(self.model_path, backend)   # Load the selected model
+                self.registry.add(self.model, self.model_path, self.backend)
+        self.model_lock = threading.Lock()  # To swap (model, backend, preprocessor) between two batches
         self.picking_point = None # No picking point yet
         self.prediction_processing = False
         self.predictions = [] # List of all predictions made for some random points
+        self.retention = retention  # RetentionPolicy object bounding the size of self.predictions, or None (keep all)
+        self.convergence = convergence  # PredictionConvergence object or None (no early stopping)
+        self.frame_settled = False  # True when inference is paused for the current frame
+        self.cache = cache  # PredictionCache object or None (always do inference)
+        self.frame_id = 0  # Incremented for each new image, used in the cache key
+        self.frame_msg = None  # Current RGB Image message
+        self.frame = None  # Current RGB image as a (H, W, 3) uint8 numpy array (no copy), only with a preprocessor
+        self.frame_descriptor = None  # Current RGB image in the shared memory of the InferenceWorkerPool
+        if backend != 'eager' and preprocessor is None:  # Exported models only accept tensor batches
+            preprocessor = CropPreprocessor()
+        self.preprocessor = preprocessor  # CropPreprocessor object or None (crops processed one by one with PIL)
+        self.batch_size = batch_size  # Number of random points processed by each inference
+        self.workers = workers  # InferenceWorkerPool object or None (inference in this process)
+        self.scheduler = scheduler  # BatchScheduler object shared by the pipelines of a node, or None (inference in this thread)
+        if workers:
+            ros.on_shutdown(workers.close)
+        self.prefetcher = None  # CandidatePrefetcher object or None (points drawn one by one before each inference)
+        if prefetch_threads > 0:
+            self.prefetcher = CandidatePrefetcher(lambda: ros.persistent_proxy(f'{ns}/In_box_coordService', get_coordservice), prefetch_threads)
+            ros.on_shutdown(self.prefetcher.close)
+        self.prediction_log = prediction_log  # PredictionLog object or None (no log)
+        if prediction_log:
+            ros.on_shutdown(prediction_log.close)
+        self.ind_image = 0  # Index of images saved in DEBUG mode
+        startup.report()
 
         #self._process_new_image(None)
 
@@ -66,31 +182,104 @@ class NodeBestPrediction:
         # Message used to send the list of all predictions
         msg_list_pred = ListOfPredictions()
         #self.coord_serv('random', InBoxCoord.PICK, InBoxCoord.ON_OBJECT, ImageTools.CROP_WIDTH, ImageTools.CROP_HEIGHT, None, None)
-        ind_image = 0
         while not self._is_picking_box_empty():
-            if self.prediction_processing:
-                # Ask 'In_box_coordService' service for a random point in the picking box located on one of the objects
-                resp = self.coord_serv('random_no_refresh', InBoxCoord.PICK, InBoxCoord.ON_OBJECT, ImageTools.CROP_WIDTH, ImageTools.CROP_HEIGHT, None, None)
-                #if self._not_in_picking_zone(resp.x_pixel, resp.y_pixel):   # Compute prediction only for necessary points (on an object, not in forbidden zone, ...)
-                msg = Prediction()
-                msg.x = resp.x_pixel
-                msg.y = resp.y_pixel
-                image_pil = ImageTools.ros_msg_to_pil(resp.rgb_crop)
-                # Compute the prediction for this cropped image
-                pred = RgbCnn.predict_from_pil_rgb_image(self.model, image_pil)
-                msg.proba, _ = Cnn.compute_prob_and_class(pred)
-                if DEBUG:
-                    # Save image for DEBUG
-                    name = f'img_{ind_image}_{msg.x}_{msg.y}_{msg.proba*100:.2f}.png'
-                    image_pil.save('../images_debug/'+name)
-                    ind_image += 1
-                self.predictions.append(msg)
-                #self.predictions.sort(key=lambda x: x.proba, reverse=True)  # sort by decreasing proba
-                msg_list_pred.predictions = self.predictions
-                self.pub_predictions.publish(msg_list_pred)  # Publish the current list of predictions [ [x1,y1,prediction_1], ..... ]
+            if self.prediction_processing and not self.frame_settled:
+                self._process_batch(msg_list_pred)
             rospy.sleep(0.001)
         print('End of bin picking operation')
 
+    def _process_batch(self, msg_list_pred):
+        """
+        Compute the predictions for 'batch_size' random points, add them to self.predictions and publish the list.
+        Return the list of the new Prediction messages.
+        """
+        # The frame can be changed by /Process_new_images during this batch (frame_id is updated last by _new_frame)
+        frame_id, frame, frame_descriptor = self.frame_id, self.frame, self.frame_descriptor
+        with self.model_lock:  # The model can be changed by /load_model during this batch
+            model, preprocessor = self.model, self.preprocessor
+        new_msgs = []  # Predictions for the points not in cache
+        new_resps = []
+        new_keys = []
+        probas = []  # All the probas of this batch (cached or not), for the convergence criterion
+        nb_points = self.batch_size * self.workers.nb_workers if self.workers else self.batch_size
+        if self.prefetcher:  # Points already drawn in background
+            with self.metrics.measure('coord_service'):
+                resps = self.prefetcher.get(frame_id, nb_points)
+        else:
+            resps = []
+            for _ in range(nb_points):
+                # Ask 'In_box_coordService' service for a random point in the picking box located on one of the objects
+                with self.metrics.measure('coord_service'):
+                    resps.append(self.coord_serv('random_no_refresh', InBoxCoord.PICK, InBoxCoord.ON_OBJECT, ImageTools.CROP_WIDTH, ImageTools.CROP_HEIGHT, None, None))
+        for resp in resps:
+            #if self._not_in_picking_zone(resp.x_pixel, resp.y_pixel):   # Compute prediction only for necessary points (on an object, not in forbidden zone, ...)
+            msg = Prediction()
+            msg.x = resp.x_pixel
+            msg.y = resp.y_pixel
+            cache_key = self.cache.key(frame_id, msg.x, msg.y, resp.rgb_crop.data) if self.cache is not None else None
+            cached_proba = self.cache.get(cache_key) if self.cache is not None else None
+            if cached_proba is not None:  # Already computed for this point on this frame, no inference
+                probas.append(cached_proba)
+            else:
+                new_msgs.append(msg)
+                new_resps.append(resp)
+                new_keys.append(cache_key)
+        # Compute the predictions for these cropped images
+        new_probas = self._compute_probas(new_resps, frame, model, preprocessor, frame_descriptor) if new_msgs else []
+        if new_probas is None or frame_id != self.frame_id:  # The frame has been replaced during this batch
+            return []  # Points and probas of the previous frame, not added to the predictions of the new one
+        if new_msgs:
+            for msg, cache_key, proba in zip(new_msgs, new_keys, new_probas):
+                msg.proba = proba
+                if self.cache is not None:
+                    self.cache.put(cache_key, msg.proba)
+                probas.append(msg.proba)
+            self.predictions.extend(new_msgs)
+            if self.retention:
+                self.predictions = self.retention.update(self.predictions, new_msgs)
+            #self.predictions.sort(key=lambda x: x.proba, reverse=True)  # sort by decreasing proba
+            msg_list_pred.predictions = self.predictions
+            with self.metrics.measure('publish'):
+                self.pub_predictions.publish(msg_list_pred)  # Publish the current list of predictions [ [x1,y1,prediction_1], ..... ]
+            if self.prediction_log:
+                self.prediction_log.log_predictions(frame_id, new_msgs)
+        if self.convergence and any([self.convergence.update(proba) for proba in probas]):
+            self._set_frame_settled(True)
+        return new_msgs
+
+    def _compute_probas(self, resps, frame, model, preprocessor, frame_descriptor=None):
+        """
+        Return the list of success probas for the crops of the In_box_coordService responses.
+        With a CropPreprocessor, the crops are cut from the current frame and processed as one batch, without PIL.
+        Otherwise, each crop from the response is converted to a PIL image and processed one by one.
+        With worker processes, the crops are cut from the frame of the shared memory described by frame_descriptor,
+        return None if it has been overwritten during the inference.
+        """
+        if self.workers:
+            with self.metrics.measure('inference'):
+                return self.workers.compute_probas([(resp.x_pixel, resp.y_pixel) for resp in resps], frame_descriptor)
+        if preprocessor is not None and frame is not None:
+            with self.metrics.measure('crop_decoding'):
+                batch = preprocessor(frame, [(resp.x_pixel, resp.y_pixel) for resp in resps])
+            with self.metrics.measure('inference'):
+                if self.scheduler:  # Batched with the crops of the other pipelines
+                    return self.scheduler.compute_probas(model, batch)
+                return CropPreprocessor.probas_of_success(CropPreprocessor.predict(model, batch))
+        probas = []
+        for resp in resps:
+            with self.metrics.measure('crop_decoding'):
+                image_pil = ImageTools.ros_msg_to_pil(resp.rgb_crop)
+            with self.metrics.measure('inference'):
+                pred = RgbCnn.predict_from_pil_rgb_image(model, image_pil)
+            proba, _ = Cnn.compute_prob_and_class(pred)
+            probas.append(proba)
+            if DEBUG:
+                # Save image for DEBUG
+                name = f'img_{self.ind_image}_{resp.x_pixel}_{resp.y_pixel}_{proba*100:.2f}.png'
+                image_pil.save('../images_debug/'+name)
+                self.ind_image += 1
+        return probas
+
     # Methods used when a service is called
     #
     def _process_new_images(self, req):
@@ -98,15 +287,53 @@ class NodeBestPrediction:
         Get new RGB and DEPTH images and publish them to the new_images topic (for node_visu_prediction.py and get_coord_node.py)
         Called by /Process_new_images service
         """
-        msg_image = rospy.wait_for_message(RGB_IMAGE_TOPIC, Image)
-        msg_depth_image = rospy.wait_for_message(DEPTH_IMAGE_TOPIC, Image)
+        with self.metrics.measure('wait_new_images'):
+            msg_image = rospy.wait_for_message(f'{self.namespace}{RGB_IMAGE_TOPIC}', Image)
+            msg_depth_image = rospy.wait_for_message(f'{self.namespace}{DEPTH_IMAGE_TOPIC}', Image)
         msg = RgbAndDepthImages()
         msg.rgb_image = msg_image
         msg.depth_image = msg_depth_image
-        self.pub_images.publish(msg)
+        with self.metrics.measure('publish_new_images'):
+            self.pub_images.publish(msg)
+        if self.compressor and self.pub_compressed_images.get_num_connections() > 0:  # Compress only if someone listens
+            with self.metrics.measure('compress_new_images'):
+                compressed_msg = self.compressor.compress(msg_image, msg_depth_image)
+            with self.metrics.measure('publish_compressed_images'):
+                self.pub_compressed_images.publish(compressed_msg)
+        if self.shared_frames and self.pub_shared_frames.get_num_connections() > 0:
+            with self.metrics.measure('write_shared_frame'):
+                descriptor = self.shared_frames.write(msg_image, msg_depth_image)
+            self.pub_shared_frames.publish(descriptor)
+        self._new_frame(msg_image)
+        return ProcessNewImageResponse()
+
+    def _new_frame(self, msg_image):
+        """ Reset the predictions and start the processing of a new RGB image """
+        if self.cache is not None:
+            rospy.loginfo(f'Prediction cache : {self.cache.stats()}')
+            self.cache.clear()  # Predictions from the previous frame are no more valid
+        self.frame_msg = msg_image
+        self.frame = self._numpy_frame(msg_image) if self.preprocessor is not None and not self.workers else None
+        if self.workers:
+            self.frame_descriptor = self.workers.set_frame(msg_image)
+        self.frame_id += 1  # Last, a batch reading the new frame_id also reads the new frame
+        if self.prefetcher:
+            self.prefetcher.set_frame(self.frame_id)
         self.predictions = []
+        if self.retention:
+            self.retention.reset()
         self.prediction_processing = True
-        return ProcessNewImageResponse()
+        if self.convergence:
+            self.convergence.reset()
+        self._set_frame_settled(False)
+
+    def _numpy_frame(self, msg_image):
+        """ The RGB image as a numpy array for the preprocessor, or None (crops processed with PIL) if its encoding is not supported """
+        try:
+            return ros_msg_to_numpy(msg_image, rgb=True)
+        except KeyError:
+            rospy.logwarn_throttle(60, f'Image encoding {msg_image.encoding} not supported by the tensor preprocessing, crops processed with PIL')
+            return None
 
     def _best_prediction_service(self, req):
         """
@@ -119,10 +346,62 @@ class NodeBestPrediction:
             best_prediction = max(self.predictions, key=lambda p: p.proba)
             print(f'Best prediction = {best_prediction}')
             self.picking_point = (best_prediction.x, best_prediction.y)
+            if self.prediction_log:
+                self.prediction_log.log('best', self.frame_id, best_prediction.x, best_prediction.y, best_prediction.proba)
             return GetBestPredictionResponse(best_prediction)
 
+    def _load_model(self, req):
+        """
+        Load a new model in background and use it as soon as it is ready. The current model is used until then.
+        With worker processes, answer when all the workers have loaded and warmed up the model (error if one fails).
+        Called by /load_model service
+        """
+        backend = req.backend or backend_from_file(req.model_file)
+        if backend not in BACKENDS:
+            return LoadModelResponse(False, f'Unknown backend {backend}, must be one of {BACKENDS}')
+        if self.workers:
+            try:
+                self.workers.load_model(req.model_file, backend)
+            except RuntimeError as e:
+                rospy.logerr(str(e))
+                return LoadModelResponse(False, str(e))
+            self._swap_model(None, req.model_file, backend)
+            return LoadModelResponse(True, f'{req.model_file} ({backend}) loaded by the {self.workers.nb_workers} inference workers, now in use')
+        model = self.registry.get(req.model_file, backend)
+        if model is not None:  # Already loaded, switch now
+            self._swap_model(model, req.model_file, backend)
+            return LoadModelResponse(True, f'{req.model_file} ({backend}) already loaded, now in use')
+        if not self.registry.load_in_background(req.model_file, backend, self._swap_model, self._model_loading_error):
+            return LoadModelResponse(False, f'{req.model_file} ({backend}) is already loading')
+        return LoadModelResponse(True, f'Loading {req.model_file} ({backend}) in background')
+
     # Other methods
 
+    def _swap_model(self, model, model_file, backend):
+        """ Use this model (already loaded and warmed up, None with worker processes) for the next batches """
+        with self.model_lock:
+            if backend != 'eager' and self.preprocessor is None:  # Exported models only accept tensor batches
+                self.preprocessor = CropPreprocessor()
+                if self.frame_msg is not None and not self.workers:
+                    self.frame = self._numpy_frame(self.frame_msg)
+            self.model, self.model_path, self.backend = model, model_file, backend
+            if self.cache is not None:
+                self.cache.clear()  # Cached probas come from the previous model
+            if self.prediction_log:
+                self.prediction_log.set_metadata(model=model_file, backend=backend)  # New log segment
+        rospy.loginfo(f'Model {model_file} ({backend}) in use' + ('' if self.workers else f', loaded models : {self.registry.loaded_models()}'))
+
+    def _model_loading_error(self, model_file, backend, error):
+        rospy.logerr(f'Unable to load model {model_file} ({backend}) : {error}')
+
+    def _set_frame_settled(self, settled):
+        """ Pause (settled=True) or resume (settled=False) the inference and publish the event on /frame_settled """
+        if settled != self.frame_settled:
+            self.frame_settled = settled
+            if settled:
+                rospy.loginfo(f'Frame settled after {self.convergence.nb_predictions} predictions, best proba = {self.convergence.best:.3f}')
+            self.pub_frame_settled.publish(Bool(settled))
+
     def _is_picking_box_empty(self):
         """
         Test if picking box is empty.
@@ -153,12 +432,58 @@ if __name__ == '__main__':
     import argparse
     # Analyse arguments
     parser = argparse.ArgumentParser(description='Compute a list of predictions for random points and provide the best one as a service.')
-    parser.add_argument('ckpt_model_file', type=str, help='CKPT model file')
+    parser.add_argument('ckpt_model_file', type=str, help='CKPT model file (or .pt / .onnx / .int8.pt file created by export_model.py or quantize_model.py)')
+    parser.add_argument('--backend', type=str, default='eager', choices=BACKENDS, help='Inference backend (all backends except eager use the tensor preprocessing)')
     parser.add_argument('--image_topic', type=str, default="/camera/color/image_raw", help='Topic which provides an image')
     parser.add_argument('--invalidation_radius', type=int, default=30, help='Radius in pixels where predictions will be invalidated')
+    parser.add_argument('--patience', type=int, default=0, help='Pause inference when best and top-K probas have not improved for this number of predictions (0 : never pause)')
+    parser.add_argument('--convergence_tolerance', type=float, default=0.001, help='Minimal proba variation considered as an improvement')
+    parser.add_argument('--top_k', type=int, default=10, help='Number of best predictions used by the convergence criterion')
+    parser.add_argument('--min_predictions', type=int, default=100, help='Minimal number of predictions for a frame before pausing inference')
+    parser.add_argument('--cache_size', type=int, default=0, help='Max number of predictions in the cache used to skip duplicate inferences (0 : no cache)')
+    parser.add_argument('--cache_quantum', type=int, default=2, help='Points closer than this number of pixels share the same cached prediction')
+    parser.add_argument('--cache_crop_hash', default=False, action='store_true', help='Add a hash of the crop content to the cache key')
+    parser.add_argument('--tensor_preprocessing', default=False, action='store_true', help='Cut, resize and normalize the crops as one tensor batch (no PIL)')
+    parser.add_argument('--batch_size', type=int, default=1, help='Number of random points processed by each inference')
+    parser.add_argument('--metrics_period', type=float, default=5.0, help='Period (in s) of the latency summary published on /raiv_metrics (0 : no publication)')
+    parser.add_argument('--max_models', type=int, default=3, help='Number of models kept loaded to switch between them with /load_model')
+    parser.add_argument('--compressed_images', default=False, action='store_true', help='Also publish the new images compressed on /new_images_compressed')
+    parser.add_argument('--rgb_compression', type=str, default='jpeg', choices=RGB_FORMATS, help='Format of the compressed RGB image')
+    parser.add_argument('--depth_compression', type=str, default='png', choices=DEPTH_FORMATS, help='Format of the compressed depth image (lossless)')
+    parser.add_argument('--jpeg_quality', type=int, default=90, help='Quality of the JPEG RGB image [0,100]')
+    parser.add_argument('--shared_memory', default=False, action='store_true', help='Also write the new images in a shared memory ring buffer, described on /new_images_shm')
+    parser.add_argument('--shared_memory_slots', type=int, default=4, help='Number of frames of the shared memory ring buffer')
+    parser.add_argument('--retention', type=str, default=None, choices=list(RETENTION_POLICIES), help='Policy bounding the number of predictions kept for a frame (default : keep all)')
+    parser.add_argument('--max_predictions', type=int, default=5000, help='Max number of predictions kept for a frame with a retention policy')
+    parser.add_argument('--prediction_log', type=str, default=None, help='Folder of the append-only log of the predictions (see prediction_log.py)')
+    parser.add_argument('--workers', type=int, default=0, help='Number of inference worker processes (0 : inference in the node process), batch_size points per worker')
+    parser.add_argument('--prefetch_threads', type=int, default=None, help='Number of threads drawing the random points in background (default : one per worker, 0 without workers)')
     args = parser.parse_args()
+    preprocessor = CropPreprocessor() if args.tensor_preprocessing else None
+    cache = None
+    if args.cache_size > 0:
+        cache = PredictionCache(args.cache_size, args.cache_quantum, args.cache_crop_hash)
+    convergence = None
+    if args.patience > 0:
+        convergence = PredictionConvergence(args.patience, args.convergence_tolerance, args.top_k, args.min_predictions)
+    compressor = None
+    if args.compressed_images:
+        compressor = ImageCompressor(args.rgb_compression, args.depth_compression, args.jpeg_quality)
+    shared_frames = SharedFrameWriter(args.shared_memory_slots) if args.shared_memory else None
+    retention = RETENTION_POLICIES[args.retention](args.max_predictions) if args.retention else None
+    prediction_log = None
+    if args.prediction_log:
+        prediction_log = PredictionLog(args.prediction_log, 'node_best_prediction', {'model': args.ckpt_model_file, 'backend': args.backend})
+    workers = InferenceWorkerPool(args.ckpt_model_file, args.backend, args.workers, max_models=args.max_models,
+                                  warmup_batch_size=args.batch_size) if args.workers > 0 else None
     try:
-        node_best_pred = NodeBestPrediction(args.ckpt_model_file, args.invalidation_radius, args.image_topic)
+        node_best_pred = NodeBestPrediction(args.ckpt_model_file, args.invalidation_radius, args.image_topic,
+                                            convergence=convergence, cache=cache, preprocessor=preprocessor,
+                                            batch_size=args.batch_size, backend=args.backend, max_models=args.max_models,
+                                            metrics_period=args.metrics_period, compressor=compressor,
+                                            shared_frames=shared_frames, workers=workers, retention=retention,
+                                            prediction_log=prediction_log,
+                                            prefetch_threads=args.workers if args.prefetch_threads is None else args.prefetch_threads)
         node_best_pred.generate_predictions()
     except rospy.ROSInterruptException:
         pass
\ No newline at end of file
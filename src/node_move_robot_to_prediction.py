@@ -1,17 +1,20 @@
 #!/usr/bin/env python
 # coding: utf-8
 
+from node_startup import StartupProfile, wait_for_services, lazy_import
 import rospy
-from raiv_camera_calibration.perspective_calibration import PerspectiveCalibration
-from raiv_libraries.robotUR import RobotUR
-from raiv_libraries.robot_with_vaccum_gripper import Robot_with_vaccum_gripper
 from raiv_research.srv import GetBestPrediction, ProcessNewImage
 import geometry_msgs.msg as geometry_msgs
-from raiv_libraries.image_tools import ImageTools
 from raiv_libraries.get_coord_node import InBoxCoord
 from raiv_libraries.srv import get_coordservice, PickingBoxIsEmpty, GetPickingBoxCentroid
 from raiv_libraries.srv import ClearPrediction
 from raiv_libraries import tools
+from cycle_time_recorder import CycleTimeRecorder
+from prediction_log import PredictionLog
+PerspectiveCalibration = lazy_import('raiv_camera_calibration.perspective_calibration', 'PerspectiveCalibration')
+RobotUR = lazy_import('raiv_libraries.robotUR', 'RobotUR')
+Robot_with_vaccum_gripper = lazy_import('raiv_libraries.robot_with_vaccum_gripper', 'Robot_with_vaccum_gripper')
+ImageTools = lazy_import('raiv_libraries.image_tools', 'ImageTools')
 
 Z_PICK_ROBOT = 0.12  # Z coord before going down to pick
 X_OUT = 0.21  # XYZ coord where the robot is out of camera scope
@@ -21,24 +24,13 @@ X_PLACE = -0.003
 Y_PLACE = -0.29
 Z_PLACE = 0.16  # Z coord to start place movement (in meter)
 
-# Declaration of services
-#
-# best_prediction_service
-rospy.wait_for_service('/best_prediction_service')
-best_prediction_service = rospy.ServiceProxy('/best_prediction_service', GetBestPrediction)
-# Clear_Prediction
-# GetNewImage
-rospy.wait_for_service('/Process_new_images')
-process_new_image_service = rospy.ServiceProxy('/Process_new_images', ProcessNewImage)
-# In_box_coordService
-rospy.wait_for_service('/In_box_coordService')
-coord_service = rospy.ServiceProxy('/In_box_coordService', get_coordservice)
-# Is_Picking_Box_Empty
-rospy.wait_for_service('/Is_Picking_Box_Empty')
-is_picking_box_empty_service = rospy.ServiceProxy('/Is_Picking_Box_Empty', PickingBoxIsEmpty)
-# Get_picking_box_centroid
-rospy.wait_for_service('/Get_picking_box_centroid')
-get_picking_box_centroid_service = rospy.ServiceProxy('/Get_picking_box_centroid', GetPickingBoxCentroid)
+# Services used by this node (waited for at the same time in main), the persistent ones are called at each cycle
+SERVICES = {'/best_prediction_service': GetBestPrediction,
+            '/Process_new_images': ProcessNewImage,
+            '/In_box_coordService': get_coordservice,
+            '/Is_Picking_Box_Empty': PickingBoxIsEmpty,
+            '/Get_picking_box_centroid': GetPickingBoxCentroid}
+PERSISTENT_SERVICES = ['/best_prediction_service', '/Process_new_images', '/In_box_coordService', '/Is_Picking_Box_Empty']
 
 if __name__ == "__main__":
     import argparse
@@ -46,36 +38,70 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description='Perform robot pick action at location received by best_prediction_service response')
     parser.add_argument('calibration_folder', type=str, help='calibration files folder')
+    parser.add_argument('--cycle_log', type=str, default=None, help='CSV file where the duration of each phase of the pick cycles is appended (default : no log)')
+    parser.add_argument('--prediction_log', type=str, default=None, help='Folder of the append-only log where each pick and its grip outcome are written (see prediction_log.py)')
     args = parser.parse_args()
 
-    rospy.init_node("node_move_robot_to_prediction")
-    persp_calib = PerspectiveCalibration(args.calibration_folder)
-    robot = Robot_with_vaccum_gripper()
-    picking_box_centroid = get_picking_box_centroid_service()
+    startup = StartupProfile('node_move_robot_to_prediction')
+    with startup.step('init_node'):
+        rospy.init_node("node_move_robot_to_prediction")
+    services = wait_for_services(SERVICES, PERSISTENT_SERVICES, profile=startup)
+    best_prediction_service = services['/best_prediction_service']
+    process_new_image_service = services['/Process_new_images']
+    coord_service = services['/In_box_coordService']
+    is_picking_box_empty_service = services['/Is_Picking_Box_Empty']
+    with startup.step('calibration'):
+        persp_calib = PerspectiveCalibration(args.calibration_folder)
+    with startup.step('robot'):
+        robot = Robot_with_vaccum_gripper()
+    picking_box_centroid = services['/Get_picking_box_centroid']()
+    startup.report()
+
+    cycle_recorder = CycleTimeRecorder(args.cycle_log, 'node_move_robot_to_prediction')
+    prediction_log = None
+    if args.prediction_log:
+        prediction_log = PredictionLog(args.prediction_log, 'node_move_robot_to_prediction')
+        rospy.on_shutdown(prediction_log.close)
+    nb_picks = 0
 
     # The robot must go out of the camera field
     robot.go_to_xyz_position(X_OUT, Y_OUT, Z_OUT, duration=2)
     process_new_image_service()  # Ask for a new image and start its processing (generation of predictions)
+    cycle_recorder.start_cycle()
     while not is_picking_box_empty_service().empty_box:
         # Go to box centroid, during this time, predictions are processed
-        coord_centroid = [picking_box_centroid.x_centroid, picking_box_centroid.y_centroid]
-        x, y, z = persp_calib.from_2d_to_3d(coord_centroid)
-        robot.go_to_xyz_position(x, y, Z_PICK_ROBOT, duration=2)
-        resp = best_prediction_service()  # We can now ask a service to get the best prediction
+        with cycle_recorder.phase('move_to_centroid'):
+            coord_centroid = [picking_box_centroid.x_centroid, picking_box_centroid.y_centroid]
+            x, y, z = persp_calib.from_2d_to_3d(coord_centroid)
+            robot.go_to_xyz_position(x, y, Z_PICK_ROBOT, duration=2)
+        with cycle_recorder.phase('best_prediction_wait'):
+            resp = best_prediction_service()  # We can now ask a service to get the best prediction
         print('proba ---------------: ', resp.pred.proba)
         # Pick the piece
-        coord_pixel = [resp.pred.x, resp.pred.y]
-        x, y, z = persp_calib.from_2d_to_3d(coord_pixel)
-        pose_for_pick = geometry_msgs.Pose(geometry_msgs.Vector3(x, y, Z_PICK_ROBOT), RobotUR.tool_down_pose)
-        robot.pick(pose_for_pick)
+        with cycle_recorder.phase('pick'):
+            coord_pixel = [resp.pred.x, resp.pred.y]
+            x, y, z = persp_calib.from_2d_to_3d(coord_pixel)
+            pose_for_pick = geometry_msgs.Pose(geometry_msgs.Vector3(x, y, Z_PICK_ROBOT), RobotUR.tool_down_pose)
+            robot.pick(pose_for_pick)
         # Next, go to OUT position (out of camera scope)
-        robot.go_to_xyz_position(X_OUT, Y_OUT, Z_OUT, duration=2)  # The robot must go out of the camera field
-        process_new_image_service()  # Ask for a new image and start its processing (generation of predictions)
-        if robot.check_if_object_gripped():  # An object is gripped
+        with cycle_recorder.phase('retreat'):
+            robot.go_to_xyz_position(X_OUT, Y_OUT, Z_OUT, duration=2)  # The robot must go out of the camera field
+        with cycle_recorder.phase('new_image'):
+            process_new_image_service()  # Ask for a new image and start its processing (generation of predictions)
+        with cycle_recorder.phase('grip_check'):
+            object_gripped = robot.check_if_object_gripped()
+        nb_picks += 1
+        if prediction_log:
+            prediction_log.log('pick', nb_picks, resp.pred.x, resp.pred.y, resp.pred.proba, int(object_gripped))
+        if object_gripped:  # An object is gripped
             # Place the object
-            resp_place = coord_service('random_no_swap', InBoxCoord.PLACE, InBoxCoord.IN_THE_BOX, ImageTools.CROP_WIDTH, ImageTools.CROP_HEIGHT, None, None)
-            place_pose = tools.xyz_to_pose(X_PLACE, Y_PLACE, Z_PLACE)
-            robot.place(place_pose)
+            with cycle_recorder.phase('place'):
+                resp_place = coord_service('random_no_swap', InBoxCoord.PLACE, InBoxCoord.IN_THE_BOX, ImageTools.CROP_WIDTH, ImageTools.CROP_HEIGHT, None, None)
+                place_pose = tools.xyz_to_pose(X_PLACE, Y_PLACE, Z_PLACE)
+                robot.place(place_pose)
         else:  # Wait to let enough time for prediction computation
-            rospy.sleep(2)
-        robot.release_gripper()  # Switch off the gripper
\ No newline at end of file
+            with cycle_recorder.phase('wait_predictions'):
+                rospy.sleep(2)
+        with cycle_recorder.phase('release'):
+            robot.release_gripper()  # Switch off the gripper
+        cycle_recorder.end_cycle(object_gripped)
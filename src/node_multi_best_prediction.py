@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+"""
+One node for several picking stations : a NodeBestPrediction pipeline per namespace (camera + picking box), all
+sharing the same model instance (ModelRegistry) and one BatchScheduler which runs the crops of all the pipelines
+through the model as one batch.
+
+Each pipeline provides and uses the usual services and topics, prefixed by its namespace :
+/bin1/best_prediction_service, /bin1/Process_new_images, /bin1/predictions, /bin1/In_box_coordService,
+/bin1/camera/color/image_raw, ...
+
+How to run?
+* one camera, coord node, ... per station, in its namespace (ROS_NAMESPACE=bin1 rosrun ...)
+* rosrun raiv_research node_multi_best_prediction.py CKPT_FILE --namespaces bin1 bin2 --batch_size 16
+"""
+import threading
+import rospy
+from node_best_prediction import NodeBestPrediction
+from crop_preprocessing import CropPreprocessor
+from prediction_cache import PredictionCache
+from prediction_convergence import PredictionConvergence
+from inference_backend import BACKENDS
+from model_registry import ModelRegistry
+from batch_scheduler import BatchScheduler
+from latency_metrics import LatencyRecorder
+from sampling_profiler import advertise_profile_service
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compute the predictions of several camera / picking box pipelines with a shared model.')
+    parser.add_argument('ckpt_model_file', type=str, help='CKPT model file (or .pt / .onnx / .int8.pt file created by export_model.py or quantize_model.py)')
+    parser.add_argument('--namespaces', type=str, nargs='+', required=True, help='Namespace of each pipeline (ex : bin1 bin2)')
+    parser.add_argument('--backend', type=str, default='eager', choices=BACKENDS, help='Inference backend')
+    parser.add_argument('--image_topic', type=str, default="/camera/color/image_raw", help='Topic which provides an image')
+    parser.add_argument('--invalidation_radius', type=int, default=30, help='Radius in pixels where predictions will be invalidated')
+    parser.add_argument('--batch_size', type=int, default=16, help='Number of random points processed by each pipeline for each batch')
+    parser.add_argument('--max_batch_size', type=int, default=64, help='Max number of crops of a batch of the scheduler (all pipelines)')
+    parser.add_argument('--max_wait', type=float, default=0.002, help='Time (in s) the scheduler waits for the crops of the other pipelines')
+    parser.add_argument('--patience', type=int, default=0, help='Pause inference when best and top-K probas have not improved for this number of predictions (0 : never pause)')
+    parser.add_argument('--cache_size', type=int, default=0, help='Max number of predictions in the cache of each pipeline (0 : no cache)')
+    parser.add_argument('--max_models', type=int, default=3, help='Number of models kept loaded to switch between them with /<namespace>/load_model')
+    parser.add_argument('--metrics_period', type=float, default=5.0, help='Period (in s) of the latency summary published on /raiv_metrics (0 : no publication)')
+    args = parser.parse_args()
+
+    rospy.init_node('node_best_prediction')
+    advertise_profile_service()  # /node_best_prediction/profile
+    registry = ModelRegistry(args.max_models, args.batch_size)
+    scheduler = BatchScheduler(args.max_batch_size, args.max_wait, LatencyRecorder('batch_scheduler', args.metrics_period))
+    pipelines = []
+    for namespace in args.namespaces:
+        pipelines.append(NodeBestPrediction(args.ckpt_model_file, args.invalidation_radius, args.image_topic,
+                                            convergence=PredictionConvergence(args.patience) if args.patience > 0 else None,
+                                            cache=PredictionCache(args.cache_size) if args.cache_size > 0 else None,
+                                            preprocessor=CropPreprocessor(), batch_size=args.batch_size,
+                                            backend=args.backend, max_models=args.max_models,
+                                            metrics_period=args.metrics_period, namespace='/' + namespace.strip('/'),
+                                            registry=registry, scheduler=scheduler))
+    for pipeline in pipelines:  # Each pipeline runs its loop in its own thread, their crops are batched by the scheduler
+        threading.Thread(target=pipeline.generate_predictions, daemon=True).start()
+    rospy.Timer(rospy.Duration(60), lambda event: rospy.loginfo(f'Batch scheduler : {scheduler.stats()}'))
+    rospy.spin()
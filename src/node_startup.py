@@ -0,0 +1,115 @@
+"""
+Tools to start a node faster :
+* wait_for_services() waits for all the services a node uses at the same time (not one after the other) and
+  returns their proxies, persistent ones for the services called at high frequency
+* lazy_import() defers the import of a heavy module (torch, raiv_libraries CNNs, ...) until its first use
+* StartupProfile measures each startup step and reports the breakdown, lazy imports included
+
+Import this module first, the 'imports' step of the report is measured from its import.
+
+profile = StartupProfile('node_move_robot_to_prediction')
+services = wait_for_services({'/In_box_coordService': get_coordservice, ...}, persistent=['/In_box_coordService'], profile=profile)
+profile.report()
+"""
+import time
+_IMPORT_START = time.perf_counter()
+import threading
+from contextlib import contextmanager
+import rospy
+from lazy_imports import lazy_import, lazy_import_times  # lazy_import() is also used through this module
+
+
+def _is_handler_error(error):
+    """ True for an error raised by the service handler, False for a lost or refused connection
+    (rospy raises ServiceException in both cases, only the message differs) """
+    return isinstance(error, rospy.ServiceException) and 'responded with an error' in str(error)
+
+
+class PersistentServiceProxy:
+    """
+    ServiceProxy keeping its connection open between the calls (no TCP connection and handshake for each call).
+    If the connection is lost (the service node has been restarted), the proxy reconnects and calls again once.
+    Errors raised by the service handler are not retried.
+    """
+    def __init__(self, name, service_class):
+        self.name = name
+        self.service_class = service_class
+        self.proxy = rospy.ServiceProxy(name, service_class, persistent=True)
+
+    def __call__(self, *args, **kwargs):
+        try:
+            return self.proxy(*args, **kwargs)
+        except (rospy.ServiceException, rospy.exceptions.TransportException) as e:
+            if _is_handler_error(e):  # The call reached the service : no retry
+                raise
+            self.proxy.close()
+            rospy.wait_for_service(self.name)
+            self.proxy = rospy.ServiceProxy(self.name, self.service_class, persistent=True)
+            return self.proxy(*args, **kwargs)
+
+    def close(self):
+        self.proxy.close()
+
+
+def wait_for_services(services, persistent=(), timeout=None, profile=None):
+    """
+    Wait for all the services at the same time and return a dict : service name => proxy.
+    'services' is a dict : service name => service class. The services of 'persistent' get a PersistentServiceProxy.
+    With a StartupProfile, the wait of each service is added to the report.
+    """
+    start = time.perf_counter()
+    durations = {}
+    errors = {}
+
+    def wait(name):
+        start = time.perf_counter()
+        try:
+            rospy.wait_for_service(name, timeout)
+        except rospy.ROSException as e:
+            errors[name] = e
+        durations[name] = time.perf_counter() - start
+
+    threads = [threading.Thread(target=wait, args=(name,), daemon=True) for name in services]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if profile:
+        profile.add('services (waited in parallel)', time.perf_counter() - start)
+        for name, duration in durations.items():
+            profile.add(f'  wait {name}', duration)
+    if errors:
+        raise rospy.ROSException(f'Services not available : {", ".join(errors)}')
+    return {name: PersistentServiceProxy(name, service_class) if name in persistent else rospy.ServiceProxy(name, service_class)
+            for name, service_class in services.items()}
+
+
+class StartupProfile:
+    """ Duration of each startup step of a node, measured from the import of this module """
+    def __init__(self, node_name):
+        self.node_name = node_name
+        self.steps = [('imports', time.perf_counter() - _IMPORT_START)]
+
+    @contextmanager
+    def step(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, duration):
+        self.steps.append((name, duration))
+
+    def report(self):
+        """ Log the breakdown of the startup time """
+        total = time.perf_counter() - _IMPORT_START
+        lines = [f'{self.node_name} started in {total:.2f} s']
+        lines += [f'  {name:<40} {duration:7.3f} s' for name, duration in self.steps]
+        lines += [f'  lazy import {name:<28} {duration:7.3f} s' for name, duration in lazy_import_times.items()]
+        text = '\n'.join(lines)
+        if rospy.core.is_initialized():
+            rospy.loginfo(text)
+        else:
+            print(text)
+        return text
@@ -1,105 +1,185 @@
 #!/usr/bin/env python3
 
 import sys
+import threading
+import numpy as np
 from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
-from PyQt5.QtCore import Qt, QPoint
+from PyQt5.QtCore import Qt, QPoint, QTimer
 from PyQt5.uic import loadUi
 import rospy
 from raiv_research.msg import ListOfPredictions
-from raiv_research.msg import RgbAndDepthImages
-from raiv_libraries.image_tools import ImageTools
+from sampling_profiler import advertise_profile_service
+from qimage_tools import ros_msg_to_qimage
+from image_compression import subscribe_new_images
+
+REFRESH_RATE = 20  # Max number of redraws per second
+NB_BINS = 100  # Number of bins of the histogram
+POINT_SIZE = 3
 
 
 class NodeVisuPrediction(QWidget):
     """
     Display predictions on an image.
     Subscribe to predictions topic to get all the predictions (from best_prediction node)
-    Subscribe to new_images topic to get the new current image and replace the previous one.
+    Subscribe to new_images topic to get the new current image and replace the previous one
+    (or to new_images_compressed if compressed_images is True, only the RGB image is decoded, or to the shared memory
+    frames if shared_memory is True).
+    The ROS callbacks only store the last received messages. A timer processes them at REFRESH_RATE : only the new
+    predictions are drawn on a persistent overlay pixmap and added to the histogram counts (bar heights updated in place).
     """
-    def __init__(self):
+    def __init__(self, compressed_images=False, shared_memory=False):
         super().__init__()
         loadUi("node_visu_prediction.ui", self)
         rospy.init_node('node_visu_prediction')
-        rospy.Subscriber("predictions", ListOfPredictions, self._update_predictions)
-        rospy.Subscriber('new_images', RgbAndDepthImages, self._change_image)
+        advertise_profile_service()  # /node_visu_prediction/profile
         self.sb_low.valueChanged.connect(self._low_value_change)
         self.sb_high.valueChanged.connect(self._high_value_change)
         self.prediction_min_threshold = self.sb_low.value() / 100  # [0,1]
         self.prediction_max_threshold = self.sb_high.value() / 100
-        self.predictions = None
+        self.predictions = []  # Last list of predictions, the first nb_drawn ones are already drawn
+        self.nb_drawn = 0
+        self.best_pred = None
+        self.counts = np.zeros(NB_BINS, dtype=np.int64)  # Histogram of the probas of the drawn predictions
         self.image = None
+        self.overlay = None  # Transparent QPixmap (same size than the image) with all the drawn predictions
+        self._received_predictions = self._received_image = None  # Last messages received by the ROS callbacks
+        self._lock = threading.Lock()
+        self._init_histogram()
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self._refresh)
+        self.refresh_timer.start(int(1000 / REFRESH_RATE))
+        rospy.Subscriber("predictions", ListOfPredictions, self._update_predictions)
+        subscribe_new_images(self._change_image, compressed_images, shared_memory=shared_memory)
 
     def _low_value_change(self):
         self.prediction_min_threshold = min(self.sb_low.value() / 100, self.prediction_max_threshold)
-        self.update()
+        self._redraw_all()
 
     def _high_value_change(self):
         self.prediction_max_threshold = max(self.sb_high.value() / 100, self.prediction_min_threshold)
-        self.update()
+        self._redraw_all()
 
     def _change_image(self, req):
-        """ When a new webcam image arrives, store it in self.image """
+        """ When a new webcam image arrives, keep it for the next refresh """
         rgb_image = req.rgb_image
-        depth_image = req.depth_image
-        self.image = ImageTools.ros_msg_to_QImage(rgb_image)
-        self.update()
+        image = ros_msg_to_qimage(rgb_image)
+        with self._lock:
+            self._received_image = image
 
     def _update_predictions(self, data):
-        """ When a new list of predictions arrives, draw them """
-        self.predictions = data.predictions
+        """ When a new list of predictions arrives, keep it for the next refresh """
+        with self._lock:
+            self._received_predictions = data.predictions
+
+    def _refresh(self):
+        """ Called by the timer in the GUI thread : process the last received messages """
+        with self._lock:
+            image, self._received_image = self._received_image, None
+            predictions, self._received_predictions = self._received_predictions, None
+        if image is not None:
+            self.image = image
+            self._redraw_all()
+        if predictions is not None:
+            if self._continues_drawn_predictions(predictions):
+                self.predictions = predictions
+                self._draw_new_predictions()
+            else:  # New image or invalidated predictions : the list has been rebuilt
+                self.predictions = predictions
+                self._redraw_all()
+
+    def _continues_drawn_predictions(self, predictions):
+        """ True if 'predictions' is the list already drawn followed by new predictions """
+        n = self.nb_drawn
+        if n == 0 or len(predictions) < n:
+            return n == 0
+        first, last = self.predictions[0], self.predictions[n - 1]
+        return (predictions[0].x, predictions[0].y, predictions[0].proba) == (first.x, first.y, first.proba) and \
+               (predictions[n - 1].x, predictions[n - 1].y, predictions[n - 1].proba) == (last.x, last.y, last.proba)
+
+    def _redraw_all(self):
+        """ Rebuild the overlay and the histogram from all the predictions (new image, new list or new thresholds) """
+        self.overlay = None
+        if self.image:
+            self.overlay = QPixmap(self.image.size())
+            self.overlay.fill(Qt.transparent)
+        self.nb_drawn = 0
+        self.best_pred = None
+        self.counts[:] = 0
+        self._color_bars()
+        self._draw_new_predictions()
+
+    def _draw_new_predictions(self):
+        new_predictions = self.predictions[self.nb_drawn:]
+        if new_predictions:
+            probas = np.array([p.proba for p in new_predictions])
+            if self.overlay:
+                qp = QPainter(self.overlay)
+                for color, selected in ((Qt.green, probas > self.prediction_max_threshold),
+                                        (Qt.red, probas < self.prediction_min_threshold),
+                                        (Qt.blue, (probas >= self.prediction_min_threshold) & (probas <= self.prediction_max_threshold))):
+                    qp.setPen(QPen(color, POINT_SIZE))
+                    qp.drawPoints(QPolygon([QPoint(new_predictions[i].x, new_predictions[i].y) for i in np.flatnonzero(selected)]))
+                qp.end()
+            # Compute the best prediction (best proba, so the futur picking point)
+            best = new_predictions[int(np.argmax(probas))]
+            if self.best_pred is None or best.proba > self.best_pred.proba:
+                self.best_pred = best
+            self.counts += np.bincount(np.minimum((probas * NB_BINS).astype(np.int64), NB_BINS - 1), minlength=NB_BINS)
+            self.nb_drawn = len(self.predictions)
+        self._update_histogram()
         self.update()
 
     def paintEvent(self, event):
-        """ Display the last webcam image and draw predictions (green points if prediction > THRESHOLD otherwise red) """
+        """ Display the last webcam image, the overlay with the predictions (green points if prediction > THRESHOLD otherwise red)
+        and the best prediction """
         qp = QPainter(self)  #.lbl_image)
         rect = event.rect()
-        point_size = 3
         if self.image:
             qp.drawImage(rect, self.image, rect)
-        if self.predictions:
-            for prediction in self.predictions:
-                x = prediction.x
-                y = prediction.y
-                if prediction.proba > self.prediction_max_threshold:
-                    qp.setPen(QPen(Qt.green, point_size))
-                elif prediction.proba < self.prediction_min_threshold:
-                    qp.setPen(QPen(Qt.red, point_size))
-                else: # Between min and max threshold
-                    qp.setPen(QPen(Qt.blue, point_size))
-                qp.drawPoint(x, y)
-            # Compute the best prediction (best proba, so the futur picking point)
-            best_pred = max(self.predictions, key=lambda p: p.proba)
-            qp.setPen(QPen(Qt.magenta, 2*point_size))
-            qp.drawPoint(best_pred.x, best_pred.y)
-            self.lbl_best_pred.setText(f'{best_pred.proba:.2f}')
-            # Draw the histogram
-            self._draw_histogram()
+        if self.overlay:
+            qp.drawPixmap(rect, self.overlay, rect)
+        if self.best_pred:
+            qp.setPen(QPen(Qt.magenta, 2*POINT_SIZE))
+            qp.drawPoint(self.best_pred.x, self.best_pred.y)
+            self.lbl_best_pred.setText(f'{self.best_pred.proba:.2f}')
         qp.end()
 
-    def _draw_histogram(self):
-        # generate the plot
+    def _init_histogram(self):
+        """ Create the 100 bars of the histogram once, then only their heights and colors are changed """
         self.ax = self.gv_plot.canvas.ax
-        self.ax.cla()
-        # and the list of prediction's values
-        preds = [p.proba for p in self.predictions]
-        # Plot a histogram in 100 bins
-        N, bins, patches = self.ax.hist(preds, bins=100, range=(0,1), edgecolor='black', linewidth=1)
+        self.ax.set_xlim(0, 1)
+        self.bars = self.ax.bar(np.arange(NB_BINS) / NB_BINS, np.zeros(NB_BINS), width=1 / NB_BINS, align='edge',
+                                edgecolor='black', linewidth=1)
+        self._color_bars()
+
+    def _color_bars(self):
         # The color of the histogram's bars depends on proba value
         lower_percent = self.prediction_min_threshold
         higher_percent = self.prediction_max_threshold
-        for i in range(len(N)):
+        for i, bar in enumerate(self.bars):
             if i < lower_percent*100:
-                patches[i].set_facecolor('red')
+                bar.set_facecolor('red')
             elif i > higher_percent*100:
-                patches[i].set_facecolor("green")
+                bar.set_facecolor("green")
             else:
-                patches[i].set_facecolor("blue")
+                bar.set_facecolor("blue")
+
+    def _update_histogram(self):
+        for bar, count in zip(self.bars, self.counts):
+            bar.set_height(count)
+        self.ax.set_ylim(0, max(self.counts.max(), 1) * 1.05)
         self.gv_plot.canvas.draw_idle()
 
 
 if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Display the predictions of node_best_prediction.py on the current image.')
+    parser.add_argument('--compressed_images', default=False, action='store_true', help='Subscribe to /new_images_compressed instead of /new_images')
+    parser.add_argument('--shared_memory', default=False, action='store_true', help='Read the images from the shared memory when node_best_prediction.py runs on this host')
+    args = parser.parse_args()
     app = QApplication(sys.argv)
-    gui = NodeVisuPrediction()
+    gui = NodeVisuPrediction(args.compressed_images, args.shared_memory)
     gui.show()
     sys.exit(app.exec_())
\ No newline at end of file
@@ -3,8 +3,9 @@ from PyQt5 import QtCore, QtGui, QtWidgets
 from PyQt5.QtWidgets import QFileDialog
 from PIL import Image
 import math
-from raiv_libraries.rgb_cnn import RgbCnn
-from raiv_libraries.cnn import Cnn
+import numpy as np
+from crop_preprocessing import CropPreprocessor
+from inference_backend import load_inference_model
 
 """
 Display a Qt window with images from a folder with their prediction from a model.
@@ -12,44 +13,47 @@ Highlight in red the wrong prediction (error of the model)
 """
 
 SUCCESS_THRESHOLD = 50 # A success if prediction > threshold
+BATCH_SIZE = 32  # Number of images processed by each inference
 
 class PredictOnImageFilesWindow(QtWidgets.QMainWindow):
     def __init__(self, parent=None):
         super(PredictOnImageFilesWindow, self).__init__(parent)
         self.dir = QFileDialog.getExistingDirectory(self, "Select an image folder", "/common/work/images_storage", QFileDialog.ShowDirsOnly | QFileDialog.DontResolveSymlinks)
         self.is_success_dir = self.dir.endswith('success')
-        fname = QFileDialog.getOpenFileName(self, 'Open CKPT model file', '/common/work/model_trained', "Model files (*.ckpt)",
+        fname = QFileDialog.getOpenFileName(self, 'Open CKPT model file', '/common/work/model_trained', "Model files (*.ckpt *.pt *.onnx)",
                                             options=QFileDialog.DontUseNativeDialog)
         self.wrong = self.total = 0
-        self.model = RgbCnn.load_ckpt_model_file(fname[0])   # Load the selected model
+        self.model = load_inference_model(fname[0])   # Load the selected model, the backend depends on the file extension
         self.scrollArea = QtWidgets.QScrollArea(widgetResizable=True)
         self.setCentralWidget(self.scrollArea)
         content_widget = QtWidgets.QWidget()
         self.scrollArea.setWidget(content_widget)
         self._lay = QtWidgets.QVBoxLayout(content_widget)
-        self.file_names_it = iter([file for file in os.listdir(self.dir)])
+        self.file_names = os.listdir(self.dir)
+        self.preprocessor = CropPreprocessor()
         self._timer = QtCore.QTimer(self, interval=1)
         self._timer.timeout.connect(self.on_timeout)
         self._timer.start()
 
     def on_timeout(self):
-        try:
-            file_name = next(self.file_names_it)
-            file = os.path.join(self.dir, file_name)
-            prob = self.compute_prediction(file)
-            pixmap = QtGui.QPixmap(file)
-            self.add_pixmap(pixmap, file_name, prob)
-        except StopIteration:
+        if self.file_names:
+            batch_file_names = self.file_names[:BATCH_SIZE]
+            self.file_names = self.file_names[BATCH_SIZE:]
+            files = [os.path.join(self.dir, file_name) for file_name in batch_file_names]
+            probs = self.compute_predictions(files)
+            for file, file_name, prob in zip(files, batch_file_names, probs):
+                pixmap = QtGui.QPixmap(file)
+                self.add_pixmap(pixmap, file_name, prob)
+        else:
             stat = f'Wrong predictions = {self.wrong} / {self.total}'
             self._lay.addWidget(QtWidgets.QLabel(stat))
             self._timer.stop()
 
-    def compute_prediction(self, file):
-        """ Compute the prediction [0,1] for a PIL cropped image """
-        pil_rgb_img = Image.open(file).convert('RGB')
-        pred = RgbCnn.predict_from_pil_rgb_image(self.model, pil_rgb_img)
-        prob, cl = Cnn.compute_prob_and_class(pred)
-        return prob
+    def compute_predictions(self, files):
+        """ Compute the predictions [0,1] for a list of cropped image files, processed as one batch """
+        crops = [np.asarray(Image.open(file).convert('RGB')) for file in files]
+        batch = self.preprocessor.crops_to_tensor(crops)
+        return CropPreprocessor.probas_of_success(CropPreprocessor.predict(self.model, batch))
 
     def add_pixmap(self, pixmap, file_name, prob):
         if not pixmap.isNull():
@@ -0,0 +1,79 @@
+import sys
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache of predictions, used to skip the CNN inference for a point already processed on the same frame.
+
+    The key is (frame id, x // quantum, y // quantum) : two points closer than 'quantum' pixels share the same prediction.
+    If 'use_crop_hash' is True, a hash of the cropped image is added to the key, so a prediction is reused only if the
+    crop content is exactly the same.
+    The cache can be shared between threads.
+    """
+    def __init__(self, max_size=10000, quantum=2, use_crop_hash=False):
+        self.max_size = max_size
+        self.quantum = quantum  # Size (in pixels) of the quantization step for x and y
+        self.use_crop_hash = use_crop_hash
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def key(self, frame_id, x, y, crop_bytes=None):
+        """ Build the key for a (x,y) point on a frame. crop_bytes (raw data of the crop) is only used with use_crop_hash """
+        key = (frame_id, int(x) // self.quantum, int(y) // self.quantum)
+        if self.use_crop_hash and crop_bytes is not None:
+            key += (hashlib.blake2b(bytes(crop_bytes), digest_size=8).digest(),)
+        return key
+
+    def get(self, key):
+        """ Return the cached prediction or None """
+        with self._lock:
+            value = self._cache.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._cache.move_to_end(key)
+            return value
+
+    def peek(self, key):
+        """ Return the cached prediction or None, without changing the statistics and the LRU order """
+        with self._lock:
+            return self._cache.get(key)
+
+    def put(self, key, value):
+        with self._lock:
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            if len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)  # Remove the least recently used prediction
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def hit_rate(self):
+        nb_requests = self.hits + self.misses
+        return self.hits / nb_requests if nb_requests else 0.0
+
+    def memory_usage(self):
+        """ Approximate memory (in bytes) used by the cached keys and values """
+        with self._lock:
+            items = list(self._cache.items())
+        size = sys.getsizeof(self._cache)
+        for key, value in items:
+            size += sys.getsizeof(key) + sum(sys.getsizeof(k) for k in key)
+            if hasattr(value, 'element_size'):  # torch tensor
+                size += value.element_size() * value.nelement()
+            else:
+                size += sys.getsizeof(value)
+        return size
+
+    def stats(self):
+        return f'{len(self._cache)} predictions cached, hit rate = {self.hit_rate()*100:.1f}%, memory = {self.memory_usage()/1024:.1f} kB'
+
+    def __len__(self):
+        return len(self._cache)
@@ -0,0 +1,45 @@
+import heapq
+
+
+class PredictionConvergence:
+    """
+    Decide when the prediction generation for the current frame can be paused.
+
+    The running best proba and the mean of the top-K probas are tracked. When neither of them has moved
+    by more than 'tolerance' during the last 'patience' predictions, the frame is considered as settled :
+    new random points are very unlikely to give a better picking point, so inference can stop until
+    the next image.
+    """
+    def __init__(self, patience=500, tolerance=0.001, top_k=10, min_predictions=100):
+        self.patience = patience  # Number of predictions without improvement before the frame is settled
+        self.tolerance = tolerance  # Minimal variation of best / top-K mean proba considered as an improvement
+        self.top_k = top_k
+        self.min_predictions = min_predictions  # Never settle a frame before this number of predictions
+        self.reset()
+
+    def reset(self):
+        """ Called for each new frame """
+        self.nb_predictions = 0
+        self.nb_stale = 0  # Number of consecutive predictions without improvement
+        self.top_probas = []  # min-heap with the K best probas
+        self.best = None
+        self.top_k_mean = None
+        self.settled = False
+
+    def update(self, proba):
+        """ Take a new prediction into account and return True if the frame is now settled """
+        self.nb_predictions += 1
+        if len(self.top_probas) < self.top_k:
+            heapq.heappush(self.top_probas, proba)
+        elif proba > self.top_probas[0]:
+            heapq.heapreplace(self.top_probas, proba)
+        best = max(self.top_probas)
+        top_k_mean = sum(self.top_probas) / len(self.top_probas)
+        if self.best is None or best - self.best > self.tolerance or abs(top_k_mean - self.top_k_mean) > self.tolerance:
+            self.nb_stale = 0
+            self.best = best
+            self.top_k_mean = top_k_mean
+        else:
+            self.nb_stale += 1
+        self.settled = self.nb_predictions >= self.min_predictions and self.nb_stale >= self.patience
+        return self.settled
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+
+"""
+Append-only columnar log of the predictions, the chosen picks and their grip outcomes, to analyse the calibration of
+the model and its drift in production.
+
+A log folder contains segments. A segment is a folder with one raw binary file per column (see COLUMNS, appended with
+the rows of each flush) and a meta.json file (source, host, model, start time, events written in the segment). A new segment is started every
+'rotate_period' seconds, after 'max_rows' rows or when the metadata change (new model), so a column file never grows
+without limit and a segment only has one model. The rows are buffered in memory and written by a background thread
+every 'flush_period' seconds, the hot path only appends a tuple to a list.
+
+Events :
+* prediction : a prediction computed by node_best_prediction.py
+* best : the prediction returned by /best_prediction_service
+* pick : a pick done by node_move_robot_to_prediction.py, with its grip outcome. Its frame is the pick number (the
+  Prediction message has no frame id), join_picks() finds the frame and the model of the 'best' row picked
+
+log = PredictionLog('~/raiv_logs/predictions', 'node_best_prediction', {'model': ckpt_file})
+log.log_predictions(frame_id, predictions)
+log.log('pick', frame_id, x, y, proba, gripped)
+
+python prediction_log.py ~/raiv_logs/predictions --days 7  (calibration report)
+"""
+import os
+import json
+import time
+import socket
+import threading
+import numpy as np
+
+COLUMNS = {'time': np.float64, 'frame': np.int64, 'event': np.uint8, 'x': np.int32, 'y': np.int32,
+           'proba': np.float32, 'gripped': np.int8}  # frame : frame id (pick number for the picks), gripped : 1 / 0, -1 if unknown
+EVENTS = ['prediction', 'best', 'pick']
+META_FILE = 'meta.json'
+
+
+class PredictionLog:
+    def __init__(self, folder, source, metadata=None, flush_period=2.0, rotate_period=3600.0, max_rows=10_000_000):
+        self.folder = os.path.expanduser(folder)
+        self.source = source  # Name of the node writing this log
+        self.metadata = dict(metadata or {})
+        self.flush_period = flush_period
+        self.rotate_period = rotate_period
+        self.max_rows = max_rows
+        self.segment = None  # Folder of the current segment
+        self.segment_start = self.segment_rows = 0
+        self.segment_meta = {}  # Content of the meta.json file of the current segment
+        self._rows = []  # Rows not yet written
+        self._lock = threading.Lock()  # Protect self._rows and self.metadata
+        self._write_lock = threading.Lock()  # Only one flush at a time
+        self._rotate = True
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def log(self, event, frame, x, y, proba, gripped=-1):
+        row = (time.time(), frame, EVENTS.index(event), x, y, proba, gripped)
+        with self._lock:
+            self._rows.append(row)
+
+    def log_predictions(self, frame, predictions, event='prediction'):
+        """ Log a list of Prediction messages """
+        now, event = time.time(), EVENTS.index(event)
+        rows = [(now, frame, event, p.x, p.y, p.proba, -1) for p in predictions]
+        with self._lock:
+            self._rows.extend(rows)
+
+    def set_metadata(self, **metadata):
+        """ Change the metadata (ex : model=...), the next rows are written in a new segment """
+        with self._lock:
+            rows, self._rows = self._rows, []
+        self._write(rows)  # Rows logged before the change go to the current segment
+        with self._lock:
+            self.metadata.update(metadata)
+            self._rotate = True
+
+    def flush(self):
+        with self._lock:
+            rows, self._rows = self._rows, []
+        self._write(rows)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=5)
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_period):
+            self.flush()
+
+    def _write(self, rows):
+        if not rows:
+            return
+        with self._write_lock:
+            if self._rotate or self.segment_rows >= self.max_rows or time.time() - self.segment_start >= self.rotate_period:
+                self._new_segment()
+            events = sorted(set(self.segment_meta['events']) | {EVENTS[row[2]] for row in rows})
+            if events != self.segment_meta['events']:  # Read by load_prediction_log() to skip the segment
+                self.segment_meta['events'] = events
+                self._write_meta()
+            columns = list(zip(*rows))
+            for (name, dtype), values in zip(COLUMNS.items(), columns):
+                with open(os.path.join(self.segment, name), 'ab') as f:
+                    f.write(np.asarray(values, dtype=dtype).tobytes())
+            self.segment_rows += len(rows)
+
+    def _new_segment(self):
+        self.segment_start = time.time()
+        self.segment_rows = 0
+        name = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(self.segment_start))}-{self.source}-{os.getpid()}"
+        self.segment = os.path.join(self.folder, name)
+        os.makedirs(self.segment, exist_ok=True)
+        with self._lock:
+            self.segment_meta = dict(self.metadata, source=self.source, host=socket.gethostname(), start=self.segment_start, events=[])
+            self._rotate = False
+        self._write_meta()
+
+    def _write_meta(self):
+        path = os.path.join(self.segment, META_FILE)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.segment_meta, f)
+        os.replace(path + '.tmp', path)  # A reader never sees a partial file
+
+
+def load_prediction_log(folder, since=None, until=None, events=None):
+    """
+    Return a DataFrame with the rows of all the segments of the log folder (columns of COLUMNS + source and model),
+    'since' and 'until' being timestamps (in s), 'events' a list of EVENTS. Segments out of this time range or without
+    any of these events are not read.
+    """
+    import pandas as pd  # Only needed to read the log, not by the nodes writing it
+    folder = os.path.expanduser(folder)
+    frames = []
+    for name in sorted(os.listdir(folder)):
+        segment = os.path.join(folder, name)
+        try:
+            with open(os.path.join(segment, META_FILE)) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if not os.path.exists(os.path.join(segment, 'time')):
+            continue
+        if until is not None and meta['start'] > until:
+            continue
+        if since is not None and os.path.getmtime(os.path.join(segment, 'time')) < since:  # Nothing written since
+            continue
+        if events is not None and 'events' in meta and not set(events) & set(meta['events']):
+            continue
+        columns = {name: np.fromfile(os.path.join(segment, name), dtype=dtype) for name, dtype in COLUMNS.items()}
+        nb_rows = min(len(values) for values in columns.values())  # A flush may have been interrupted
+        keep = np.ones(nb_rows, dtype=bool)  # Filter the raw columns, before building the DataFrame
+        if since is not None:
+            keep &= columns['time'][:nb_rows] >= since
+        if until is not None:
+            keep &= columns['time'][:nb_rows] <= until
+        if events is not None:
+            keep &= np.isin(columns['event'][:nb_rows], [EVENTS.index(event) for event in events])
+        segment_frame = pd.DataFrame({name: values[:nb_rows][keep] for name, values in columns.items()})
+        segment_frame['source'] = meta.get('source')
+        segment_frame['model'] = meta.get('model')
+        frames.append(segment_frame)
+    if not frames:
+        return pd.DataFrame(columns=list(COLUMNS) + ['source', 'model'])
+    log = pd.concat(frames, ignore_index=True)
+    log['event'] = pd.Categorical.from_codes(log['event'], EVENTS)
+    log['source'] = log['source'].astype('category')
+    log['model'] = log['model'].astype('category')
+    log['time'] = pd.to_datetime(log['time'], unit='s')
+    return log.sort_values('time', kind='stable').reset_index(drop=True)
+
+
+def join_picks(log):
+    """
+    Return the picks of a log loaded with the 'best' and 'pick' events, with the frame id and the model of the 'best'
+    row picked : last 'best' row with the same (x, y, proba) before the pick (best_frame = -1 if not found)
+    """
+    import pandas as pd
+    picks = log[log['event'] == 'pick'].drop(columns=['model'])
+    best = log[log['event'] == 'best'][['time', 'x', 'y', 'proba', 'frame', 'model']].rename(columns={'frame': 'best_frame'})
+    picks = pd.merge_asof(picks, best, on='time', by=['x', 'y', 'proba'], direction='backward')
+    picks['best_frame'] = picks['best_frame'].fillna(-1).astype(np.int64)
+    return picks
+
+
+def calibration_report(picks, nb_bins=10):
+    """ Predicted proba vs grip rate of the picks, per proba bin """
+    import pandas as pd
+    picks = picks[picks['gripped'] >= 0]
+    bins = pd.cut(picks['proba'], np.linspace(0, 1, nb_bins + 1), include_lowest=True)
+    return picks.groupby(bins, observed=True).agg(picks=('gripped', 'size'), mean_proba=('proba', 'mean'), grip_rate=('gripped', 'mean'))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Calibration and drift report on the picks of a prediction log.')
+    parser.add_argument('log_folder', type=str, help='Folder of the log written by PredictionLog')
+    parser.add_argument('--days', type=float, default=7, help='Number of days to analyse')
+    parser.add_argument('--nb_bins', type=int, default=10, help='Number of proba bins of the calibration report')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    picks = join_picks(load_prediction_log(args.log_folder, since=time.time() - args.days * 86400, events=['best', 'pick']))
+    print(f'{len(picks)} picks loaded in {time.perf_counter() - start:.2f} s')
+    if len(picks):
+        known = picks[picks['gripped'] >= 0]
+        print(f'Grip rate = {known["gripped"].mean() * 100:.1f}%, mean proba = {known["proba"].mean():.3f}\n')
+        print(calibration_report(picks, args.nb_bins).round(3).to_string())
+        print('\nPer day (drift) :')
+        daily = known.groupby(known['time'].dt.date).agg(picks=('gripped', 'size'), mean_proba=('proba', 'mean'), grip_rate=('gripped', 'mean'))
+        print(daily.round(3).to_string())
@@ -0,0 +1,54 @@
+import os
+import hashlib
+import numpy as np
+
+DEFAULT_CACHE_FOLDER = os.path.expanduser('~/.cache/raiv_research/prediction_maps')
+
+
+class PredictionMapCache:
+    """
+    On-disk cache of the prediction maps computed by explore.py, one compressed npz file per
+    (image, model, crop size, stride) : the content hash of the RGB (and depth) image, the hash of the checkpoint file,
+    the crop size and the number of pixels between two predictions.
+    Each file contains 'xy' (N, 2) int32 and 'preds' (N, 2) float32 ([proba_fail, proba_success] of each point).
+    """
+    def __init__(self, folder=DEFAULT_CACHE_FOLDER):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    @staticmethod
+    def hash_images(*images):
+        """ Content hash of some images (PIL images or numpy arrays, None is ignored) """
+        h = hashlib.blake2b(digest_size=16)
+        for image in images:
+            if image is not None:
+                array = np.ascontiguousarray(image)
+                h.update(str(array.shape).encode())
+                h.update(array.data)
+        return h.hexdigest()
+
+    @staticmethod
+    def hash_file(file_name, chunk_size=1 << 20):
+        h = hashlib.blake2b(digest_size=16)
+        with open(file_name, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def file_name(self, image_hash, model_hash, crop_size, stride):
+        key = hashlib.blake2b(f'{image_hash}_{model_hash}_{crop_size[0]}x{crop_size[1]}_{stride}'.encode(), digest_size=16).hexdigest()
+        return os.path.join(self.folder, key + '.npz')
+
+    def load(self, image_hash, model_hash, crop_size, stride):
+        """ Return the (xy, preds) arrays of the cached map or None """
+        file_name = self.file_name(image_hash, model_hash, crop_size, stride)
+        if not os.path.exists(file_name):
+            return None
+        with np.load(file_name) as data:
+            return data['xy'], data['preds']
+
+    def save(self, image_hash, model_hash, crop_size, stride, xy, preds):
+        file_name = self.file_name(image_hash, model_hash, crop_size, stride)
+        tmp_file_name = file_name + '.tmp.npz'
+        np.savez_compressed(tmp_file_name, xy=np.asarray(xy, dtype=np.int32), preds=np.asarray(preds, dtype=np.float32))
+        os.replace(tmp_file_name, file_name)  # A map is never read half written
@@ -0,0 +1,99 @@
+import time
+import heapq
+import random
+
+
+class RetentionPolicy:
+    """
+    Bound the number of predictions kept for a frame. When the list has more than 'max_predictions' predictions, it is
+    pruned down to 'low_water' * max_predictions, so most of the batches only append to the list (and the subscribers
+    of /predictions only draw the new points). The 'nb_best' best predictions are always kept.
+    The kept predictions stay in their arrival order.
+
+    predictions = policy.update(predictions, new_predictions)
+    """
+    def __init__(self, max_predictions=5000, low_water=0.75, nb_best=10):
+        self.max_predictions = max_predictions
+        self.target = max(int(max_predictions * low_water), nb_best)  # Number of predictions after a pruning
+        self.nb_best = nb_best
+
+    def reset(self):
+        """ Called for a new frame """
+
+    def update(self, predictions, new_predictions):
+        """ Return the list of predictions to keep, new_predictions being the last ones added to the list """
+        if len(predictions) <= self.max_predictions:
+            return predictions
+        keep = self._select(predictions)
+        return [predictions[i] for i in sorted(keep)]
+
+    def _select(self, predictions):
+        """ Return the indices of the predictions to keep """
+        raise NotImplementedError
+
+    def _best(self, predictions, n):
+        return heapq.nlargest(n, range(len(predictions)), key=lambda i: predictions[i].proba)
+
+
+class TopKRetention(RetentionPolicy):
+    """ Keep the best predictions """
+    def _select(self, predictions):
+        return self._best(predictions, self.target)
+
+
+class StratifiedReservoirRetention(RetentionPolicy):
+    """
+    Keep the best predictions and a uniform random sample of the others in each cell of a grid (cell_size pixels),
+    with the same quota for every cell : the kept predictions still cover all the objects of the picking box.
+    """
+    def __init__(self, max_predictions=5000, low_water=0.75, nb_best=10, cell_size=40, seed=None):
+        super().__init__(max_predictions, low_water, nb_best)
+        self.cell_size = cell_size
+        self.random = random.Random(seed)
+
+    def _select(self, predictions):
+        keep = set(self._best(predictions, self.nb_best))
+        cells = {}
+        for i, prediction in enumerate(predictions):
+            if i not in keep:
+                cells.setdefault((prediction.x // self.cell_size, prediction.y // self.cell_size), []).append(i)
+        remaining = self.target - len(keep)
+        cells = sorted(cells.values(), key=len)  # The quota unused by the small cells is given to the bigger ones
+        for nb_done, cell in enumerate(cells):
+            quota = remaining // (len(cells) - nb_done)
+            chosen = cell if len(cell) <= quota else self.random.sample(cell, quota)
+            keep.update(chosen)
+            remaining -= len(chosen)
+        return keep
+
+
+class TimeWindowRetention(RetentionPolicy):
+    """ Keep the best predictions and the ones computed during the last 'window' seconds (the most recent ones if they are too many) """
+    def __init__(self, max_predictions=5000, low_water=0.75, nb_best=10, window=30.0):
+        super().__init__(max_predictions, low_water, nb_best)
+        self.window = window
+        self._times = {}  # (x, y, proba) => time of the prediction
+
+    def reset(self):
+        self._times = {}
+
+    def update(self, predictions, new_predictions):
+        now = time.monotonic()
+        for prediction in new_predictions:
+            self._times[(prediction.x, prediction.y, prediction.proba)] = now
+        predictions = super().update(predictions, new_predictions)
+        if len(self._times) > len(predictions):  # Forget the times of the removed predictions
+            self._times = {key: self._times[key] for key in ((p.x, p.y, p.proba) for p in predictions) if key in self._times}
+        return predictions
+
+    def _select(self, predictions):
+        keep = set(self._best(predictions, self.nb_best))
+        oldest = time.monotonic() - self.window
+        recent = [i for i, p in enumerate(predictions) if i not in keep and self._times.get((p.x, p.y, p.proba), 0) >= oldest]
+        nb_recent = self.target - len(keep)
+        if nb_recent > 0:
+            keep.update(recent[-nb_recent:])  # The list is in arrival order
+        return keep
+
+
+RETENTION_POLICIES = {'top_k': TopKRetention, 'stratified': StratifiedReservoirRetention, 'time_window': TimeWindowRetention}
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+
+"""
+Print the latency percentiles published on the /raiv_metrics topic by the perception nodes
+(node_best_prediction.py, image_service.py).
+
+rosrun raiv_research print_metrics.py [--node node_best_prediction]
+"""
+import rospy
+from raiv_research.msg import MetricsSummary
+
+
+def print_summary(msg, node_filter=None):
+    stages = [stage for stage in msg.stages if not node_filter or stage.node == node_filter]
+    if not stages:
+        return
+    print(f'--- {msg.stamp.to_sec():.1f} ---')
+    print(f'{"node":<24}{"stage":<24}{"count":>8}{"mean":>10}{"p50":>10}{"p95":>10}{"p99":>10}{"max":>10}   (ms)')
+    for stage in stages:
+        values = [1000 * v for v in (stage.mean, stage.p50, stage.p95, stage.p99, stage.max)]
+        print(f'{stage.node:<24}{stage.stage:<24}{stage.count:>8}' + ''.join(f'{v:>10.2f}' for v in values))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Print live latency percentiles from the /raiv_metrics topic')
+    parser.add_argument('--node', type=str, default=None, help='only print the stages of this node')
+    parser.add_argument('--topic', type=str, default='/raiv_metrics', help='metrics topic')
+    args = parser.parse_args()
+    rospy.init_node('print_metrics', anonymous=True)
+    rospy.Subscriber(args.topic, MetricsSummary, print_summary, args.node)
+    rospy.spin()
@@ -0,0 +1,33 @@
+import numpy as np
+from PyQt5.QtGui import QImage
+from ros_image import ros_msg_to_numpy
+
+
+def numpy_to_qimage(array, bgr=False):
+    """
+    Wrap a (H, W), (H, W, 3) or (H, W, 4) numpy array as a QImage, without copy when each row is contiguous
+    (e.g. a crop sliced from a frame). The array is kept alive by the QImage object.
+    The QImage shares the memory of the array : use image.copy() before painting on it.
+    bgr : True if the channels are in BGR or BGRA order
+    """
+    if array.ndim == 2:
+        fmt = QImage.Format_Grayscale16 if array.dtype == np.uint16 else QImage.Format_Grayscale8
+    elif array.shape[2] == 3:
+        if bgr and not hasattr(QImage, 'Format_BGR888'):  # Qt < 5.14
+            array, bgr = array[:, :, ::-1], False
+        fmt = QImage.Format_BGR888 if bgr else QImage.Format_RGB888
+    else:
+        if bgr:
+            array, bgr = array[:, :, [2, 1, 0, 3]], False
+        fmt = QImage.Format_RGBA8888
+    if array.strides[-1] != array.itemsize or (array.ndim == 3 and array.strides[1] != array.shape[2] * array.itemsize):
+        array = np.ascontiguousarray(array)  # Only when the pixels of a row are not contiguous
+    height, width = array.shape[:2]
+    image = QImage(array.ctypes.data, width, height, array.strides[0], fmt)
+    image.array = array  # The QImage does not own its buffer
+    return image
+
+
+def ros_msg_to_qimage(msg):
+    """ Wrap the data of a ROS Image message as a QImage, without copy """
+    return numpy_to_qimage(ros_msg_to_numpy(msg), bgr=msg.encoding in ('bgr8', 'bgra8'))
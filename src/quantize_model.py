@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+"""
+Post-training INT8 quantization of a RgbCnn or RgbAndDepthCnn CKPT model file.
+
+The model is calibrated on a random sample of an image bank (<bank>/rgb/<success or fail> and, for RGB + DEPTH models,
+<bank>/depth/<success or fail>), then the accuracy of the float and INT8 models are compared on a held-out bank with the
+same layout, together with the latency per batch. The INT8 model is saved as a <CKPT name>.int8.pt file which can be
+used by node_best_prediction.py with '--backend int8'.
+
+python quantize_model.py <CKPT_FILE> <CALIBRATION_BANK> <TEST_BANK> [--rgb_and_depth]
+"""
+import os
+import random
+import time
+import numpy as np
+import torch
+from pathlib import Path
+from PIL import Image
+from torch.ao.quantization import get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+from raiv_libraries.rgb_cnn import RgbCnn
+from raiv_libraries.rgb_and_depth_cnn import RgbAndDepthCnn
+from crop_preprocessing import CropPreprocessor
+from inference_backend import load_inference_model
+
+FAIL = 0
+SUCCESS = 1
+
+
+def list_samples(bank_folder, rgb_and_depth):
+    """ Return a list of (rgb_file, depth_file or None, label) for all the images of a bank """
+    bank_folder = Path(bank_folder)
+    samples = []
+    for label, label_name in [(FAIL, 'fail'), (SUCCESS, 'success')]:
+        rgb_folder = bank_folder / 'rgb' / label_name
+        for file_name in sorted(os.listdir(rgb_folder)):
+            depth_file = bank_folder / 'depth' / label_name / file_name if rgb_and_depth else None
+            samples.append((rgb_folder / file_name, depth_file, label))
+    return samples
+
+
+def load_batches(samples, preprocessor, batch_size):
+    """ Yield (inputs, labels) with inputs a tuple of normalized tensors : (rgb,) or (rgb, depth) """
+    for i in range(0, len(samples), batch_size):
+        batch_samples = samples[i:i + batch_size]
+        inputs = [preprocessor.crops_to_tensor([np.asarray(Image.open(rgb).convert('RGB')) for rgb, _, _ in batch_samples])]
+        if batch_samples[0][1] is not None:  # RGB + DEPTH model
+            inputs.append(preprocessor.crops_to_tensor([np.asarray(Image.open(depth).convert('RGB')) for _, depth, _ in batch_samples]))
+        yield tuple(inputs), [label for _, _, label in batch_samples]
+
+
+def quantize(model, calibration_batches, engine='fbgemm'):
+    """ Return the INT8 model, calibrated (observers for activation ranges) with the calibration batches """
+    torch.backends.quantized.engine = engine
+    example_inputs = calibration_batches[0][0]
+    prepared_model = prepare_fx(model, get_default_qconfig_mapping(engine), example_inputs)
+    with torch.no_grad():
+        for inputs, _ in calibration_batches:
+            prepared_model(*inputs)
+    return convert_fx(prepared_model)
+
+
+def evaluate(model, batches):
+    """ Return (accuracy, mean latency per batch in ms, list of predicted classes) """
+    nb_good = nb_total = 0
+    latencies = []
+    predicted_classes = []
+    with torch.no_grad():
+        for inputs, labels in batches:
+            start = time.perf_counter()
+            preds = model(*inputs)
+            latencies.append(time.perf_counter() - start)
+            classes = preds.argmax(dim=1).tolist()
+            predicted_classes.extend(classes)
+            nb_good += sum(cl == label for cl, label in zip(classes, labels))
+            nb_total += len(labels)
+    return nb_good / nb_total, 1000 * sum(latencies) / len(latencies), predicted_classes
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='INT8 post-training quantization of a CKPT model file, with an accuracy / latency report.')
+    parser.add_argument('ckpt_model_file', type=str, help='CKPT model file')
+    parser.add_argument('calibration_bank', type=str, help="image bank used for calibration (with 'rgb' and 'depth' sub-folders)")
+    parser.add_argument('test_bank', type=str, help='held-out image bank used to compare the float and INT8 models')
+    parser.add_argument('--rgb_and_depth', default=False, action='store_true', help='For RGB + DEPTH model')
+    parser.add_argument('--nb_calibration_images', type=int, default=256, help='Number of images randomly chosen in the calibration bank')
+    parser.add_argument('--batch_size', type=int, default=32, help='Batch size for calibration and evaluation')
+    parser.add_argument('--engine', type=str, default='fbgemm', choices=['fbgemm', 'qnnpack'], help="Quantized engine : 'fbgemm' for x86, 'qnnpack' for ARM")
+    args = parser.parse_args()
+
+    if args.rgb_and_depth:
+        float_model = RgbAndDepthCnn.load_ckpt_model_file(args.ckpt_model_file)
+    else:
+        float_model = RgbCnn.load_ckpt_model_file(args.ckpt_model_file)
+    float_model.eval()
+    preprocessor = CropPreprocessor()
+    # Calibration
+    calibration_samples = list_samples(args.calibration_bank, args.rgb_and_depth)
+    calibration_samples = random.sample(calibration_samples, min(args.nb_calibration_images, len(calibration_samples)))
+    calibration_batches = list(load_batches(calibration_samples, preprocessor, args.batch_size))
+    int8_model = quantize(float_model, calibration_batches, args.engine)
+    # Save the INT8 model as TorchScript
+    output_file = os.path.splitext(args.ckpt_model_file)[0] + '.int8.pt'
+    torch.jit.save(torch.jit.trace(int8_model, calibration_batches[0][0]), output_file)
+    print(f'INT8 model saved to {output_file}')
+    # Accuracy and latency report
+    int8_model = load_inference_model(output_file, 'int8')
+    test_batches = list(load_batches(list_samples(args.test_bank, args.rgb_and_depth), preprocessor, args.batch_size))
+    float_accuracy, float_latency, float_classes = evaluate(float_model, test_batches)
+    int8_accuracy, int8_latency, int8_classes = evaluate(int8_model, test_batches)
+    agreement = sum(f == i for f, i in zip(float_classes, int8_classes)) / len(float_classes)
+    print(f'{len(float_classes)} test images, batch size = {args.batch_size}')
+    print(f'Float : accuracy = {float_accuracy*100:.2f}%, latency = {float_latency:.1f} ms/batch')
+    print(f'INT8  : accuracy = {int8_accuracy*100:.2f}%, latency = {int8_latency:.1f} ms/batch')
+    print(f'Same predicted class for {agreement*100:.2f}% of the images, speedup = x{float_latency / int8_latency:.2f}')
@@ -25,6 +25,7 @@ from raiv_libraries.srv import get_coordservice
 from raiv_libraries.get_coord_node import InBoxCoord
 from raiv_libraries.image_tools import ImageTools
 from raiv_libraries import tools
+from cycle_time_recorder import CycleTimeRecorder
 import argparse
 
 #
@@ -62,6 +63,7 @@ def print_info(object_gripped, nb_success, nb_fail, check):
 parser = argparse.ArgumentParser(description="Get picking images from random position and put them in '<rgb or depth>'/<'success' or 'fail>' folders")
 parser.add_argument('images_folder', type=str, help="images folder for sub-folders 'rgb' and 'depth'")
 parser.add_argument('calibration_folder', type=str, help='camera calibration folder')
+parser.add_argument('--cycle_log', type=str, default=None, help='CSV file where the duration of each phase of the pick cycles is appended (default : no log)')
 parser.add_argument('-c', '--check', default=False, action='store_true', help='perform a manual check for each sample (user has to validate if the program saves images')
 args = parser.parse_args()
 
@@ -84,23 +86,34 @@ bridge = CvBridge()
 nb_success = 0
 nb_fail = 0
 # Main loop to get image
+cycle_recorder = CycleTimeRecorder(args.cycle_log, 'random_picks_birdview')
+cycle_recorder.start_cycle()
 while True:
     # Get all information from the camera
-    resp_pick = coord_service('random', InBoxCoord.PICK, InBoxCoord.ON_OBJECT, tools.BIG_CROP_WIDTH, tools.BIG_CROP_HEIGHT, None, None)
-    resp_place = coord_service('random', InBoxCoord.PLACE, InBoxCoord.IN_THE_BOX, None, None, None, None)
+    with cycle_recorder.phase('coord_service'):
+        resp_pick = coord_service('random', InBoxCoord.PICK, InBoxCoord.ON_OBJECT, tools.BIG_CROP_WIDTH, tools.BIG_CROP_HEIGHT, None, None)
+        resp_place = coord_service('random', InBoxCoord.PLACE, InBoxCoord.IN_THE_BOX, None, None, None, None)
     # Move robot to pick position
-    pick_pose = tools.xyz_to_pose(resp_pick.x_robot, resp_pick.y_robot, Z_PICK_PLACE)
-    robot.pick(pick_pose)
+    with cycle_recorder.phase('pick'):
+        pick_pose = tools.xyz_to_pose(resp_pick.x_robot, resp_pick.y_robot, Z_PICK_PLACE)
+        robot.pick(pick_pose)
     # Place the object
-    place_pose = tools.xyz_to_pose(resp_place.x_robot, resp_place.y_robot, Z_PICK_PLACE)
-    robot.place(place_pose)
-    object_gripped = robot.check_if_object_gripped()  # Test if object is gripped
-    save_response = print_info(object_gripped, nb_success, nb_fail, args.check)
-    robot.release_gripper()        # Switch off the gripper
-    robot.go_to_xyz_position(X_OUT, Y_OUT, Z_OUT, duration=2)  # The robot must go out of the camera field
+    with cycle_recorder.phase('place'):
+        place_pose = tools.xyz_to_pose(resp_place.x_robot, resp_place.y_robot, Z_PICK_PLACE)
+        robot.place(place_pose)
+    with cycle_recorder.phase('grip_check'):
+        object_gripped = robot.check_if_object_gripped()  # Test if object is gripped
+    with cycle_recorder.phase('user_check'):
+        save_response = print_info(object_gripped, nb_success, nb_fail, args.check)
+    with cycle_recorder.phase('release'):
+        robot.release_gripper()        # Switch off the gripper
+    with cycle_recorder.phase('retreat'):
+        robot.go_to_xyz_position(X_OUT, Y_OUT, Z_OUT, duration=2)  # The robot must go out of the camera field
     if save_response == 'y':
-        nb_images = tools.generate_and_save_rgb_depth_images(resp_pick, parent_image_folder, object_gripped)
+        with cycle_recorder.phase('dataset_write'):
+            nb_images = tools.generate_and_save_rgb_depth_images(resp_pick, parent_image_folder, object_gripped)
         if object_gripped:
             nb_success += nb_images
         else:
-            nb_fail += nb_images
\ No newline at end of file
+            nb_fail += nb_images
+    cycle_recorder.end_cycle(object_gripped)
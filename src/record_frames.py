@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+"""
+Record the frames published on /new_images, with the picking box geometry, to replay them without camera, coord node
+or robot (see replay_benchmark.py).
+
+Each frame is saved as a compressed numpy file <output_folder>/frame_<index>.npz with :
+* rgb : (H, W, 3) uint8 image, depth : (H, W) depth image
+* points : (N, 2) random picking points (x, y) given by In_box_coordService for this frame (on an object, in the picking box)
+* centroid : (x, y) of the picking box, given by Get_picking_box_centroid
+* stamp : time stamp of the RGB image (in s)
+
+The frames are recorded by a thread, not in the subscriber callback, which only keeps the last frame received. A point
+is kept only if the crop returned by In_box_coordService is the crop of the recorded frame : the coord node has
+processed this frame (no fixed wait) and has not switched to a newer one during the draws.
+
+How to run?
+* the usual best prediction pipeline (camera, get_coord_node.py, node_best_prediction.py, ...)
+* rosrun raiv_research record_frames.py <output_folder> --nb_points 2000
+"""
+import os
+import time
+import queue
+import threading
+import numpy as np
+import rospy
+from pathlib import Path
+from raiv_libraries.srv import get_coordservice, GetPickingBoxCentroid
+from raiv_libraries.get_coord_node import InBoxCoord
+from raiv_libraries.image_tools import ImageTools
+from image_compression import subscribe_new_images
+from ros_image import ros_msg_to_numpy
+from crop_preprocessing import CropPreprocessor
+
+SAME_CROP_TOLERANCE = 8  # Max mean difference (in gray levels) between two crops of the same frame (JPEG compressed images)
+
+
+def load_frame(file):
+    """ Return a dict with 'rgb', 'depth', 'points', 'centroid' and 'stamp' keys for a recorded frame """
+    with np.load(file) as data:
+        return {key: data[key] for key in data.files}
+
+
+def list_frames(folder):
+    return sorted(Path(folder).glob('frame_*.npz'))
+
+
+class FrameRecorder:
+    def __init__(self, output_folder, nb_points, compressed_images=False, shared_memory=False, sync_timeout=10.0):
+        rospy.init_node('record_frames')
+        self.output_folder = Path(output_folder)
+        os.makedirs(self.output_folder, exist_ok=True)
+        self.nb_points = nb_points
+        self.index = len(list_frames(self.output_folder))  # Append to an existing recording
+        self.sync_timeout = sync_timeout  # Max wait (in s) for the coord node to process a new frame
+        self.cropper = CropPreprocessor()  # Only to cut the crops compared with the ones of the coord node
+        rospy.wait_for_service('/In_box_coordService')
+        self.coord_serv = rospy.ServiceProxy('/In_box_coordService', get_coordservice, persistent=True)  # Called nb_points times per frame
+        rospy.wait_for_service('/Get_picking_box_centroid')
+        self.get_picking_box_centroid_service = rospy.ServiceProxy('/Get_picking_box_centroid', GetPickingBoxCentroid)
+        self.frames = queue.Queue(maxsize=1)  # Last frame received, not yet recorded
+        threading.Thread(target=self._run, daemon=True).start()
+        subscribe_new_images(self._receive, compressed_images, queue_size=1, shared_memory=shared_memory)
+
+    def _receive(self, msg):
+        """ Subscriber callback : replace the frame waiting to be recorded """
+        try:
+            self.frames.get_nowait()
+            rospy.logwarn('Frame skipped, a new one has been received before its recording')
+        except queue.Empty:
+            pass
+        self.frames.put(msg)
+
+    def _run(self):
+        while not rospy.is_shutdown():
+            try:
+                msg = self.frames.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            self._record(msg)
+
+    def _is_frame_crop(self, frame, resp):
+        """ True if the crop of the In_box_coordService response has been cut from this frame """
+        crop = ros_msg_to_numpy(resp.rgb_crop, rgb=True)
+        frame_crop = self.cropper.extract_crops(frame, [(resp.x_pixel, resp.y_pixel)])[0]
+        height, width = min(crop.shape[0], frame_crop.shape[0]), min(crop.shape[1], frame_crop.shape[1])
+        difference = np.abs(crop[:height, :width, :3].astype(np.int16) - frame_crop[:height, :width])
+        return difference.mean() <= SAME_CROP_TOLERANCE
+
+    def _record(self, msg):
+        frame = ros_msg_to_numpy(msg.rgb_image, rgb=True)
+        points = []
+        deadline = time.monotonic() + self.sync_timeout
+        while len(points) < self.nb_points and not rospy.is_shutdown():
+            if not self.frames.empty():  # Record the newer frame instead
+                rospy.logwarn('Frame skipped, a new one has been received during its recording')
+                return
+            resp = self.coord_serv('random_no_refresh', InBoxCoord.PICK, InBoxCoord.ON_OBJECT, ImageTools.CROP_WIDTH, ImageTools.CROP_HEIGHT, None, None)
+            if self._is_frame_crop(frame, resp):
+                points.append((resp.x_pixel, resp.y_pixel))
+            elif points:  # The coord node has switched to another frame during the draws
+                rospy.logwarn('Frame skipped, the coord node has switched to another frame during its recording')
+                return
+            elif time.monotonic() > deadline:
+                rospy.logwarn(f'Frame skipped, not processed by the coord node after {self.sync_timeout} s')
+                return
+            else:  # The coord node has not yet processed this frame
+                rospy.sleep(0.01)
+        if len(points) < self.nb_points:
+            return
+        centroid = self.get_picking_box_centroid_service()
+        file = self.output_folder / f'frame_{self.index:05d}.npz'
+        np.savez_compressed(file,
+                            rgb=ros_msg_to_numpy(msg.rgb_image, rgb=True),
+                            depth=ros_msg_to_numpy(msg.depth_image),
+                            points=np.array(points, dtype=np.int32),
+                            centroid=np.array([centroid.x_centroid, centroid.y_centroid]),
+                            stamp=np.array(msg.rgb_image.header.stamp.to_sec()))
+        rospy.loginfo(f'Frame recorded in {file} ({os.path.getsize(file) / 1024:.0f} kB)')
+        self.index += 1
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Record /new_images frames and picking box geometry for replay_benchmark.py')
+    parser.add_argument('output_folder', type=str, help='folder where the frames are saved')
+    parser.add_argument('--nb_points', type=int, default=2000, help='number of random picking points recorded for each frame')
+    parser.add_argument('--compressed_images', default=False, action='store_true', help='Subscribe to /new_images_compressed instead of /new_images')
+    parser.add_argument('--shared_memory', default=False, action='store_true', help='Read the images from the shared memory when node_best_prediction.py runs on this host')
+    args = parser.parse_args()
+    FrameRecorder(args.output_folder, args.nb_points, args.compressed_images, args.shared_memory)
+    rospy.spin()
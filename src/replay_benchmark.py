@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+"""
+Measure the throughput of the best prediction pipeline without camera, coord node or robot.
+
+The frames recorded by record_frames.py are fed one by one to the NodeBestPrediction pipeline, with local stand-ins
+for the /In_box_coordService (random points drawn from the recorded ones, crops cut from the recorded image) and
+/Is_Picking_Box_Empty services. No ROS master is needed.
+
+Report : predictions per second, p50/p95/p99 latency of each stage and time to reach the best prediction of each frame.
+
+python replay_benchmark.py <CKPT_FILE> <RECORD_FOLDER> --predictions_per_frame 1000 --batch_size 16 --tensor_preprocessing
+python replay_benchmark.py <CKPT_FILE> <RECORD_FOLDER> --batch_size 16 --workers 8   (scaling of the inference worker processes)
+"""
+import io
+import time
+import random
+import numpy as np
+from types import SimpleNamespace
+from sensor_msgs.msg import Image
+from raiv_research.msg import ListOfPredictions
+from node_best_prediction import NodeBestPrediction
+from crop_preprocessing import CropPreprocessor
+from prediction_cache import PredictionCache
+from prediction_convergence import PredictionConvergence
+from inference_backend import BACKENDS
+from record_frames import load_frame, list_frames
+from inference_workers import InferenceWorkerPool
+
+STAGES = ['coord_service', 'inference', 'publish', 'batch']
+MAX_EMPTY_BATCHES = 100  # Stop a frame after this number of consecutive batches without new prediction
+
+
+class LocalCoordService:
+    """ Stand-in for /In_box_coordService : random points drawn from the recorded ones, crops cut from the recorded image """
+    def __init__(self, stage_times):
+        self.stage_times = stage_times
+        self.frame = None
+        self.points = None
+
+    def set_frame(self, frame, points):
+        self.frame = frame
+        self.points = points
+
+    def __call__(self, mode, in_box, on_object, crop_width, crop_height, x, y):
+        start = time.perf_counter()
+        x, y = (int(v) for v in random.choice(self.points))
+        crop = CropPreprocessor(crop_width, crop_height).extract_crops(self.frame, [(x, y)])[0]
+        rgb_crop = Image(height=crop_height, width=crop_width, encoding='rgb8', step=crop_width * 3, data=crop.tobytes())
+        self.stage_times['coord_service'].append(time.perf_counter() - start)
+        return SimpleNamespace(x_pixel=x, y_pixel=y, rgb_crop=rgb_crop)
+
+
+class LocalPickingBoxEmpty:
+    """ Stand-in for /Is_Picking_Box_Empty : the box is never empty during the replay """
+    def __call__(self):
+        return SimpleNamespace(empty_box=False)
+
+
+class LocalPublisher:
+    """ Stand-in for a rospy.Publisher : the message is only serialized, like rospy does before sending it """
+    def __init__(self, stage_times=None):
+        self.stage_times = stage_times
+
+    def publish(self, msg):
+        start = time.perf_counter()
+        msg.serialize(io.BytesIO())
+        if self.stage_times is not None:
+            self.stage_times['publish'].append(time.perf_counter() - start)
+
+
+class LocalRosInterface:
+    """ Stand-in for the RosInterface of NodeBestPrediction : local services and publishers, no ROS master """
+    def __init__(self, stage_times):
+        self.stage_times = stage_times
+        self.coord_service = LocalCoordService(stage_times)
+
+    def init_node(self, name):
+        pass
+
+    def service(self, name, service_class, handler):
+        pass  # Never called during a replay
+
+    def publisher(self, name, msg_class, **kwargs):
+        return LocalPublisher(self.stage_times if name.endswith('/predictions') else None)
+
+    def wait_for_services(self, services, persistent=(), profile=None):
+        return {name: self.coord_service if name.endswith('/In_box_coordService') else LocalPickingBoxEmpty() for name in services}
+
+    def persistent_proxy(self, name, service_class):
+        return self.coord_service
+
+    def on_shutdown(self, hook):
+        pass
+
+
+class ReplayNodeBestPrediction(NodeBestPrediction):
+    """ NodeBestPrediction with the local stand-ins of LocalRosInterface for its services and topics """
+    def __init__(self, model_file, backend='eager', convergence=None, cache=None, preprocessor=None, batch_size=1, workers=None):
+        self.stage_times = {stage: [] for stage in STAGES}
+        ros = LocalRosInterface(self.stage_times)
+        super().__init__(model_file, invalidation_radius=0, image_topic=None, convergence=convergence, cache=cache,
+                         preprocessor=preprocessor, batch_size=batch_size, backend=backend, max_models=1,
+                         metrics_period=0, workers=workers, ros=ros)  # metrics_period=0 : histograms only, not published
+
+    def replay_frame(self, recorded_frame, nb_predictions):
+        """ Process a recorded frame until nb_predictions are computed (or the frame is settled). Return the time to the best prediction """
+        rgb = recorded_frame['rgb']
+        self.coord_serv.set_frame(rgb, recorded_frame['points'])
+        self._new_frame(Image(height=rgb.shape[0], width=rgb.shape[1], encoding='rgb8', step=rgb.shape[1] * 3, data=rgb.tobytes()))
+        msg_list_pred = ListOfPredictions()
+        best_proba, time_to_best = -1, None
+        start = time.perf_counter()
+        nb_empty_batches = 0  # With a cache, the batches add nothing once all the recorded points have been scored
+        while len(self.predictions) < nb_predictions and not self.frame_settled and nb_empty_batches < MAX_EMPTY_BATCHES:
+            batch_start = time.perf_counter()
+            new_msgs = self._process_batch(msg_list_pred)
+            now = time.perf_counter()
+            self.stage_times['batch'].append(now - batch_start)
+            nb_empty_batches = 0 if new_msgs else nb_empty_batches + 1
+            for msg in new_msgs:
+                if msg.proba > best_proba:
+                    best_proba, time_to_best = msg.proba, now - start
+        return time_to_best
+
+    def _compute_probas(self, resps, frame, model, preprocessor, frame_descriptor=None):
+        start = time.perf_counter()
+        probas = super()._compute_probas(resps, frame, model, preprocessor, frame_descriptor)
+        self.stage_times['inference'].append(time.perf_counter() - start)
+        return probas
+
+
+def print_percentiles(name, values, unit='ms', factor=1000):
+    p50, p95, p99 = np.percentile(np.array(values) * factor, [50, 95, 99])
+    print(f'{name:<20} p50 = {p50:8.2f} {unit}   p95 = {p95:8.2f} {unit}   p99 = {p99:8.2f} {unit}   ({len(values)} values)')
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Replay recorded frames through the best prediction pipeline and report its performance.')
+    parser.add_argument('model_file', type=str, help='CKPT model file (or .pt / .onnx / .int8.pt file)')
+    parser.add_argument('record_folder', type=str, help='folder with the frames recorded by record_frames.py')
+    parser.add_argument('--backend', type=str, default='eager', choices=BACKENDS, help='Inference backend')
+    parser.add_argument('--predictions_per_frame', type=int, default=1000, help='Number of predictions computed for each frame')
+    parser.add_argument('--batch_size', type=int, default=1, help='Number of random points processed by each inference')
+    parser.add_argument('--tensor_preprocessing', default=False, action='store_true', help='Cut, resize and normalize the crops as one tensor batch (no PIL)')
+    parser.add_argument('--cache_size', type=int, default=0, help='Size of the prediction cache (0 : no cache)')
+    parser.add_argument('--patience', type=int, default=0, help='Early stopping patience (0 : never stop before predictions_per_frame)')
+    parser.add_argument('--workers', type=int, default=0, help='Number of inference worker processes (0 : inference in this process)')
+    args = parser.parse_args()
+
+    node = ReplayNodeBestPrediction(args.model_file, args.backend,
+                                    convergence=PredictionConvergence(args.patience) if args.patience > 0 else None,
+                                    cache=PredictionCache(args.cache_size) if args.cache_size > 0 else None,
+                                    preprocessor=CropPreprocessor() if args.tensor_preprocessing else None,
+                                    batch_size=args.batch_size,
+                                    workers=InferenceWorkerPool(args.model_file, args.backend, args.workers) if args.workers > 0 else None)
+    times_to_best = []
+    nb_predictions = 0
+    start = time.perf_counter()
+    for file in list_frames(args.record_folder):
+        time_to_best = node.replay_frame(load_frame(file), args.predictions_per_frame)
+        nb_predictions += len(node.predictions)
+        if time_to_best is None:
+            print(f'{file.name} : no prediction')
+            continue
+        times_to_best.append(time_to_best)
+        print(f'{file.name} : {len(node.predictions)} predictions, best proba = {max(p.proba for p in node.predictions):.3f}, time to best = {time_to_best:.2f} s')
+    duration = time.perf_counter() - start
+    if node.workers:
+        node.workers.close()
+    print()
+    print(f'{len(times_to_best)} frames with predictions, {nb_predictions} predictions in {duration:.1f} s : {nb_predictions / duration:.1f} predictions/s')
+    for stage in STAGES:
+        if node.stage_times[stage]:
+            print_percentiles(stage, node.stage_times[stage])
+    crop_decoding = node.metrics.histogram('crop_decoding')
+    if crop_decoding:
+        print(f'{"crop_decoding":<20} p50 = {crop_decoding.percentile(50)*1000:8.2f} ms   p95 = {crop_decoding.percentile(95)*1000:8.2f} ms   '
+              f'p99 = {crop_decoding.percentile(99)*1000:8.2f} ms   ({crop_decoding.count} values, histogram bin upper bounds)')
+    if times_to_best:
+        print_percentiles('time to best', times_to_best, 's', 1)
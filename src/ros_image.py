@@ -0,0 +1,24 @@
+import numpy as np
+
+# Number of channels and numpy type of the ROS Image encodings
+ROS_ENCODINGS = {'rgb8': (3, np.uint8), 'bgr8': (3, np.uint8), 'rgba8': (4, np.uint8), 'bgra8': (4, np.uint8),
+                 'mono8': (1, np.uint8), '8UC1': (1, np.uint8), 'mono16': (1, np.uint16), '16UC1': (1, np.uint16)}
+
+
+def ros_msg_to_numpy(msg, rgb=False):
+    """
+    Wrap the data of a ROS Image message as a (H, W, C) or (H, W) numpy array, without copy.
+    The channels are in the message order, or in RGB(A) order with rgb=True (reversed view for 'bgr8' and 'bgra8').
+    """
+    nb_channels, dtype = ROS_ENCODINGS[msg.encoding]
+    row_size = msg.width * nb_channels * np.dtype(dtype).itemsize
+    rows = np.frombuffer(msg.data, dtype=np.uint8).reshape(msg.height, msg.step)[:, :row_size]  # msg.step can be > row_size
+    array = rows.view(dtype)
+    if nb_channels == 1:
+        return array
+    array = array.reshape(msg.height, msg.width, nb_channels)
+    if rgb and msg.encoding == 'bgr8':
+        array = array[:, :, ::-1]
+    elif rgb and msg.encoding == 'bgra8':
+        array = array[:, :, [2, 1, 0, 3]]
+    return array
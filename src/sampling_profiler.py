@@ -0,0 +1,85 @@
+import os
+import sys
+import time
+import threading
+from collections import Counter
+import rospy
+from raiv_research.srv import Profile, ProfileResponse
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler : a background thread periodically samples the Python stack of every thread of the process.
+    The result is written in the 'collapsed stacks' format (one 'thread;func1;func2;... count' line per stack),
+    which can be read by flamegraph.pl or speedscope.
+    Nothing runs when the profiler is not active, so it has no overhead on the node.
+    """
+    def __init__(self, interval=0.005):
+        self.interval = interval  # Time between two samples (in s)
+        self.stacks = Counter()
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._ignored_threads = set()  # The thread which waits for the end of the profiling
+
+    def start(self):
+        self.stacks.clear()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+
+    def profile(self, duration):
+        """ Sample the stacks during 'duration' seconds """
+        self._ignored_threads = {threading.get_ident()}
+        self.start()
+        time.sleep(duration)
+        self.stop()
+        self._ignored_threads = set()
+
+    def write(self, output_file):
+        with open(output_file, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+    def _sample(self):
+        thread_names = {}
+        ignored_threads = self._ignored_threads | {threading.get_ident()}
+        while not self._stop_event.wait(self.interval):
+            for thread in threading.enumerate():
+                thread_names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id in ignored_threads:
+                    continue
+                functions = []
+                while frame:
+                    code = frame.f_code
+                    functions.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                functions.append(thread_names.get(thread_id, str(thread_id)))
+                self.stacks[';'.join(reversed(functions))] += 1
+
+
+def advertise_profile_service(interval=0.005):
+    """
+    Provide the /<node name>/profile service (Profile message) : profile the node during 'duration' seconds and write
+    the collapsed stacks in 'output_file' (default : /tmp/<node name>_<date>.folded). Must be called after rospy.init_node.
+    rosservice call /node_best_prediction/profile 10 ''
+    """
+    profiler = SamplingProfiler(interval)
+    lock = threading.Lock()  # Only one profiling at a time
+
+    def handle_profile(req):
+        if not lock.acquire(blocking=False):
+            return ProfileResponse(False, '', 'A profiling is already running')
+        try:
+            output_file = req.output_file or f"/tmp/{rospy.get_name().strip('/').replace('/', '_')}_{time.strftime('%Y%m%d_%H%M%S')}.folded"
+            profiler.profile(req.duration)
+            profiler.write(output_file)
+            return ProfileResponse(True, output_file, f'{sum(profiler.stacks.values())} samples in {req.duration} s')
+        finally:
+            lock.release()
+
+    return rospy.Service('~profile', Profile, handle_profile)
@@ -0,0 +1,142 @@
+import os
+import socket
+import numpy as np
+import rospy
+from multiprocessing import shared_memory, resource_tracker
+from sensor_msgs.msg import Image
+from raiv_research.msg import SharedFrame
+
+SHARED_FRAMES_TOPIC = 'new_images_shm'  # Relative name, like NEW_IMAGES_TOPIC
+SLOT_HEADER_SIZE = 64  # The slot starts with its frame sequence number (uint64), then the images are 64-byte aligned
+
+
+def _aligned(size):
+    return (size + 63) // 64 * 64
+
+
+def _metadata(msg):
+    """ Copy of an Image message without its data """
+    return Image(header=msg.header, height=msg.height, width=msg.width, encoding=msg.encoding,
+                 is_bigendian=msg.is_bigendian, step=msg.step)
+
+
+def _with_data(metadata, buffer, offset):
+    """ Image message whose data is a read-only view of the shared memory """
+    data = buffer[offset:offset + metadata.step * metadata.height].toreadonly()
+    return Image(header=metadata.header, height=metadata.height, width=metadata.width, encoding=metadata.encoding,
+                 is_bigendian=metadata.is_bigendian, step=metadata.step, data=data)
+
+
+class SharedFrameWriter:
+    """
+    Ring buffer of 'nb_slots' RGB + depth frames in a shared memory segment, for the nodes running on the same host.
+    write() copies the images in the next slot and returns the SharedFrame descriptor to publish instead of the images.
+    The segment is created at the first frame, and created again (with a new name) if a frame is bigger than the slots.
+    """
+    def __init__(self, nb_slots=4, name_prefix='raiv_frames'):
+        self.nb_slots = nb_slots
+        self.name_prefix = name_prefix
+        self.hostname = socket.gethostname()
+        self.shm = None
+        self.generation = 0  # Number of segments created
+        self.rgb_capacity = self.depth_capacity = self.slot_size = 0
+        self.sequence = 0  # Number of frames written
+
+    def write(self, rgb_msg, depth_msg):
+        rgb_size, depth_size = len(rgb_msg.data), len(depth_msg.data)
+        if rgb_size > self.rgb_capacity or depth_size > self.depth_capacity:
+            self._allocate(rgb_size, depth_size)
+        self.sequence += 1
+        slot = self.sequence % self.nb_slots
+        start = slot * self.slot_size
+        slot_sequence = np.ndarray(1, dtype=np.uint64, buffer=self.shm.buf, offset=start)
+        slot_sequence[0] = 0  # The slot is being written, its previous frame is no more valid
+        rgb_offset = start + SLOT_HEADER_SIZE
+        depth_offset = rgb_offset + self.rgb_capacity
+        self.shm.buf[rgb_offset:rgb_offset + rgb_size] = rgb_msg.data
+        self.shm.buf[depth_offset:depth_offset + depth_size] = depth_msg.data
+        slot_sequence[0] = self.sequence
+        return SharedFrame(hostname=self.hostname, shm_name=self.shm.name, slot=slot, sequence=self.sequence,
+                           rgb_offset=rgb_offset, depth_offset=depth_offset,
+                           rgb_image=_metadata(rgb_msg), depth_image=_metadata(depth_msg))
+
+    def close(self):
+        """ Remove the shared memory segment (the readers keep their mapping until they close it) """
+        if self.shm:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def _allocate(self, rgb_size, depth_size):
+        self.close()
+        self.rgb_capacity = _aligned(rgb_size)
+        self.depth_capacity = _aligned(depth_size)
+        self.slot_size = SLOT_HEADER_SIZE + self.rgb_capacity + self.depth_capacity
+        self.generation += 1
+        self.shm = shared_memory.SharedMemory(f'{self.name_prefix}_{os.getpid()}_{self.generation}', create=True,
+                                              size=self.nb_slots * self.slot_size)
+
+
+class SharedRgbAndDepthImages:
+    """
+    Frame of a SharedFrameWriter ring buffer, with the rgb_image and depth_image attributes of a RgbAndDepthImages message.
+    The data of the images is a view of the shared memory (no copy) : it is overwritten after 'nb_slots' new frames,
+    so a consumer keeping a frame longer must check is_valid() after using it (or copy the data).
+    """
+    def __init__(self, shm, descriptor):
+        self._shm = shm
+        self.descriptor = descriptor
+        self.rgb_image = _with_data(descriptor.rgb_image, shm.buf, descriptor.rgb_offset)
+        self.depth_image = _with_data(descriptor.depth_image, shm.buf, descriptor.depth_offset)
+
+    def is_valid(self):
+        """ False if the slot has been overwritten by another frame """
+        slot_start = self.descriptor.rgb_offset - SLOT_HEADER_SIZE
+        return int(np.ndarray(1, dtype=np.uint64, buffer=self._shm.buf, offset=slot_start)[0]) == self.descriptor.sequence
+
+
+class SharedFrameReader:
+    """ Map the frames described by SharedFrame messages """
+    def __init__(self):
+        self.hostname = socket.gethostname()
+        self._segments = {}  # Shared memory segments already opened, by name
+
+    def read(self, descriptor):
+        """ Return a SharedRgbAndDepthImages object, or None if the frame can not be mapped (writer on another host) """
+        if descriptor.hostname != self.hostname:
+            return None
+        shm = self._segments.get(descriptor.shm_name)
+        if shm is None:
+            try:
+                shm = shared_memory.SharedMemory(descriptor.shm_name)
+            except FileNotFoundError:  # Same host name but not the same /dev/shm (ex : containers)
+                return None
+            # Before Python 3.13, the resource tracker removes at exit the segments opened by the process, even when
+            # they have been created by another process
+            resource_tracker.unregister(shm._name, 'shared_memory')
+            self._segments[descriptor.shm_name] = shm
+        return SharedRgbAndDepthImages(shm, descriptor)
+
+
+class SharedFrameSubscriber:
+    """
+    Subscribe to the SharedFrame descriptors and give the frames to the callback as SharedRgbAndDepthImages objects.
+    When a frame can not be mapped (writer on another host), switch to the normal messages : fallback() is called once,
+    to subscribe to them.
+    """
+    def __init__(self, callback, fallback, queue_size=None):
+        self.callback = callback
+        self.fallback = fallback
+        self.reader = SharedFrameReader()
+        self.subscriber = rospy.Subscriber(SHARED_FRAMES_TOPIC, SharedFrame, self._receive, queue_size=queue_size)
+
+    def _receive(self, descriptor):
+        frame = self.reader.read(descriptor)
+        if frame is None:
+            if self.subscriber:
+                rospy.logwarn(f'Shared frames from host {descriptor.hostname} can not be mapped on {self.reader.hostname}, use the image messages')
+                self.subscriber.unregister()
+                self.subscriber = None
+                self.fallback()
+        elif frame.is_valid():  # Else the slot has already been reused, a newer frame is coming
+            self.callback(frame)